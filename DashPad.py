@@ -15,16 +15,16 @@ __author__ = 'Steve Hollaway'
 # You should have received a copy of the GNU General Public License
 # along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
 
-from gpsmodule import GpsModule
-from eventmanager import EventHandler
+from common import *
+from eventmanager import EventHandler, NewGpsDevice
 
 class MainApp():
 
     def __init__(self):
 
-        # Initiate our GPS device and start receiving data
-        self.GPS = GpsModule() # Setup GPS device
-        self.GPS.start() # Start a new thread and execute GPS.run()
+        # Initiate our GPS device (doesn't wait on gpsd or a fix, see gpsmodule.py)
+        self.GPS = NewGpsDevice() # Setup GPS device (the receiver, or GPS_REPLAY_FILE)
+        self.Events = EventHandler(self.GPS) # Shares our GPS device and starts receiving data from it
 
 if __name__ == '__main__':
 
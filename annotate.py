@@ -0,0 +1,318 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Annotates recorded GPS tracks for after-action reviews and fleet reports: the street each point is on, its type and
+# speed limit, and whether we were speeding there (consecutive speeding points are numbered as one segment).
+#
+# The tracks (gpsd JSON, NMEA, GPX or CSV, see gpslog.py) are shared out between worker processes, each with its own
+# read-only connection to geo.sqlite. A track is located point by point the same way as in the car (see locator.py), so
+# while the points stay on the same street nothing is looked up. Points are read and written one at a time, however
+# long the track.
+#
+# Usage: python annotate.py -d sqlite/geo.sqlite -o annotated [-j <processes>] [-m <km/h>] track.gpx shift.json.gz ...
+# Writes annotated/<track>.csv for each track
+
+import csv
+import getopt
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from common import *
+from database import DataBase
+from gpslog import ReadGpsLog, FormatTime
+from gpsfix import NextFix
+from geolib import DistanceBetween, BearingBetween
+from locator import Locator
+
+DEFAULT_WORKERS = multiprocessing.cpu_count()  # Processes, change with -j
+SPEEDING_MARGIN = 5  # km/h over a known speed limit before a point counts as speeding, change with -m
+MIN_TRACK_DISTANCE = 0.002  # km - Closer together than 2m the bearing between two points is mostly GPS error
+SPEED_BASELINE = 3.0  # Seconds - Work out speeds over at least this long, a second's worth of movement is mostly GPS error
+
+COLUMNS = ('time', 'lat', 'lon', 'speed', 'street', 'street_type', 'maxspeed', 'maxspeed_known', 'speeding', 'segment')
+
+# This process's read-only connection and intersections (see StartWorker)
+Database = None
+StreetGraph = None
+
+
+def StartWorker(DatabaseFile):
+    # Purpose: To connect a worker process to the database, once, before it annotates any tracks
+
+    global Database, StreetGraph
+
+    Database = DataBase('sqlite', ReadOnly=True)
+    Database.Connect(DatabaseFile)
+    StreetGraph = Database.LoadStreetGraph()
+
+
+def OutputFilename(Track, OutputDirectory):
+    # ie. ('logs/patrol.json.gz', 'annotated') -> 'annotated/patrol.csv'
+
+    Name = os.path.basename(Track)
+
+    if Name.endswith('.gz'):
+        Name = Name[:-3]
+
+    return os.path.join(OutputDirectory, Name.rsplit('.', 1)[0] + '.csv')
+
+
+def FillIn(Recent, Report):
+    # Purpose: GPX and CSV tracks often have no speed or bearing, work them out from the points before
+    # Usage: FillIn(Recent, Report) - Recent is a deque of the reports before it, oldest first, which this keeps to the
+    # last SPEED_BASELINE seconds
+
+    # The oldest that's still at least SPEED_BASELINE seconds back is all we need (and the one before this for the
+    # bearing, whatever the times)
+    while len(Recent) > 1 and (not 'time' in Report or Report['time'] - Recent[1].get('time', 0.0) >= SPEED_BASELINE):
+        Recent.popleft()
+
+    if len(Recent) > 0:
+
+        Oldest = Recent[0]
+        Previous = Recent[-1]
+
+        if not 'speed' in Report and 'time' in Report and 'time' in Oldest and Report['time'] > Oldest['time']:
+            Report['speed'] = 1000.0 * DistanceBetween((Oldest['lat'], Oldest['lon']), (
+                Report['lat'], Report['lon'])) / (Report['time'] - Oldest['time']) # m/s like gpsd
+
+        if not 'track' in Report and DistanceBetween((Previous['lat'], Previous['lon']), (
+                Report['lat'], Report['lon'])) >= MIN_TRACK_DISTANCE:
+            Report['track'] = BearingBetween((Previous['lat'], Previous['lon']), (Report['lat'], Report['lon']))
+
+    Recent.append(Report)
+
+
+def SpeedLimit(Street):
+    # Returns: The street's speed limit in km/h if it's known, otherwise None
+
+    return Street.MaxSpeed() if Street.SpeedIsKnown() else None
+
+
+def Text(Value):
+    # Python 2's csv module only writes bytes
+
+    if sys.version_info[0] < 3 and isinstance(Value, unicode):
+        return Value.encode('utf-8')
+
+    return Value
+
+
+def AnnotateTrack(Track, OutputFile, Margin=SPEEDING_MARGIN):
+    # Purpose: To annotate one track with this process's connection (see StartWorker). If anything goes wrong, or the
+    # track has no point with a position, the half written OutputFile is removed before the exception is passed on.
+    # Returns: {'track', 'points', 'lookups' (points the tracker couldn't skip), 'speeding' (points),
+    # 'segments' (speeding), 'seconds'}
+
+    Started = time.time()
+
+    Locate = Locator(Database, StreetGraph, LookAhead=False) # Only the street each point is on
+    Fix = None # The last GpsFix
+    Recent = deque() # The last few reports with a position (see FillIn)
+    Street = None # Where the last point was
+    Points = 0
+    SpeedingPoints = 0
+    Segments = 0
+    WasSpeeding = False
+
+    Output = open(OutputFile, 'w')
+    Writer = csv.writer(Output, lineterminator='\n')
+    Writer.writerow(COLUMNS)
+
+    try:
+
+        for Report in ReadGpsLog(Track):
+
+            if not 'lat' in Report or not 'lon' in Report:
+                continue
+
+            FillIn(Recent, Report)
+
+            Fix = NextFix(Fix, Report)
+            Location = Locate.Locate(Fix)
+
+            if not Location is None and not Location[0] is None:
+                Street = Location[0]
+
+            elif Locate.Following() is None: # Off the map (or lost), the last street isn't where we are any more
+                Street = None
+
+            # Otherwise nothing changed (or we can't tell at an intersection), we're still on the same street
+
+            Limit = None if Street is None else SpeedLimit(Street)
+            Speeding = not Limit is None and not Fix.speed is None and Fix.speed > Limit + Margin
+
+            if Speeding:
+
+                SpeedingPoints += 1
+
+                if not WasSpeeding:
+                    Segments += 1
+
+            WasSpeeding = Speeding
+            Points += 1
+
+            if Street is None:
+                Writer.writerow((FormatTime(Fix.time) if not Fix.time is None else '', Fix.lat, Fix.lon,
+                                 '' if Fix.speed is None else Fix.speed, '', '', '', '', 0, ''))
+
+            else:
+                Writer.writerow((FormatTime(Fix.time) if not Fix.time is None else '', Fix.lat, Fix.lon,
+                                 '' if Fix.speed is None else Fix.speed, Text(Street.StreetName()),
+                                 Text(Street.TypeOfStreet()), Street.MaxSpeed(), int(Street.SpeedIsKnown()),
+                                 int(Speeding), Segments if Speeding else ''))
+
+        if Points == 0: # Every point was unreadable (ie. a time column we don't understand), not an empty drive
+            raise ValueError('no readable points with a position')
+
+    except:
+
+        Output.close()
+        os.remove(OutputFile)
+        raise
+
+    Output.close()
+
+    return {'track': Track, 'points': Points, 'lookups': Locate.Statistics()['tracker_lookups'],
+            'speeding': SpeedingPoints, 'segments': Segments, 'seconds': time.time() - Started}
+
+
+def AnnotateJob(Job):
+    # AnnotateTrack for Pool.imap_unordered, which hands over one argument. A track that fails (a log we can't read,
+    # a lookup that raised) is reported with its 'error' instead of stopping the tracks still to come.
+
+    try:
+        return AnnotateTrack(*Job)
+
+    except Exception as Problem:
+        return {'track': Job[0], 'error': '%s: %s' % (type(Problem).__name__, Problem), 'points': 0, 'lookups': 0,
+                'speeding': 0, 'segments': 0, 'seconds': 0.0}
+
+
+def Annotate(DatabaseFile, Tracks, OutputDirectory, Workers=DEFAULT_WORKERS, Margin=SPEEDING_MARGIN):
+    # Purpose: To annotate every track, Workers at a time
+    # Returns: A list of what AnnotateJob returned for each track, in the order they finished
+
+    if not os.path.isdir(OutputDirectory):
+        os.makedirs(OutputDirectory)
+
+    Jobs = [(Track, OutputFilename(Track, OutputDirectory), Margin) for Track in Tracks]
+    Results = []
+
+    if Workers == 1: # No need for other processes
+
+        StartWorker(DatabaseFile)
+        Finished = (AnnotateJob(Job) for Job in Jobs)
+
+    else:
+
+        Pool = multiprocessing.Pool(Workers, StartWorker, (DatabaseFile,))
+        Finished = Pool.imap_unordered(AnnotateJob, Jobs)
+
+    for Result in Finished:
+
+        Results.append(Result)
+
+        if 'error' in Result:
+            Echo('%s: failed, %s' % (Result['track'], Result['error']))
+            continue
+
+        Echo('%s: %d points, %d looked up, %d speeding in %d segments (%.0f points/sec)' % (
+            Result['track'], Result['points'], Result['lookups'], Result['speeding'], Result['segments'],
+            Result['points'] / max(Result['seconds'], 1e-6)))
+
+    if not Workers == 1:
+        Pool.close()
+        Pool.join()
+
+    return Results
+
+
+def Usage():
+
+    Echo('Proper usage: annotate.py -d <database> -o <outputdirectory> [-j <processes>] [-m <km/h>] <track> ...'
+         '\n'
+         '<track> is a gpsd JSON, NMEA, GPX or CSV log (or any of them gzipped), <processes> is the number of worker '
+         'processes (default %d)'
+         '\n'
+         'A point is speeding <km/h> over a known speed limit (default %d)' % (DEFAULT_WORKERS, SPEEDING_MARGIN))
+
+
+def Main(argv):
+
+    DatabaseFile = None
+    OutputDirectory = None
+    Workers = DEFAULT_WORKERS
+    Margin = SPEEDING_MARGIN
+
+    try:
+
+        Options, Tracks = getopt.getopt(argv, "d:o:j:m:")
+
+    except getopt.GetoptError:
+
+        Usage()
+        sys.exit(2)
+
+    for Option, Argument in Options:
+
+        if Option == '-d':
+            DatabaseFile = Argument
+
+        elif Option == '-o':
+            OutputDirectory = Argument
+
+        elif Option in ('-j', '-m'):
+
+            if not Argument.isdigit() or (Option == '-j' and int(Argument) < 1):
+
+                Usage()
+                sys.exit(2)
+
+            if Option == '-j':
+                Workers = int(Argument)
+
+            else:
+                Margin = int(Argument)
+
+    if DatabaseFile is None or OutputDirectory is None or len(Tracks) == 0:
+
+        Usage()
+        sys.exit(2)
+
+    Started = time.time()
+    Results = Annotate(DatabaseFile, Tracks, OutputDirectory, min(Workers, len(Tracks)), Margin)
+    Seconds = time.time() - Started
+
+    Points = sum(Result['points'] for Result in Results)
+    Busy = sum(Result['seconds'] for Result in Results)
+
+    Failed = len([Result for Result in Results if 'error' in Result])
+
+    Echo('%d tracks, %d points in %.1f seconds: %.0f points/sec, %.0f points/sec per core' % (
+        len(Results) - Failed, Points, Seconds, Points / max(Seconds, 1e-6), Points / max(Busy, 1e-6)))
+
+    if Failed > 0:
+        Echo('%d tracks failed, see above' % Failed)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+
+    Main(sys.argv[1:])
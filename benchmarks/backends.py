@@ -0,0 +1,127 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Startup time, resident memory and lookup latency of each DataBase backend: sqlite, memory and mapfile.
+# Each backend runs in its own process so the memory one backend uses doesn't count against the next.
+# Usage: python benchmarks/backends.py
+
+import os
+import sys
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+
+from synthetic import StreetGrid, BuildDatabase, Quietly, ORIGIN
+import mapfile
+
+STREETS = 150  # 150 x 150 street grid
+STREET_SPACING = 0.150  # 150m blocks
+NODE_SPACING = 0.030  # A node every 30m
+
+FIXES = 2000  # Number of random locations to look up
+
+
+def ResidentMemory():
+    # Resident memory of this process in KB (Linux): (private memory, pages of mapped files the OS can drop and reread)
+
+    Memory = {}
+
+    for Line in open('/proc/self/status'):
+
+        if Line.startswith('RssAnon:') or Line.startswith('RssFile:'):
+            Memory[Line.split(':')[0]] = int(Line.split()[1])
+
+    return Memory.get('RssAnon', 0), Memory.get('RssFile', 0)
+
+
+def Measure(Backend, Filename):
+    # Runs in a process of its own, prints: startup seconds, KB private and file backed memory after startup and after
+    # the lookups, mean milliseconds per fix
+
+    from database import DataBase
+
+    Random = random.Random(FIXES)
+    Fixes = [(ORIGIN[0] + Random.uniform(0.0, 0.2), ORIGIN[1] + Random.uniform(0.0, 0.28)) for Fix in range(FIXES)]
+
+    Before = ResidentMemory()
+
+    Start = time.time()
+    Database = DataBase(Backend, CacheSize=0) # Measure the backend, not the lookup caches
+    Quietly(Database.Connect, Filename)
+    Startup = time.time() - Start
+
+    AfterStartup = ResidentMemory()
+
+    Start = time.time()
+
+    for Fix in Fixes:
+
+        osmid = Database.FindClosestNode(Fix)
+
+        if not osmid is None:
+            Quietly(Database.FetchStreets, osmid)
+            Quietly(Database.IsIntersection, osmid)
+
+    Lookups = 1000.0 * (time.time() - Start) / FIXES
+
+    AfterLookups = ResidentMemory()
+
+    print('%f %d %d %d %d %f' % (Startup, AfterStartup[0] - Before[0], AfterStartup[1] - Before[1],
+                                 AfterLookups[0] - Before[0], AfterLookups[1] - Before[1], Lookups))
+
+    Database.Close()
+
+
+def Main():
+
+    Directory = tempfile.mkdtemp()
+    Filename = os.path.join(Directory, 'city.sqlite')
+    MapFilename = os.path.join(Directory, 'city.map')
+
+    Nodes, Ways = StreetGrid(STREETS, STREET_SPACING, NODE_SPACING)
+    BuildDatabase(Filename, Nodes, Ways)
+
+    Database = sqlite3.connect(Filename)
+    mapfile.Write(Database.cursor(), MapFilename)
+    Database.close()
+
+    print('%d x %d street grid, %d street nodes, %d fixes' % (STREETS, STREETS, len(Nodes) * 2 // 3, FIXES))
+    print('  geo.sqlite %d KB   geo.map %d KB' % (os.path.getsize(Filename) // 1024, os.path.getsize(MapFilename) // 1024))
+
+    for Backend, File in (('sqlite', Filename), ('memory', Filename), ('mapfile', MapFilename)):
+
+        Output = subprocess.check_output([sys.executable, os.path.abspath(__file__), Backend, File])
+        Results = Output.split()[-6:]
+
+        print('  %-8s startup %7.1f ms  %7.3f ms per fix   private/file backed KB: after startup %6d/%-6d '
+              'after lookups %6d/%-6d' % (Backend, 1000.0 * float(Results[0]), float(Results[5]), int(Results[1]),
+                                          int(Results[2]), int(Results[3]), int(Results[4])))
+
+    os.remove(Filename)
+    os.remove(MapFilename)
+    os.rmdir(Directory)
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) == 3:
+        Measure(sys.argv[1], sys.argv[2])
+
+    else:
+        Main()
@@ -0,0 +1,171 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Latency comparison of the original expanding box search (20m box growing 5m at a time against the old 1-D R-Tree)
+# and DataBase.FindClosestNode with the sqlite backend (a few geometrically growing boxes against the 2-D R-Tree) and
+# with the memory backend (in-memory grid, see spatialindex.py).
+# Usage: python benchmarks/closestnode.py
+
+import os
+import sys
+import random
+import sqlite3
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import DataBase
+from geolib import CreateBox, DistanceBetween
+
+CENTER = (43.894655, -78.802791)  # Oshawa, ON
+
+# Name, number of nodes, size of the (square) area they are spread over in km
+EXTRACTS = (('sparse', 2000, 40.0), ('dense', 200000, 10.0))
+
+FIXES = 500  # Number of random locations to look up on each extract
+
+
+def RandomCoordinates(Random, SizeOfArea):
+
+    SWCorner, NECorner = CreateBox(SizeOfArea / 2.0, CENTER)
+
+    return Random.uniform(SWCorner[0], NECorner[0]), Random.uniform(SWCorner[1], NECorner[1])
+
+
+def CreateExtracts(Nodes, SizeOfArea, Directory):
+
+    Random = random.Random(Nodes)
+    Coordinates = [RandomCoordinates(Random, SizeOfArea) for osmid in range(Nodes)]
+
+    # Original schema: rtree(osmid, lon, lat) is a single min/max pair, lon is the min and lat is the max
+    LegacyFile = os.path.join(Directory, 'legacy-%d.sqlite' % Nodes)
+    Legacy = sqlite3.connect(LegacyFile)
+    Legacy.execute('''CREATE VIRTUAL TABLE nodes USING rtree(osmid INT PRIMARY KEY, lon REAL, lat REAL)''')
+    Legacy.executemany('''INSERT INTO nodes(osmid, lon, lat) VALUES(?,?,?)''',
+                       ((osmid + 1, Lon, Lat) for osmid, (Lat, Lon) in enumerate(Coordinates)))
+    Legacy.commit()
+    Legacy.close()
+
+    CurrentFile = os.path.join(Directory, 'current-%d.sqlite' % Nodes)
+    Current = sqlite3.connect(CurrentFile)
+    Current.execute('''CREATE VIRTUAL TABLE nodes USING rtree(osmid, min_lon, max_lon, min_lat, max_lat)''')
+    Current.executemany('''INSERT INTO nodes(osmid, min_lon, max_lon, min_lat, max_lat) VALUES(?,?,?,?,?)''',
+                        ((osmid + 1, Lon, Lon, Lat, Lat) for osmid, (Lat, Lon) in enumerate(Coordinates)))
+    Current.commit()
+    Current.close()
+
+    return LegacyFile, CurrentFile
+
+
+def LegacyFindClosestNode(Cursor, Coordinates):
+    # The original DataBase.FindClosestNode loop, counting the queries it runs
+
+    Distance = 0.020
+    Queries = 0
+
+    while Distance <= 1.00:
+
+        SWCorner, NECorner = CreateBox(Distance, Coordinates)
+
+        Cursor.execute('''SELECT osmid, lat, lon FROM nodes WHERE lon>=? AND lon <=? AND lat>=? AND lat <=?;''',
+                       (float(SWCorner[1]), float(NECorner[1]), float(SWCorner[0]), float(NECorner[0])))
+        Queries += 1
+
+        Nodes = Cursor.fetchall()
+
+        ShortestDistance = None
+        NodeOSMID = 0
+
+        for Node in Nodes:
+
+            NodeDistance = DistanceBetween((Node[1], Node[2]), Coordinates)
+
+            if ShortestDistance is None or NodeDistance < ShortestDistance:
+                ShortestDistance = NodeDistance
+                NodeOSMID = Node[0]
+
+        if not NodeOSMID == 0:
+            return NodeOSMID, Queries
+
+        Distance += 0.005
+
+    return None, Queries
+
+
+def Percentile(Values, Percent):
+
+    Values = sorted(Values)
+    return Values[min(len(Values) - 1, int(len(Values) * Percent / 100.0))]
+
+
+def Report(Name, Timings):
+
+    print('  %-8s mean %7.3f ms   p50 %7.3f ms   p95 %7.3f ms' % (
+        Name, 1000.0 * sum(Timings) / len(Timings), 1000.0 * Percentile(Timings, 50), 1000.0 * Percentile(Timings, 95)))
+
+
+def Main():
+
+    Directory = tempfile.mkdtemp()
+
+    for Name, Nodes, SizeOfArea in EXTRACTS:
+
+        LegacyFile, CurrentFile = CreateExtracts(Nodes, SizeOfArea, Directory)
+
+        Random = random.Random(FIXES)
+        Fixes = [RandomCoordinates(Random, SizeOfArea) for Fix in range(FIXES)]
+
+        LegacyCursor = sqlite3.connect(LegacyFile).cursor()
+        LegacyTimings = []
+        LegacyQueries = 0
+
+        for Fix in Fixes:
+            Start = time.time()
+            osmid, Queries = LegacyFindClosestNode(LegacyCursor, Fix)
+            LegacyTimings.append(time.time() - Start)
+            LegacyQueries += Queries
+
+        print('%s: %d nodes over %.0f km x %.0f km, %d fixes' % (Name, Nodes, SizeOfArea, SizeOfArea, FIXES))
+        Report('legacy', LegacyTimings)
+
+        for Backend in ('sqlite', 'memory'):
+
+            Current = DataBase(Backend)
+            Current.Connect(CurrentFile)
+            CurrentTimings = []
+
+            for Fix in Fixes:
+                Start = time.time()
+                Current.FindClosestNodeWithDistance(Fix)
+                CurrentTimings.append(time.time() - Start)
+
+            Current.Close()
+
+            Report(Backend, CurrentTimings)
+
+        print('  legacy loop ran %.1f queries per fix' % (float(LegacyQueries) / FIXES))
+
+        os.remove(LegacyFile)
+        os.remove(CurrentFile)
+
+    os.rmdir(Directory)
+
+
+if __name__ == '__main__':
+
+    Main()
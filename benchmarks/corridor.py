@@ -0,0 +1,188 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Database lookups per km driven with and without the StreetTracker: drive a random route through a street grid, one
+# GPS fix a second, and locate ourselves the way EventHandler.__Locate does.
+# Usage: python benchmarks/corridor.py
+
+import os
+import random
+import tempfile
+import time
+
+from synthetic import StreetGrid, BuildDatabase, Quietly, ORIGIN
+from database import DataBase
+from geolib import PointAt, DistanceBetween, BearingBetween
+from tracker import StreetTracker, TRACKER_STOP_DISTANCE
+
+STREETS = 12  # 12 x 12 street grid
+STREET_SPACING = 0.400  # 400m blocks
+NODE_SPACING = 0.025  # A node every 25m
+
+ROUTE_BLOCKS = 60  # Blocks to drive
+SPEED = 50.0  # km/h
+FIX_INTERVAL = 1.0  # Seconds between fixes
+GPS_ERROR = 0.005  # Up to 5m off in any direction
+
+
+def Intersection(Row, Column):
+
+    return PointAt(PointAt(ORIGIN, 0.0, Row * STREET_SPACING), 90.0, Column * STREET_SPACING)
+
+
+def RandomRoute(Random, Blocks=ROUTE_BLOCKS):
+    # Returns: [(Lattitude, Longitude), bearing, street name, distance to the closest intersection in km), ...] one a
+    # fix, turning at random at the intersections
+
+    Row, Column = STREETS // 2, STREETS // 2
+    Heading = (0, 1)
+    Fixes = []
+
+    for Block in range(Blocks):
+
+        Turns = [Turn for Turn in (Heading, (Heading[1], Heading[0]), (-Heading[1], -Heading[0]))
+                 if 0 <= Row + Turn[0] < STREETS and 0 <= Column + Turn[1] < STREETS]
+        Heading = Random.choice(Turns or [(-Heading[0], -Heading[1])])
+
+        Start = Intersection(Row, Column)
+        Row, Column = Row + Heading[0], Column + Heading[1]
+        End = Intersection(Row, Column)
+
+        Name = 'East Street ' + str(Row) if Heading[0] == 0 else 'North Street ' + str(Column)
+        Bearing = BearingBetween(Start, End)
+        Step = SPEED * FIX_INTERVAL / 3600.0
+
+        Travelled = Random.uniform(0.0, Step)
+
+        while Travelled < STREET_SPACING:
+
+            Point = PointAt(Start, Bearing, Travelled)
+            Point = PointAt(Point, Random.uniform(0.0, 360.0), Random.uniform(0.0, GPS_ERROR))
+            Fixes.append((Point, Bearing + Random.uniform(-5.0, 5.0), Name, min(Travelled, STREET_SPACING - Travelled)))
+
+            Travelled += Step
+
+    return Fixes
+
+
+class Locator():
+
+    # EventHandler.__Locate, counting what it asks the database
+
+    def __init__(self, Database, Graph, Tracker):
+
+        self.Database = Database
+        self.Graph = Graph
+        self.Tracker = Tracker
+        self.Queries = 0
+        self.LastKnownNodeID = None
+        self.LastKnownWayID = None
+        self.Street = None
+
+    def Locate(self, Coordinates, Bearing):
+
+        if not self.Tracker is None and self.Tracker.Check(Coordinates, Bearing):
+            return
+
+        osmid = self.Database.FindClosestNode(Coordinates)
+        self.Queries += 1
+
+        if osmid == self.LastKnownNodeID:
+            return
+
+        self.Queries += 1
+
+        if not self.Database.IsIntersection(osmid):
+
+            self.LastKnownNodeID = osmid
+            Streets = Quietly(self.Database.FetchStreets, osmid)
+            self.Queries += 1
+
+            if Streets is None:
+                return
+
+            self.LastKnownWayID = Streets[0].WayID()
+            self.Street = Streets[0].StreetName()
+
+            if not self.Tracker is None and not self.Tracker.WayID() == self.LastKnownWayID:
+                self.Tracker.Follow(self.LastKnownWayID, self.Database.FetchWayGeometry(self.LastKnownWayID))
+                self.Queries += 1
+
+        else:
+
+            Street, CrossStreets = self.Graph.Resolve(osmid, self.LastKnownWayID, self.LastKnownNodeID)
+
+            if not Street is None:
+
+                self.Street = Street.StreetName()
+
+                if not self.Tracker is None and not self.Tracker.WayID() == Street.WayID():
+                    self.Tracker.Follow(Street.WayID(), self.Database.FetchWayGeometry(Street.WayID()))
+                    self.Queries += 1
+
+
+def Main():
+
+    Directory = tempfile.mkdtemp()
+    Filename = os.path.join(Directory, 'grid.sqlite')
+
+    Nodes, Ways = StreetGrid(STREETS, STREET_SPACING, NODE_SPACING)
+    BuildDatabase(Filename, Nodes, Ways)
+
+    Fixes = RandomRoute(random.Random(ROUTE_BLOCKS))
+    Driven = sum(DistanceBetween(Fixes[Fix][0], Fixes[Fix + 1][0]) for Fix in range(len(Fixes) - 1))
+
+    print('%d x %d streets, %.0fm blocks with a node every %.0fm, %.1f km route, %d fixes at %.0f km/h' % (
+        STREETS, STREETS, 1000 * STREET_SPACING, 1000 * NODE_SPACING, Driven, len(Fixes), SPEED))
+
+    for Label, Tracker in (('closest node', None), ('tracker', StreetTracker())):
+
+        Database = DataBase('sqlite', CacheSize=0)
+        Quietly(Database.Connect, Filename)
+        Graph = Quietly(Database.LoadStreetGraph)
+
+        Locate = Locator(Database, Graph, Tracker)
+        Right = 0
+        Counted = 0
+
+        Start = time.time()
+
+        for Coordinates, Bearing, Name, ToIntersection in Fixes:
+
+            Locate.Locate(Coordinates, Bearing)
+
+            if ToIntersection > TRACKER_STOP_DISTANCE: # At an intersection either street is a fair answer
+                Counted += 1
+                Right += Locate.Street == Name
+
+        Elapsed = time.time() - Start
+
+        Lookups = len(Fixes) if Tracker is None else Tracker.Statistics()['lookups']
+
+        print('  %-12s %5d lookups %6.1f per km   %5d queries %6.1f per km   %6.3f ms per fix   right street %5.1f%%' % (
+            Label, Lookups, Lookups / Driven, Locate.Queries, Locate.Queries / Driven, 1000.0 * Elapsed / len(Fixes),
+            100.0 * Right / Counted))
+
+        Database.Close()
+
+    os.remove(Filename)
+    os.rmdir(Directory)
+
+
+if __name__ == '__main__':
+
+    Main()
@@ -0,0 +1,160 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# One fix at a time (see gpsfix.py): a GPS thread handling reports as fast as it can while another thread reads our
+# position, the way it used to be (latitude and longitude set one after the other) and with a GpsFix. Counts how often
+# the reader got a latitude from one report and a longitude from another, and what handling a report costs.
+# Usage: python benchmarks/fixrecord.py
+
+import sys
+import threading
+import timeit
+
+from synthetic import ORIGIN
+from gpsfix import NextFix, MPS_TO_KPH
+
+REPORTS = 300000
+STEP = 1e-6  # Degrees we move each report, the same North and East so a good fix has lat - lon the same as ORIGIN's
+
+
+class Attributes():
+
+    # How GpsModule kept a fix: an attribute for each value, set one after the other
+
+    def __init__(self):
+
+        self.Latitude = ORIGIN[0]
+        self.Longitude = ORIGIN[1]
+        self.Speed = 0
+        self.Bearing = 0.0
+
+    def Handle(self, Report):
+
+        Signals = 0
+
+        if 'track' in Report:
+            self.Bearing = Report['track']
+            Signals += 1
+
+        if 'speed' in Report:
+
+            self.Speed = int(round(Report['speed'] * MPS_TO_KPH))
+
+            if self.Speed <= 2: self.Speed = 0
+
+            Signals += 1
+
+        if 'lat' in Report:
+            self.Latitude = Report['lat']
+            Signals += 1
+
+        if 'lon' in Report:
+            self.Longitude = Report['lon']
+            Signals += 1
+
+        return Signals
+
+    def Position(self):
+
+        return self.Latitude, self.Longitude
+
+
+class Record():
+
+    # How GpsModule keeps it now
+
+    def __init__(self):
+
+        self.Fix = NextFix(None, {'lat': ORIGIN[0], 'lon': ORIGIN[1]})
+
+    def Handle(self, Report):
+
+        Fix = NextFix(self.Fix, Report)
+
+        if not Fix is None:
+            self.Fix = Fix
+            return 1
+
+        return 0
+
+    def Position(self):
+
+        Fix = self.Fix
+
+        return Fix.lat, Fix.lon
+
+
+def MakeReports():
+
+    return [{'class': 'TPV', 'time': 1415898000.0 + Report, 'mode': 3, 'lat': ORIGIN[0] + Report * STEP,
+             'lon': ORIGIN[1] + Report * STEP, 'speed': 13.9, 'track': 45.0, 'epx': 4.5, 'epy': 5.1, 'eps': 0.6}
+            for Report in range(REPORTS)]
+
+
+def Race(Device, Reports):
+    # Returns: (Positions read while the reports were handled, how many of them were torn)
+
+    Offset = ORIGIN[0] - ORIGIN[1]
+    Done = threading.Event()
+    Counts = [0, 0]
+
+    def Reader():
+
+        while not Done.is_set():
+
+            Latitude, Longitude = Device.Position()
+            Counts[0] += 1
+
+            if abs((Latitude - Longitude) - Offset) > STEP / 2:
+                Counts[1] += 1
+
+    Thread = threading.Thread(target=Reader)
+    Thread.start()
+
+    for Report in Reports:
+        Device.Handle(Report)
+
+    Done.set()
+    Thread.join()
+
+    return Counts
+
+
+def Main():
+
+    Reports = MakeReports()
+
+    print('%d reports, Python %d.%d' % (REPORTS, sys.version_info[0], sys.version_info[1]))
+
+    for Name, Device in (('attributes', Attributes), ('GpsFix', Record)):
+
+        Handled = Device()
+        Signals = sum(Handled.Handle(Report) for Report in Reports[:1000]) / 1000.0
+        Seconds = min(timeit.repeat(lambda: [Handled.Handle(Report) for Report in Reports], number=1, repeat=3))
+
+        Reads, Torn = Race(Device(), Reports)
+
+        print('  %-10s  %.2f us per report  %.0f signals per report  %d of %d positions read were torn' % (
+            Name, 1e6 * Seconds / REPORTS, Signals, Torn, Reads))
+
+    print('  a GpsFix is %d bytes with its values' % (sys.getsizeof(NextFix(None, Reports[0])) + sum(
+        sys.getsizeof(Value) for Value in NextFix(None, Reports[0]))))
+
+
+if __name__ == '__main__':
+
+    Main()
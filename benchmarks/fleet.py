@@ -0,0 +1,277 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Load generator for the fleet service (see fleetservice.py): VEHICLES cars, each on a connection of its own, driving
+# random routes through a street grid with a different speed limit every few blocks (see speedlimits.py) and sending
+# a gpsd TPV report a second, spread evenly over the second. Then the largest fleet again, GATEWAY cars to a connection
+# (a "vehicle" key in each report). A watcher connected like dispatch measures how long after a report was sent its
+# street change arrived. The service runs in a process of its own, started fresh for each run, on the same machine as
+# the load.
+# Usage: python3 benchmarks/fleet.py [vehicles ...]
+
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic import BuildDatabase, Quietly, BENCHMARK_DIRECTORY
+from corridor import RandomRoute, SPEED
+from speedlimits import ChunkedGrid, Percentile
+from gpslog import FormatTime, ParseTime
+
+VEHICLES = (1000, 2000, 4000, 8000)
+ROUTES = 50  # Different routes, the cars start spread out along them
+ROUTE_BLOCKS = 60
+GATEWAY = 100  # Cars a connection through a gateway
+SLOTS = 50  # Send to a fiftieth of the fleet every 20ms, so the reports arrive evenly rather than all at once
+WARMUP = 5.0  # Seconds of driving before we start measuring
+DURATION = 20.0  # Seconds measured
+PORT = 17339
+WATCH_PORT = 17340
+
+# The vehicle key (if any) and the time are filled in as it's sent
+REPORT = '{"class":"TPV",%%s"device":"/dev/ttyUSB0","mode":3,"time":"%%s","lat":%.7f,"lon":%.7f,"speed":%.3f,' \
+         '"track":%.1f}\n'
+
+
+class Car(asyncio.Protocol):
+
+    # One car's connection, it only sends
+
+    def connection_made(self, Transport):
+
+        self.Transport = Transport
+
+    def connection_lost(self, Problem):
+
+        self.Transport = None
+
+
+class Dispatch(asyncio.Protocol):
+
+    # Watches the fleet: how late each location arrives, and the service's statistics when asked
+
+    def __init__(self):
+
+        self.Partial = b''
+        self.Latencies = None # Seconds between sending a report and hearing where it was, while measuring
+        self.Statistics = None # The last ?STATS answer
+
+    def connection_made(self, Transport):
+
+        self.Transport = Transport
+
+    def data_received(self, Data):
+
+        Now = time.time()
+        Lines = (self.Partial + Data).split(b'\n')
+        self.Partial = Lines.pop()
+
+        for Line in Lines:
+
+            if Line.startswith(b'{"bad_lines"'): # The statistics, sorted
+                self.Statistics = json.loads(Line.decode('utf-8'))
+
+            elif not self.Latencies is None:
+                self.Latencies.append(Now - ParseTime(json.loads(Line.decode('utf-8'))['time']))
+
+
+def Routes():
+    # Returns: [[report with %s for the vehicle key and the time, ...] for each route]
+
+    Reports = []
+
+    for Route in range(ROUTES):
+
+        Fixes = RandomRoute(random.Random(Route), ROUTE_BLOCKS)
+        Reports.append([REPORT % (Coordinates[0], Coordinates[1], SPEED / 3.6, Bearing % 360.0)
+                        for Coordinates, Bearing, Name, ToIntersection in Fixes])
+
+    return Reports
+
+
+def CpuSeconds(Pid):
+    # Returns: User + system seconds the process has used
+
+    Fields = open('/proc/%d/stat' % Pid).read().rpartition(')')[2].split()
+
+    return (int(Fields[11]) + int(Fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+
+
+def WaitForPort(Port, Timeout=30.0):
+
+    GiveUp = time.time() + Timeout
+
+    while time.time() < GiveUp:
+
+        try:
+            socket.create_connection(('127.0.0.1', Port)).close()
+            return True
+
+        except socket.error:
+            time.sleep(0.1)
+
+    return False
+
+
+def Drive(Loop, Vehicles, RouteReports, Service, PerConnection=1):
+    # Purpose: To connect Vehicles cars (PerConnection of them to each connection) and the watcher to the service,
+    # drive for WARMUP + DURATION seconds and measure
+    # Returns: {'sent', 'stats' (service statistics before and after measuring), 'latencies', 'service_cpu', 'load_cpu'}
+    # (seconds of CPU used while measuring)
+
+    Cars = []
+
+    for Vehicle in range(Vehicles):
+
+        if PerConnection == 1: # The car says who it is once
+
+            Transport, Protocol = Loop.run_until_complete(Loop.create_connection(Car, '127.0.0.1', PORT))
+            Transport.write(('{"class":"VEHICLE","id":"car-%d"}\n' % Vehicle).encode('utf-8'))
+            Key = ''
+
+        else: # The gateway says in every report
+
+            if Vehicle % PerConnection == 0:
+                Protocol = Loop.run_until_complete(Loop.create_connection(Car, '127.0.0.1', PORT))[1]
+
+            Key = '"vehicle":"car-%d",' % Vehicle
+
+        Cars.append((Protocol, Key, RouteReports[Vehicle % ROUTES], (Vehicle // ROUTES) * 37))
+
+    Watcher = Loop.run_until_complete(Loop.create_connection(Dispatch, '127.0.0.1', WATCH_PORT))[1]
+
+    Slots = [Cars[Slot::SLOTS] for Slot in range(SLOTS)]
+    Started = Loop.time()
+    Finish = Started + WARMUP + DURATION
+    Measured = {'sent': 0, 'stats': [], 'latencies': None, 'service_cpu': 0.0, 'load_cpu': 0.0}
+
+    def Send(Slot, Second):
+
+        # Each car in the slot sends its next report (round the route again once it's driven it)
+        Time = FormatTime(time.time())
+
+        for Protocol, Key, Reports, Offset in Slots[Slot]:
+
+            if not Protocol.Transport is None:
+                Protocol.Transport.write((Reports[(Offset + Second) % len(Reports)] % (Key, Time)).encode('utf-8'))
+
+        if not Watcher.Latencies is None:
+            Measured['sent'] += len(Slots[Slot])
+
+        Next = Started + Second + (Slot + 1) / float(SLOTS)
+
+        if Next < Finish:
+            Loop.call_at(Next, Send, (Slot + 1) % SLOTS, Second + (Slot + 1) // SLOTS)
+
+    def Stats():
+
+        Watcher.Statistics = None
+        Watcher.Transport.write(b'?STATS\n')
+
+        while Watcher.Statistics is None:
+            Loop.run_until_complete(asyncio.sleep(0.01))
+
+        return Watcher.Statistics
+
+    Loop.call_at(Started, Send, 0, 0)
+    Loop.run_until_complete(asyncio.sleep(WARMUP))
+
+    Measured['stats'].append(Stats())
+    Watcher.Latencies = []
+    ServiceCpu = CpuSeconds(Service)
+    Cpu = resource.getrusage(resource.RUSAGE_SELF)
+
+    Loop.run_until_complete(asyncio.sleep(Finish - Loop.time()))
+
+    Measured['latencies'] = sorted(Watcher.Latencies)
+    Watcher.Latencies = None
+    Measured['stats'].append(Stats())
+    Measured['service_cpu'] = CpuSeconds(Service) - ServiceCpu
+    Measured['load_cpu'] = sum(resource.getrusage(resource.RUSAGE_SELF)[:2]) - sum(Cpu[:2])
+
+    for Protocol, Key, Reports, Offset in Cars:
+
+        if not Protocol.Transport is None:
+            Protocol.Transport.close()
+
+    Watcher.Transport.close()
+    Loop.run_until_complete(asyncio.sleep(0.1))
+
+    return Measured
+
+
+def Main(Fleets):
+
+    Directory = tempfile.mkdtemp()
+    Filename = os.path.join(Directory, 'grid.sqlite')
+
+    Nodes, Ways = ChunkedGrid()
+    Quietly(BuildDatabase, Filename, Nodes, Ways)
+
+    RouteReports = Routes()
+    Loop = asyncio.new_event_loop()
+
+    print('%d nodes, %d ways, %d routes, 1 report a second from each car, %d seconds measured, %d cores' % (
+        len(Nodes), len(Ways), ROUTES, DURATION, os.cpu_count()))
+
+    for Vehicles, PerConnection in [(Vehicles, 1) for Vehicles in Fleets] + [(max(Fleets), GATEWAY)]:
+
+        Service = subprocess.Popen([sys.executable, os.path.join(BENCHMARK_DIRECTORY, '..', 'fleetservice.py'), '-d',
+                                    Filename, '-p', str(PORT), '-w', str(WATCH_PORT)], stdout=subprocess.DEVNULL)
+
+        try:
+
+            if not WaitForPort(WATCH_PORT):
+                print('  the service didn\'t start')
+                break
+
+            Measured = Drive(Loop, Vehicles, RouteReports, Service.pid, PerConnection)
+
+        finally:
+
+            Service.terminate()
+            Service.wait()
+
+        Before, After = Measured['stats']
+        Latencies = Measured['latencies']
+        Located = After['located'] - Before['located']
+        Reports = After['reports'] - Before['reports']
+
+        print('  %5d cars %3d a connection  %6.0f reports/sec sent %6.0f read %6.0f located  %5.0f looked up/sec  '
+              'service %3.0f%% of a core (%3.0f us a report)  load %3.0f%%  street changes %5d, arrived after %5.1f ms '
+              'median %6.1f ms p99 %6.1f ms max' % (
+                  Vehicles, PerConnection, Measured['sent'] / DURATION, Reports / DURATION, Located / DURATION,
+                  (After['lookups'] - Before['lookups']) / DURATION, 100.0 * Measured['service_cpu'] / DURATION,
+                  1e6 * (After['busy'] - Before['busy']) / max(Reports, 1), 100.0 * Measured['load_cpu'] / DURATION,
+                  len(Latencies), 1000 * Percentile(Latencies, 50), 1000 * Percentile(Latencies, 99),
+                  1000 * (Latencies[-1] if Latencies else 0.0)))
+
+    Loop.close()
+    shutil.rmtree(Directory)
+
+
+if __name__ == '__main__':
+
+    Main([int(Vehicles) for Vehicles in sys.argv[1:]] or VEHICLES)
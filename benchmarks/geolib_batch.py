@@ -0,0 +1,64 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Micro-benchmark of the batch geolib functions against calling the single pair functions in a loop.
+# Usage: python benchmarks/geolib_batch.py
+
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from geolib import *
+
+CENTER = (43.894655, -78.802791)  # Oshawa, ON
+
+CANDIDATES = 5000  # Number of locations scored per call
+REPEAT = 20
+
+
+def Main():
+
+    Random = random.Random(CANDIDATES)
+    Points = [(CENTER[0] + Random.uniform(-0.01, 0.01), CENTER[1] + Random.uniform(-0.01, 0.01)) for Point in range(CANDIDATES)]
+    Origins = [CENTER] * CANDIDATES
+
+    Tests = (
+        ('DistanceBetween loop', lambda: [DistanceBetween(CENTER, Point) for Point in Points]),
+        ('DistancesFrom', lambda: DistancesFrom(CENTER, Points)),
+        ('FastDistancesFrom', lambda: FastDistancesFrom(CENTER, Points)),
+        ('DistancesBetween', lambda: DistancesBetween(Origins, Points)),
+        ('BearingBetween loop', lambda: [BearingBetween(CENTER, Point) for Point in Points]),
+        ('BearingsFrom', lambda: BearingsFrom(CENTER, Points)),
+        ('BearingsBetween', lambda: BearingsBetween(Origins, Points)),
+        ('IsInSight loop', lambda: [IsInSight(90.0, CENTER, Point) for Point in Points]),
+        ('AreInSight', lambda: AreInSight(90.0, CENTER, Points)),
+    )
+
+    print('%d candidates per call, best of %d' % (CANDIDATES, REPEAT))
+
+    for Name, Test in Tests:
+
+        Best = min(timeit.repeat(Test, number=1, repeat=REPEAT))
+        print('  %-22s %8.3f ms  %6.3f us per candidate' % (Name, 1000.0 * Best, 1000000.0 * Best / CANDIDATES))
+
+
+if __name__ == '__main__':
+
+    Main()
@@ -0,0 +1,82 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# What importing costs: the lookup core alone (no Qt, no gpsd), the GPS devices and the full app, each in a fresh
+# interpreter so nothing is already loaded. How long the imports take, how many modules they bring in and whether Qt or
+# the networking modules came along.
+# Usage: python benchmarks/imports.py
+
+import os
+import subprocess
+import sys
+
+from synthetic import BENCHMARK_DIRECTORY
+
+RUNS = 15
+
+LAYERS = (('geolib', 'geolib'),
+          ('core', 'geolib, database, tracker, predictor, locator, locationworker'),
+          ('gps devices', 'gpsmodule, gpsreplay'),
+          ('full app', 'DashPad'))
+
+WATCHED = ('PyQt4', 'gps', 'socket', 'json', 'mapfile')  # Modules worth knowing whether a layer pulls in
+
+CHILD = '''
+import sys, time
+Modules = set(sys.modules)
+Started = time.time()
+try:
+    import %s
+    Error = None
+except ImportError as Problem:
+    Error = str(Problem)
+Seconds = time.time() - Started
+sys.stdout.write(repr((Seconds, len(set(sys.modules) - Modules), [Name for Name in %r if Name in sys.modules], Error)))
+'''
+
+
+def Measure(Modules):
+    # Returns: (Seconds importing for each run sorted, modules loaded, which of WATCHED were loaded, ImportError or None)
+
+    Runs = []
+
+    for Run in range(RUNS):
+
+        Child = subprocess.Popen([sys.executable, '-c', CHILD % (Modules, WATCHED)], stdout=subprocess.PIPE,
+                                 cwd=os.path.join(BENCHMARK_DIRECTORY, '..'))
+        Seconds, Loaded, Watched, Error = eval(Child.communicate()[0])
+        Runs.append(Seconds)
+
+    return sorted(Runs), Loaded, Watched, Error
+
+
+def Main():
+
+    print('Python %d.%d, %d fresh interpreters each' % (sys.version_info[0], sys.version_info[1], RUNS))
+
+    for Layer, Modules in LAYERS:
+
+        Runs, Loaded, Watched, Error = Measure(Modules)
+
+        print('  %-12s %6.1f ms median %6.1f ms min  %3d modules  %s%s' % (
+            Layer, 1000 * Runs[len(Runs) // 2], 1000 * Runs[0], Loaded, ', '.join(Watched) or 'none of ' +
+            '/'.join(WATCHED), '' if Error is None else '  (stopped at: ' + Error + ')'))
+
+
+if __name__ == '__main__':
+
+    Main()
@@ -0,0 +1,123 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# How far behind the GPS is the location we show? Fixes arrive faster than some of them can be looked up; the
+# LocationWorker's one slot mailbox against a plain first in first out queue of fixes.
+# Usage: python benchmarks/latestfix.py
+
+import threading
+import time
+
+try:
+    import Queue as queue # Python 2
+except ImportError:
+    import queue
+
+import synthetic  # Puts the app on our path
+from locationworker import LocationWorker
+
+FIXES = 200
+FIX_INTERVAL = 0.010  # Fixes every 10ms (a 10Hz receiver, sped up 10 times)
+LOOKUP = 0.004  # Most lookups are quick...
+SLOW_LOOKUP = 0.060  # ...but one in ten (an intersection, a cold page) isn't
+SLOW_EVERY = 10
+
+
+def Lookup(Fix):
+
+    Number, Sent = Fix
+
+    time.sleep(SLOW_LOOKUP if Number % SLOW_EVERY == 0 else LOOKUP)
+
+    return Fix
+
+
+def Staleness(Shown):
+    # Mean and longest ms between a fix arriving and its location being shown
+
+    Ages = [1000.0 * (Time - Sent) for (Number, Sent), Time in Shown]
+
+    return sum(Ages) / len(Ages), max(Ages)
+
+
+def Send(Post):
+
+    for Number in range(FIXES):
+
+        Post((Number, time.time()))
+        time.sleep(FIX_INTERVAL)
+
+
+def RunMailbox():
+
+    Shown = []
+
+    Worker = LocationWorker(Lookup, lambda Fix: Shown.append((Fix, time.time())))
+    Worker.start()
+
+    Send(Worker.Post)
+    time.sleep(SLOW_LOOKUP * 2)
+    Worker.Close()
+    Worker.join()
+
+    return Shown, Worker.Statistics()
+
+
+def RunQueue():
+
+    Shown = []
+    Fixes = queue.Queue()
+
+    def Run():
+
+        while True:
+
+            Fix = Fixes.get()
+
+            if Fix is None:
+                break
+
+            Shown.append((Lookup(Fix), time.time()))
+
+    Worker = threading.Thread(target=Run)
+    Worker.start()
+
+    Send(Fixes.put)
+    Fixes.put(None)
+    Worker.join()
+
+    return Shown
+
+
+def Main():
+
+    print('%d fixes every %.0fms, lookups take %.0fms (%.0fms for one in %d)' % (
+        FIXES, 1000 * FIX_INTERVAL, 1000 * LOOKUP, 1000 * SLOW_LOOKUP, SLOW_EVERY))
+
+    Shown = RunQueue()
+    print('  queue    shown %3d   location age %6.1f ms mean %6.1f ms longest' % ((len(Shown),) + Staleness(Shown)))
+
+    Shown, Statistics = RunMailbox()
+    print('  mailbox  shown %3d   location age %6.1f ms mean %6.1f ms longest   coalesced %d   '
+          'wait %.1f ms mean %.1f ms longest   lookup %.1f ms mean' % (
+              (len(Shown),) + Staleness(Shown) + (Statistics['coalesced'], 1000 * Statistics['wait'],
+                                                  1000 * Statistics['wait_longest'], 1000 * Statistics['lookup'])))
+
+
+if __name__ == '__main__':
+
+    Main()
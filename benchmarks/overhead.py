@@ -0,0 +1,145 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# What does instrumentation cost? A Start/Stop pair on its own, and the lookups a fix goes through (FindClosestNode,
+# IsIntersection, FetchStreets) with instrumentation off and on, for each backend.
+# Usage: python benchmarks/overhead.py
+
+import os
+import random
+import tempfile
+import timeit
+
+from synthetic import StreetGrid, BuildDatabase, Quietly, ORIGIN
+from database import DataBase
+import mapfile
+import sqlite3
+import instrument
+
+STREETS = 60  # 60 x 60 street grid
+STREET_SPACING = 0.150  # 150m blocks
+NODE_SPACING = 0.030  # A node every 30m
+
+FIXES = 3000
+ROUNDS = 9  # Take the best of this many runs of each, alternating off and on
+PAIRS = 200000  # Start/Stop pairs to time
+STAGES = 3  # Timed stages per fix (closest nodes, intersection, streets)
+
+
+def TimePairs():
+    # Returns: Seconds per Start/Stop pair
+
+    Start = timeit.default_timer()
+
+    for Pair in range(PAIRS):
+        instrument.Stop('overhead', instrument.Start())
+
+    return (timeit.default_timer() - Start) / PAIRS
+
+
+def Lookups(Database, Fixes):
+    # Returns: Seconds for all the fixes
+
+    Start = timeit.default_timer()
+
+    for Fix in Fixes:
+
+        osmid = Database.FindClosestNode(Fix)
+
+        if not osmid is None:
+            Database.IsIntersection(osmid)
+            Database.FetchStreets(osmid)
+
+    return timeit.default_timer() - Start
+
+
+def Main():
+
+    Directory = tempfile.mkdtemp()
+    Filename = os.path.join(Directory, 'city.sqlite')
+    MapFilename = os.path.join(Directory, 'city.map')
+
+    Nodes, Ways = StreetGrid(STREETS, STREET_SPACING, NODE_SPACING)
+    BuildDatabase(Filename, Nodes, Ways)
+
+    Database = sqlite3.connect(Filename)
+    mapfile.Write(Database.cursor(), MapFilename)
+    Database.close()
+
+    Random = random.Random(FIXES)
+    Size = (STREETS - 1) * STREET_SPACING
+    Fixes = [(ORIGIN[0] + Random.uniform(0.0, Size / 111.0), ORIGIN[1] + Random.uniform(0.0, Size / 80.0))
+             for Fix in range(FIXES)]
+
+    PairOff = min(TimePairs() for Round in range(ROUNDS))
+    instrument.Enable()
+    PairOn = min(TimePairs() for Round in range(ROUNDS))
+    instrument.Disable()
+    instrument.Reset()
+
+    print('Start/Stop pair: %.2f us off, %.2f us on' % (1e6 * PairOff, 1e6 * PairOn))
+    print('%d fixes, closest node + intersection + streets, best of %d' % (FIXES, ROUNDS))
+
+    for Backend, File in (('sqlite', Filename), ('memory', Filename), ('mapfile', MapFilename)):
+
+        for CacheSize in (0, 512):
+
+            Database = DataBase(Backend, CacheSize=CacheSize)
+            Quietly(Database.Connect, File)
+
+            Timings = {False: [], True: []}
+
+            for Round in range(ROUNDS):
+
+                for Enabled in (False, True):
+
+                    if Enabled:
+                        instrument.Enable()
+
+                    Timings[Enabled].append(Lookups(Database, Fixes))
+                    instrument.Disable()
+
+            Database.Close()
+
+            Off = min(Timings[False])
+            On = min(Timings[True])
+
+            # What the pairs alone should add, steadier than the difference of two noisy timings
+            Estimate = STAGES * FIXES * (PairOn - PairOff) / Off
+
+            print('  %-8s cache %3d   off %6.3f ms per fix   on %6.3f ms per fix   overhead %+5.1f%% (%.1f%% from the '
+                  'pairs)' % (Backend, CacheSize, 1000 * Off / FIXES, 1000 * On / FIXES, 100.0 * (On - Off) / Off,
+                              100.0 * Estimate))
+
+    Snapshot = instrument.Snapshot()
+
+    for Name in sorted(Snapshot['histograms']):
+
+        if Name.startswith('database.'):
+
+            Histogram = Snapshot['histograms'][Name]
+            print('  %-26s %7d calls   p50 %6.3f ms   p99 %6.3f ms   max %6.3f ms' % (
+                Name, Histogram['count'], Histogram['p50_ms'], Histogram['p99_ms'], Histogram['max_ms']))
+
+    os.remove(Filename)
+    os.remove(MapFilename)
+    os.rmdir(Directory)
+
+
+if __name__ == '__main__':
+
+    Main()
@@ -0,0 +1,216 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Looking up the next fix before it arrives (see predictor.py): drive random routes through a street grid, one fix a
+# second, locating ourselves the way EventHandler does with and without the Predictor. For the fixes the tracker can't
+# skip, how long from the fix arriving until we know where we are and how often the answer was already there (and, to
+# be sure, that every answer we used is what looking the fix up gives).
+# Usage: python benchmarks/prediction.py
+
+import os
+import random
+import tempfile
+import time
+
+from synthetic import StreetGrid, BuildDatabase, Quietly
+from corridor import RandomRoute, STREETS, STREET_SPACING, NODE_SPACING, SPEED, FIX_INTERVAL
+from database import DataBase
+from tracker import StreetTracker
+from predictor import Predictor
+from gpsfix import GpsFix
+from geolib import DistanceBetween
+
+ROUTES = 5
+ROUTE_BLOCKS = 60
+
+
+class Locator():
+
+    # EventHandler.__Locate, __Prepare and __Lookup
+
+    def __init__(self, Database, Graph, Predict):
+
+        self.Database = Database
+        self.Graph = Graph
+        self.Tracker = StreetTracker()
+        self.Predictor = Predictor() if Predict else None
+        self.State = (None, None, None)
+        self.Waits = [] # Seconds from a fix arriving to knowing where we are, for fixes that needed it
+        self.Wrong = 0 # Predicted answers that weren't what looking the fix up gives
+
+    def Locate(self, Fix):
+
+        Arrived = time.time()
+        Coordinates = (Fix.lat, Fix.lon)
+        Bearing = Fix.track if Fix.speed else None
+
+        if not self.Predictor is None:
+            self.Predictor.Update(Fix)
+
+        if self.Tracker.Check(Coordinates, Bearing):
+
+            if not self.Predictor is None:
+                self.Predictor.Discard()
+
+            return
+
+        ClosestNodeID = self.Database.FindClosestNode(Coordinates)
+        Answer = None if self.Predictor is None else self.Predictor.Take(ClosestNodeID)
+        Predicted = not Answer is None
+
+        if not Predicted:
+            Answer = self.Lookup(ClosestNodeID)
+
+        self.Waits.append(time.time() - Arrived)
+
+        if Predicted and not Same(Answer, self.Lookup(ClosestNodeID)):
+            self.Wrong += 1
+
+        self.State, Follow, Location = Answer
+
+        if Follow is False:
+            self.Tracker.Forget()
+
+        elif not Follow is None and not self.Tracker.WayID() == Follow:
+            self.Tracker.Follow(Follow, self.Database.FetchWayGeometry(Follow))
+
+    def Prepare(self):
+
+        if self.Predictor is None:
+            return
+
+        Predicted = self.Predictor.Predict()
+
+        if Predicted is None or self.Tracker.Covers(Predicted[:2], Predicted[2]):
+            return
+
+        ClosestNodeID = self.Database.FindClosestNode(Predicted[:2])
+
+        Started = time.time()
+        Answer = self.Lookup(ClosestNodeID)
+
+        self.Predictor.Store(ClosestNodeID, Answer, time.time() - Started)
+
+    def Lookup(self, ClosestNodeID):
+
+        LastKnownNodeID, LastKnownWayID = self.State[1:]
+
+        if ClosestNodeID == LastKnownNodeID:
+            return (ClosestNodeID, LastKnownNodeID, LastKnownWayID), None, None
+
+        if not self.Database.IsIntersection(ClosestNodeID):
+
+            LastKnownNodeID = ClosestNodeID
+            Streets = Quietly(self.Database.FetchStreets, ClosestNodeID)
+
+            if Streets is None:
+                return (ClosestNodeID, LastKnownNodeID, LastKnownWayID), False, None
+
+            LastKnownWayID = Streets[0].WayID()
+
+            return (ClosestNodeID, LastKnownNodeID, LastKnownWayID), LastKnownWayID, (Streets[0], [])
+
+        Location = self.Graph.Resolve(ClosestNodeID, LastKnownWayID, LastKnownNodeID)
+
+        return (ClosestNodeID, LastKnownNodeID, LastKnownWayID), None if Location[0] is None else \
+            Location[0].WayID(), Location
+
+
+def Same(First, Second):
+    # Returns: True if two answers would show the same thing and leave us in the same state
+
+    def Shown(Location):
+
+        if Location is None:
+            return None
+
+        return (None if Location[0] is None else Location[0].WayID(), [Street.WayID() for Street in Location[1]])
+
+    return First[0][1:] == Second[0][1:] and First[1] == Second[1] and Shown(First[2]) == Shown(Second[2])
+
+
+def Percentile(Sorted, Percent):
+
+    return Sorted[min(len(Sorted) - 1, int(len(Sorted) * Percent / 100.0))]
+
+
+def Main():
+
+    Directory = tempfile.mkdtemp()
+    Filename = os.path.join(Directory, 'grid.sqlite')
+
+    Nodes, Ways = StreetGrid(STREETS, STREET_SPACING, NODE_SPACING)
+    BuildDatabase(Filename, Nodes, Ways)
+
+    Routes = [RandomRoute(random.Random(Route), ROUTE_BLOCKS) for Route in range(ROUTES)]
+    Fixes = sum(len(Route) for Route in Routes)
+    Driven = sum(DistanceBetween(Route[Fix][0], Route[Fix + 1][0]) for Route in Routes for Fix in range(len(Route) - 1))
+
+    print('%d routes, %.1f km, %d fixes at %.0f km/h, one every %.0f s, sqlite without caches' % (
+        ROUTES, Driven, Fixes, SPEED, FIX_INTERVAL))
+
+    for Label, Predict in (('tracker', False), ('predictor', True)):
+
+        Database = DataBase('sqlite', CacheSize=0)
+        Quietly(Database.Connect, Filename)
+        Graph = Quietly(Database.LoadStreetGraph)
+
+        Waits = []
+        Wrong = 0
+        Statistics = None
+
+        for Route in Routes:
+
+            Locate = Locator(Database, Graph, Predict)
+
+            for Second, (Coordinates, Bearing, Name, ToIntersection) in enumerate(Route):
+
+                Locate.Locate(GpsFix(Second * FIX_INTERVAL, 3, Coordinates[0], Coordinates[1], int(SPEED),
+                                     Bearing % 360.0, None, None, None))
+                Locate.Prepare() # While we wait for the next fix
+
+            Waits += Locate.Waits
+            Wrong += Locate.Wrong
+
+            if Predict:
+
+                Route = Locate.Predictor.Statistics()
+                Statistics = Route if Statistics is None else dict((Key, Statistics[Key] + Route[Key])
+                                                                  for Key in ('predictions', 'hits', 'misses', 'saved'))
+
+        Database.Close()
+        Waits.sort()
+
+        print('  %-10s %4d fixes needed a lookup   fix to answer %6.3f ms mean %6.3f ms p95 %6.3f ms max' % (
+            Label, len(Waits), 1000 * sum(Waits) / len(Waits), 1000 * Percentile(Waits, 95), 1000 * Waits[-1]))
+
+        if Predict:
+
+            Tried = Statistics['hits'] + Statistics['misses']
+
+            print('  %d looked up ahead, hit rate %.1f%% (%d of %d), %.1f ms of lookups saved (%.3f ms a hit), '
+                  '%d answers differed from a lookup' % (
+                      Statistics['predictions'], 100.0 * Statistics['hits'] / max(Tried, 1), Statistics['hits'], Tried,
+                      1000 * Statistics['saved'], 1000 * Statistics['saved'] / max(Statistics['hits'], 1), Wrong))
+
+    os.remove(Filename)
+    os.rmdir(Directory)
+
+
+if __name__ == '__main__':
+
+    Main()
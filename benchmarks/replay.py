@@ -0,0 +1,193 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Hours of patrol in seconds: record a long drive through a street grid as a gpsd JSON log and as an NMEA log, then
+# replay it (see gpslog.py) through the location lookups as fast as they keep up, and an hour a second through the
+# LocationWorker the way EventHandler runs them.
+# Usage: python benchmarks/replay.py [log to replay instead of the synthetic one]
+
+import os
+import sys
+import json
+import random
+import tempfile
+import time
+
+from synthetic import StreetGrid, BuildDatabase, Quietly
+from corridor import RandomRoute, Locator, STREETS, STREET_SPACING, NODE_SPACING, SPEED
+from database import DataBase
+from tracker import StreetTracker
+from locationworker import LocationWorker
+from gpslog import ReadGpsLog, Replay, KNOTS_TO_MPS
+
+PATROL_BLOCKS = 700  # About 4 hours at 50 km/h, one fix a second
+PATROL_START = 1415898000  # 13 Nov 2014 17:00 UTC
+FAST_REPLAY = 3600.0  # An hour a second
+
+
+def WriteGpsdLog(Filename, Fixes):
+
+    Log = open(Filename, 'w')
+    Log.write('{"class":"VERSION","release":"3.11"}\n')
+
+    for Second, (Coordinates, Bearing, Name, ToIntersection) in enumerate(Fixes):
+
+        Log.write(json.dumps({'class': 'TPV', 'mode': 3, 'time': time.strftime('%Y-%m-%dT%H:%M:%S.000Z',
+                                                                               time.gmtime(PATROL_START + Second)),
+                              'lat': round(Coordinates[0], 9), 'lon': round(Coordinates[1], 9),
+                              'speed': round(SPEED / 3.6, 3), 'track': round(Bearing % 360.0, 4)}) + '\n')
+        Log.write('{"class":"SKY","satellites":[]}\n')
+
+    Log.close()
+
+
+def NmeaSentence(Body):
+
+    Sum = 0
+
+    for Character in Body:
+        Sum ^= ord(Character)
+
+    return '$%s*%02X\n' % (Body, Sum)
+
+
+def NmeaPosition(Degrees, Positive, Negative, Width):
+
+    Minutes = abs(Degrees) * 60.0
+
+    return '%0*d%07.4f,%s' % (Width, int(Minutes // 60), Minutes % 60, Positive if Degrees >= 0 else Negative)
+
+
+def WriteNmeaLog(Filename, Fixes):
+
+    Log = open(Filename, 'w')
+
+    for Second, (Coordinates, Bearing, Name, ToIntersection) in enumerate(Fixes):
+
+        Time = time.gmtime(PATROL_START + Second)
+        Latitude = NmeaPosition(Coordinates[0], 'N', 'S', 2)
+        Longitude = NmeaPosition(Coordinates[1], 'E', 'W', 3)
+
+        Log.write(NmeaSentence('GPGGA,%s,%s,%s,1,08,0.9,95.0,M,-35.0,M,,' % (time.strftime('%H%M%S.00', Time),
+                                                                           Latitude, Longitude)))
+        Log.write(NmeaSentence('GPRMC,%s,A,%s,%s,%.2f,%.1f,%s,,,A' % (time.strftime('%H%M%S.00', Time), Latitude,
+                                                                    Longitude, SPEED / 3.6 / KNOTS_TO_MPS,
+                                                                    Bearing % 360.0, time.strftime('%d%m%y', Time))))
+
+    Log.close()
+
+
+def Percentile(Sorted, Percent):
+
+    return Sorted[min(len(Sorted) - 1, int(len(Sorted) * Percent / 100.0))]
+
+
+def Main():
+
+    Directory = tempfile.mkdtemp()
+    Filename = os.path.join(Directory, 'grid.sqlite')
+
+    Nodes, Ways = StreetGrid(STREETS, STREET_SPACING, NODE_SPACING)
+    BuildDatabase(Filename, Nodes, Ways)
+
+    if len(sys.argv) > 1:
+        Logs = [sys.argv[1]]
+
+    else:
+
+        Fixes = RandomRoute(random.Random(PATROL_BLOCKS), PATROL_BLOCKS)
+        Logs = [os.path.join(Directory, 'patrol.json'), os.path.join(Directory, 'patrol.nmea')]
+
+        WriteGpsdLog(Logs[0], Fixes)
+        WriteNmeaLog(Logs[1], Fixes)
+
+    for Log in Logs:
+
+        Start = time.time()
+        Reports = [Report for Report in ReadGpsLog(Log) if 'lat' in Report and 'lon' in Report]
+        Elapsed = time.time() - Start
+
+        Recorded = Reports[-1]['time'] - Reports[0]['time']
+
+        print('%s: %d fixes, %.1f hours, read at %.0f fixes/s (%d KB)' % (
+            os.path.basename(Log), len(Reports), Recorded / 3600.0, len(Reports) / Elapsed, os.path.getsize(Log) // 1024))
+
+    # As fast as the lookups keep up, one fix after the other
+    Database = DataBase('sqlite', CacheSize=0)
+    Quietly(Database.Connect, Filename)
+    Locate = Locator(Database, Quietly(Database.LoadStreetGraph), StreetTracker())
+    Latencies = []
+
+    Start = time.time()
+
+    for Report in Replay(ReadGpsLog(Logs[0]), 0):
+
+        if 'lat' in Report:
+
+            Fix = time.time()
+            Locate.Locate((Report['lat'], Report['lon']), Report.get('track'))
+            Latencies.append(time.time() - Fix)
+
+    Elapsed = time.time() - Start
+    Latencies.sort()
+
+    print('  as fast as possible  %.2f s, %.0f fixes/s   per fix p50 %.3f ms p95 %.3f ms p99 %.3f ms max %.3f ms' % (
+        Elapsed, len(Latencies) / Elapsed, 1000 * Percentile(Latencies, 50), 1000 * Percentile(Latencies, 95),
+        1000 * Percentile(Latencies, 99), 1000 * Latencies[-1]))
+
+    Database.Close()
+
+    # An hour a second through the LocationWorker, like EventHandler
+    Database = DataBase('sqlite', CacheSize=0)
+    Quietly(Database.Connect, Filename)
+    Locate = Locator(Database, Quietly(Database.LoadStreetGraph), StreetTracker())
+
+    Worker = LocationWorker(lambda Fix: Locate.Locate(Fix[:2], Fix[2]), lambda Result: None)
+    Worker.start()
+
+    Start = time.time()
+
+    for Report in Replay(ReadGpsLog(Logs[0]), FAST_REPLAY):
+
+        if 'lat' in Report:
+            Worker.Post((Report['lat'], Report['lon'], Report.get('track')))
+
+    Elapsed = time.time() - Start
+
+    Worker.Close()
+    Worker.join()
+
+    Statistics = Worker.Statistics()
+
+    print('  %.0fx real time      %.2f s (%.2f s expected)   %d looked up, %d coalesced   wait %.3f ms mean %.3f ms '
+          'longest' % (FAST_REPLAY, Elapsed, Recorded / FAST_REPLAY, Statistics['lookups'], Statistics['coalesced'],
+                       1000 * Statistics['wait'], 1000 * Statistics['wait_longest']))
+
+    Database.Close()
+
+    for Log in Logs:
+
+        if Log.startswith(Directory):
+            os.remove(Log)
+
+    os.remove(Filename)
+    os.rmdir(Directory)
+
+
+if __name__ == '__main__':
+
+    Main()
@@ -0,0 +1,114 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Which street are we on? The closest node and its streets (FindClosestNode + FetchStreets) against the closest street
+# segment (FindClosestSegment), on long straight streets with few nodes.
+# Usage: python benchmarks/segments.py
+
+import os
+import random
+import tempfile
+import time
+
+from synthetic import StreetGrid, BuildDatabase, Quietly
+from database import DataBase
+from geolib import PointAt
+
+STREETS = 30  # 30 x 30 street grid
+STREET_SPACING = 0.400  # 400m blocks
+NODE_SPACING = 0.200  # A node at each intersection and one halfway along each block
+
+FIXES = 1000
+
+
+def RandomFixes(Nodes, Ways, Random):
+    # Locations a few meters off a random street: (location, bearing, street name)
+
+    Coordinates = dict((osmid, (Lattitude, Longitude)) for osmid, Longitude, Lattitude in Nodes)
+    Fixes = []
+
+    for Fix in range(FIXES):
+
+        wayid, Tags, Refs = Random.choice(Ways)
+        Block = Random.randrange(len(Refs) - 1)
+
+        Start = Coordinates[Refs[Block]]
+        End = Coordinates[Refs[Block + 1]]
+        Fraction = Random.random()
+
+        Point = (Start[0] + Fraction * (End[0] - Start[0]), Start[1] + Fraction * (End[1] - Start[1]))
+        Bearing = 0.0 if Tags['name'].startswith('North') else 90.0
+
+        Point = PointAt(Point, Bearing + 90.0, Random.uniform(-0.015, 0.015)) # GPS error across the street
+        Fixes.append((Point, Bearing + Random.uniform(-20.0, 20.0), Tags['name']))
+
+    return Fixes
+
+
+def Main():
+
+    Directory = tempfile.mkdtemp()
+    Filename = os.path.join(Directory, 'sparse.sqlite')
+
+    Nodes, Ways = StreetGrid(STREETS, STREET_SPACING, NODE_SPACING)
+    BuildDatabase(Filename, Nodes, Ways)
+
+    Fixes = RandomFixes(Nodes, Ways, random.Random(FIXES))
+
+    Database = DataBase('sqlite', CacheSize=0)
+    Quietly(Database.Connect, Filename)
+
+    print('%d x %d streets, %.0fm blocks with a node every %.0fm, %d fixes' % (
+        STREETS, STREETS, 1000 * STREET_SPACING, 1000 * NODE_SPACING, FIXES))
+
+    Start = time.time()
+    Right = 0
+
+    for Coordinates, Bearing, Name in Fixes:
+
+        Streets = Quietly(Database.FetchStreets, Database.FindClosestNode(Coordinates)) or []
+
+        if len(Streets) == 1 and Streets[0].StreetName() == Name: # An intersection doesn't tell us which street
+            Right += 1
+
+    print('  closest node     %6.3f ms per fix   right street %5.1f%%' % (
+        1000.0 * (time.time() - Start) / FIXES, 100.0 * Right / FIXES))
+
+    for Label, UseBearing in (('closest segment', False), ('  with bearing', True)):
+
+        Start = time.time()
+        Right = 0
+
+        for Coordinates, Bearing, Name in Fixes:
+
+            Segment = Database.FindClosestSegment(Coordinates, Bearing if UseBearing else None)
+
+            if not Segment is None and Segment[1].StreetName() == Name:
+                Right += 1
+
+        print('  %-16s %6.3f ms per fix   right street %5.1f%%' % (
+            Label, 1000.0 * (time.time() - Start) / FIXES, 100.0 * Right / FIXES))
+
+    Database.Close()
+
+    os.remove(Filename)
+    os.rmdir(Directory)
+
+
+if __name__ == '__main__':
+
+    Main()
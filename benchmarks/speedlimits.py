@@ -0,0 +1,252 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# The next speed limit change ahead (see DataBase.SpeedLimitsAhead): drive random routes through a street grid whose
+# streets are split into ways with a different speed limit every CHUNK_BLOCKS blocks, one fix a second. Each fix, find
+# how far it is to the next change by looking up points ahead of us (FindClosestNode and FetchStreets every
+# SAMPLE_SPACING) and by walking the ways ahead once per way and direction. What it costs a fix, how many database
+# queries it takes and how far off the answer is from where the limit really changes.
+# Usage: python benchmarks/speedlimits.py
+
+import os
+import random
+import tempfile
+import time
+
+from synthetic import StreetGrid, BuildDatabase, Quietly
+from corridor import RandomRoute, Intersection, STREETS, STREET_SPACING, NODE_SPACING, SPEED, FIX_INTERVAL
+from prediction import Locator
+from database import DataBase, SPEED_LOOKAHEAD_DISTANCE
+from gpsfix import GpsFix
+from geolib import PointAt, DistanceBetween
+
+ROUTES = 3
+ROUTE_BLOCKS = 40
+CHUNK_BLOCKS = 2  # A new way (and speed limit) every 2 blocks
+CHUNK_SPEEDS = ('40', '60', '80')  # Speed limit of each chunk in turn, so it changes at every chunk boundary
+SAMPLE_SPACING = 0.050  # Look up a point every 50m ahead...
+SAMPLE_DISTANCE = 1.0  # ...up to 1km ahead
+AT_CHANGE = 0.010  # Within 10m of where the limit changes (either side) we're there, the fix is only good to 5m
+
+
+def ChunkedGrid():
+    # Returns: (Nodes, Ways) of the grid with each street split into ways of CHUNK_BLOCKS blocks, the way streets are
+    # split wherever their tags change in a real extract. Two way streets only, so we can drive either way on all of them.
+
+    Nodes, Ways = StreetGrid(STREETS, STREET_SPACING, NODE_SPACING)
+    NodesPerChunk = CHUNK_BLOCKS * int(round(STREET_SPACING / NODE_SPACING))
+    Chunked = []
+
+    for wayid, Tags, Refs in Ways:
+
+        for Chunk, Start in enumerate(range(0, len(Refs) - 1, NodesPerChunk)):
+
+            ChunkTags = dict((Key, Value) for Key, Value in Tags.items() if not Key == 'oneway')
+            ChunkTags['maxspeed'] = CHUNK_SPEEDS[Chunk % len(CHUNK_SPEEDS)]
+
+            Chunked.append((wayid * 100 + Chunk, ChunkTags, Refs[Start:Start + NodesPerChunk + 1]))
+
+    return Nodes, Chunked
+
+
+def NextChange(Coordinates, Bearing, Name):
+    # Returns: km to where the speed limit really changes next on the street we're driving (0 if we're at it), or None
+    # if there aren't any more changes on the street
+
+    Street = int(Name.split()[-1])
+    Heading = int(round((Bearing % 360.0) / 90.0)) % 4 # 0 North, 1 East, 2 South, 3 West
+    Boundaries = [Block for Block in range(STREETS) if Block % CHUNK_BLOCKS == 0] # Ways end at the last block too
+
+    def Boundary(Block):
+        return Intersection(Block, Street) if Name.startswith('North') else Intersection(Street, Block)
+
+    Changes = [Block for Block in Boundaries if 0 < Block < STREETS - 1]
+
+    if any(DistanceBetween(Coordinates, Boundary(Block)) < AT_CHANGE for Block in Changes):
+        return 0.0
+
+    Ahead = [Block for Block in Changes if BearingAhead(Coordinates, Boundary(Block), (0.0, 90.0, 180.0, 270.0)[Heading])]
+
+    if len(Ahead) == 0:
+        return None
+
+    return min(DistanceBetween(Coordinates, Boundary(Block)) for Block in Ahead)
+
+
+def BearingAhead(Coordinates, Point, Bearing):
+    # Returns: True if Point is ahead of us (within 90 degrees of our bearing)
+
+    Ahead = PointAt(Coordinates, Bearing, 0.001)
+
+    return DistanceBetween(Ahead, Point) < DistanceBetween(Coordinates, Point)
+
+
+def Sampled(Database, Coordinates, Bearing, Name):
+    # Before: look up points ahead of us until the street we're on has a different speed limit there
+    # Returns: (km to the next change or None, queries it took)
+
+    Queries = 0
+    Current = None
+    Ahead = 0.0
+
+    while Ahead <= SAMPLE_DISTANCE:
+
+        osmid = Database.FindClosestNode(PointAt(Coordinates, Bearing, Ahead))
+        Streets = Quietly(Database.FetchStreets, osmid) or []
+        Queries += 2
+
+        for Street in Streets:
+
+            if Street.StreetName() == Name:
+
+                if Current is None:
+                    Current = Street.MaxSpeed()
+
+                elif not Street.MaxSpeed() == Current:
+                    return Ahead, Queries
+
+        Ahead += SAMPLE_SPACING
+
+    return None, Queries
+
+
+def Counting(Database, Counts):
+    # Count the queries SpeedLimitsAhead asks while Counts[1] is set: one for the way's street, one for the shape of each
+    # way it looks at and one for the ways at each end it crosses (some of those come from FetchStreets' cache)
+
+    for Name in ('FetchWayGeometry', 'FetchStreets'):
+
+        def Counted(osmid, Fetch=getattr(Database, Name)):
+
+            if Counts[1]:
+                Counts[0] += 1
+
+            return Fetch(osmid)
+
+        setattr(Database, Name, Counted)
+
+
+def Percentile(Sorted, Percent):
+
+    return Sorted[min(len(Sorted) - 1, int(len(Sorted) * Percent / 100.0))]
+
+
+def Report(Label, Seconds, Queries, Errors, Answered, Fixes):
+
+    Seconds.sort()
+    Errors.sort()
+
+    print('  %-8s %7.3f ms a fix mean %7.3f ms p95   %6.2f queries a fix   answered %4d of %d fixes   '
+          'off by %3.0f m mean, more than %.0f m %d times' % (
+              Label, 1000 * sum(Seconds) / len(Seconds), 1000 * Percentile(Seconds, 95), float(Queries) / Fixes,
+              Answered, Fixes, 1000 * sum(Errors) / max(len(Errors), 1), 1000 * SAMPLE_SPACING,
+              len([Error for Error in Errors if Error > SAMPLE_SPACING])))
+
+
+def Main():
+
+    Directory = tempfile.mkdtemp()
+    Filename = os.path.join(Directory, 'grid.sqlite')
+
+    Nodes, Ways = ChunkedGrid()
+    BuildDatabase(Filename, Nodes, Ways)
+
+    Routes = [RandomRoute(random.Random(Route), ROUTE_BLOCKS) for Route in range(ROUTES)]
+    Fixes = sum(len(Route) for Route in Routes)
+
+    print('%d routes, %d fixes at %.0f km/h, %d ways, speed limit changes every %.1f km' % (
+        ROUTES, Fixes, SPEED, len(Ways), CHUNK_BLOCKS * STREET_SPACING))
+
+    Database = DataBase('sqlite')
+    Quietly(Database.Connect, Filename)
+
+    Seconds = []
+    Queries = 0
+    Errors = []
+    Answered = 0
+
+    for Route in Routes:
+
+        for Coordinates, Bearing, Name, ToIntersection in Route:
+
+            Started = time.time()
+            Distance, Asked = Sampled(Database, Coordinates, Bearing % 360.0, Name)
+            Seconds.append(time.time() - Started)
+            Queries += Asked
+
+            Truth = NextChange(Coordinates, Bearing, Name)
+
+            if not Distance is None and not Truth is None:
+
+                Answered += 1
+                Errors.append(abs(Distance - Truth))
+
+    Report('sampled', Seconds, Queries, Errors, Answered, Fixes)
+
+    Database.Close()
+    Database = DataBase('sqlite')
+    Quietly(Database.Connect, Filename)
+    Graph = Quietly(Database.LoadStreetGraph)
+
+    Counts = [0, False] # Queries, counting?
+    Counting(Database, Counts)
+
+    Seconds = []
+    Errors = []
+    Answered = 0
+
+    for Route in Routes:
+
+        Locate = Locator(Database, Graph, False)
+
+        for Second, (Coordinates, Bearing, Name, ToIntersection) in enumerate(Route):
+
+            Locate.Locate(GpsFix(Second * FIX_INTERVAL, 3, Coordinates[0], Coordinates[1], int(SPEED),
+                                 Bearing % 360.0, None, None, None))
+
+            # EventHandler.__LookAhead
+            Counts[1] = True
+            Started = time.time()
+            Position = Locate.Tracker.Position()
+            Changes = None if Position is None else Database.SpeedLimitsAhead(Position[0], Position[1])
+            Ahead = () if Changes is None else tuple((Position[2] + Distance, Street) for Distance, Street in Changes)
+            Seconds.append(time.time() - Started)
+            Counts[1] = False
+
+            Truth = NextChange(Coordinates, Bearing, Name)
+
+            if len(Ahead) > 0 and not Truth is None:
+
+                Answered += 1
+                Errors.append(abs(Ahead[0][0] - Truth))
+
+    Walks = Database.CacheStatistics()['speed_limits']
+    Queries = Walks['misses'] + Counts[0]
+
+    Report('walked', Seconds, Queries, Errors, Answered, Fixes)
+
+    print('  walked the ways ahead %d times for %d fixes (%d answers from the cache), lookahead %.1f km past the end '
+          'of the way' % (Walks['misses'], Fixes, Walks['hits'], SPEED_LOOKAHEAD_DISTANCE))
+
+    Database.Close()
+    os.remove(Filename)
+    os.rmdir(Directory)
+
+
+if __name__ == '__main__':
+
+    Main()
@@ -0,0 +1,164 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Boot to first fix: how long GpsModule's loop (see gpsdclient.py) takes to connect and get its first fix from a gpsd
+# that's already running, and from one that only comes up a while after we do. A fake gpsd on a local port stands in
+# for the real one, sending a fix every RECEIVER_INTERVAL seconds like the receiver would.
+# Usage: python benchmarks/startup.py
+
+import json
+import socket
+import threading
+import time
+
+from synthetic import ORIGIN, Quietly
+from gpsdclient import GpsdClient
+
+PORT = 13370
+RECEIVER_INTERVAL = 0.1  # 10 fixes a second, so the receiver's timing doesn't hide ours
+TRIALS = 20
+LATE_STARTS = (0.25, 1.0, 3.0)  # Seconds after us that gpsd comes up
+OLD_SLEEPS = 2 * (0.5 + 1.0)  # What DashPad and EventHandler each used to sleep around killall gpsd and starting it
+
+
+class FakeGpsd(threading.Thread):
+
+    # Listens on Port after Delay seconds, says hello like gpsd and sends a TPV report every RECEIVER_INTERVAL
+    # seconds to whoever asked to watch
+
+    def __init__(self, Port, Delay=0.0):
+
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.__Port = Port
+        self.__Delay = Delay
+        self.__Closed = threading.Event()
+        self.Listening = None # When we started listening
+
+    def run(self):
+
+        self.__Closed.wait(self.__Delay)
+
+        Listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        Listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        Listener.bind(('127.0.0.1', self.__Port))
+        Listener.listen(5)
+        Listener.settimeout(0.05)
+        self.Listening = time.time()
+
+        while not self.__Closed.is_set():
+
+            try:
+                Client, Address = Listener.accept()
+
+            except socket.timeout:
+                continue
+
+            Client.sendall(b'{"class":"VERSION","release":"3.11","proto_major":3,"proto_minor":9}\n')
+            Client.recv(1024) # ?WATCH
+            Client.sendall(b'{"class":"DEVICES","devices":[{"class":"DEVICE","path":"/dev/ttyUSB0"}]}\n'
+                           b'{"class":"WATCH","enable":true,"json":true}\n')
+
+            Second = 0
+
+            while not self.__Closed.wait(RECEIVER_INTERVAL):
+
+                Second += 1
+                Report = {'class': 'TPV', 'mode': 3, 'time': time.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                          'lat': ORIGIN[0], 'lon': ORIGIN[1] + Second * 1e-5, 'speed': 13.9, 'track': 90.0}
+
+                try:
+                    Client.sendall((json.dumps(Report) + '\n').encode())
+
+                except socket.error:
+                    break
+
+            Client.close()
+
+        Listener.close()
+
+    def Close(self):
+
+        self.__Closed.set()
+
+
+def FirstFix(Port):
+    # The start of GpsModule.run
+    # Returns: (Seconds until connected, seconds until the first fix, seconds creating the client took)
+
+    Booted = time.time()
+    Client = GpsdClient('127.0.0.1', Port, StartGpsd=False)
+    Created = time.time() - Booted
+
+    while not Client.Connect():
+        pass
+
+    Connected = time.time() - Booted
+
+    while True:
+
+        if any('lat' in Report for Report in Client.Poll(1.0)):
+            break
+
+    FirstFix = time.time() - Booted
+    Client.Close()
+
+    return Connected, FirstFix, Created
+
+
+def Main():
+
+    Running = []
+
+    for Trial in range(TRIALS):
+
+        Gpsd = FakeGpsd(PORT + Trial)
+        Gpsd.start()
+
+        while Gpsd.Listening is None:
+            time.sleep(0.01)
+
+        Running.append(FirstFix(PORT + Trial))
+        Gpsd.Close()
+
+    print('gpsd already running, %d trials, a fix every %.1f s:' % (TRIALS, RECEIVER_INTERVAL))
+    print('  creating the client     %6.3f ms' % (1000 * max(Trial[2] for Trial in Running)))
+    print('  connected after         %6.3f ms mean  %6.3f ms max' % (
+        1000 * sum(Trial[0] for Trial in Running) / TRIALS, 1000 * max(Trial[0] for Trial in Running)))
+    print('  first fix after         %6.1f ms mean  %6.1f ms max (waiting on the receiver is up to %.0f ms of that)' % (
+        1000 * sum(Trial[1] for Trial in Running) / TRIALS, 1000 * max(Trial[1] for Trial in Running),
+        1000 * RECEIVER_INTERVAL))
+    print('  before: %.1f s of sleeps before even connecting' % OLD_SLEEPS)
+
+    print('gpsd comes up after we do:')
+
+    for Trial, Delay in enumerate(LATE_STARTS):
+
+        Gpsd = FakeGpsd(PORT + TRIALS + Trial, Delay)
+        Gpsd.start()
+
+        Connected, First, Created = Quietly(FirstFix, PORT + TRIALS + Trial)
+        Gpsd.Close()
+
+        print('  %.2f s later: connected %.3f s after it came up, first fix after %.3f s' % (
+            Delay, Connected - Delay, First))
+
+
+if __name__ == '__main__':
+
+    Main()
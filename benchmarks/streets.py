@@ -0,0 +1,122 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Timing of FetchStreets and IsIntersection before (way_nodes + way_info queries with no indexes) and after
+# (one indexed lookup in node_streets) the importer builds its indexes and node_streets table.
+# Usage: python benchmarks/streets.py
+
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from synthetic import StreetGrid, BuildDatabase, Quietly
+from database import DataBase
+
+STREETS = 100  # 100 x 100 street grid
+STREET_SPACING = 0.150  # 150m blocks
+NODE_SPACING = 0.030  # A node every 30m
+
+LOOKUPS = 200
+
+
+def LegacyFetchStreets(Cursor, osmid):
+    # The original DataBase.FetchStreets queries
+
+    Cursor.execute('''SELECT wayid FROM way_nodes WHERE osmid=?;''', (osmid,))
+
+    Streets = []
+
+    for Way in Cursor.fetchall():
+
+        Cursor.execute('''SELECT street_name, num_of_lanes, maxspeed, street_type, oneway FROM way_info WHERE wayid=?;''',
+                       (Way[0],))
+
+        WayInfo = Cursor.fetchone()
+
+        if not WayInfo is None:
+            Streets.append(WayInfo)
+
+    return Streets
+
+
+def LegacyIsIntersection(Cursor, osmid):
+    # The original DataBase.IsIntersection query
+
+    Cursor.execute('''SELECT count(wayid) FROM way_nodes WHERE osmid=?;''', (osmid,))
+
+    return bool(int(Cursor.fetchone()[0]) - 1)
+
+
+def Time(Function, NodeIDs):
+
+    Start = time.time()
+
+    for osmid in NodeIDs:
+        Function(osmid)
+
+    return 1000.0 * (time.time() - Start) / len(NodeIDs)
+
+
+def Main():
+
+    Directory = tempfile.mkdtemp()
+    Filename = os.path.join(Directory, 'city.sqlite')
+
+    Nodes, Ways = StreetGrid(STREETS, STREET_SPACING, NODE_SPACING)
+    Importer = BuildDatabase(Filename, Nodes, Ways, Finish=False)
+
+    Cursor = sqlite3.connect(Filename).cursor()
+    Cursor.execute('''SELECT count(*) FROM way_nodes''')
+    print('%d x %d street grid, %d way_nodes rows, %d lookups' % (STREETS, STREETS, Cursor.fetchone()[0], LOOKUPS))
+
+    Cursor.execute('''SELECT osmid FROM nodes''')
+    NodeIDs = random.Random(LOOKUPS).sample([Row[0] for Row in Cursor.fetchall()], LOOKUPS)
+
+    print('  before  FetchStreets %8.3f ms   IsIntersection %8.3f ms' % (
+        Time(lambda osmid: LegacyFetchStreets(Cursor, osmid), NodeIDs),
+        Time(lambda osmid: LegacyIsIntersection(Cursor, osmid), NodeIDs)))
+
+    Cursor.connection.close()
+
+    # Finish the import the way the importer does now
+    OSMDataBase = Importer.DataBase()
+    OSMDataBase.Connect(Filename)
+
+    Start = time.time()
+    Quietly(OSMDataBase.CreateIndexes)
+    Quietly(OSMDataBase.CreateNodeStreets)
+    print('  indexes and node_streets built in %.2f s' % (time.time() - Start))
+
+    OSMDataBase.Close()
+
+    Database = DataBase('sqlite')
+    Database.Connect(Filename)
+
+    print('  after   FetchStreets %8.3f ms   IsIntersection %8.3f ms' % (
+        Time(Database.FetchStreets, NodeIDs), Time(Database.IsIntersection, NodeIDs)))
+
+    Database.Close()
+
+    os.remove(Filename)
+    os.rmdir(Directory)
+
+
+if __name__ == '__main__':
+
+    Main()
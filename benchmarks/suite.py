@@ -0,0 +1,409 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# End to end benchmark: import a synthetic street grid with the importer, then look up a sequence of fixes with every
+# DataBase backend. Reports import rows/s and file sizes, p50/p95/p99 per call of FindClosestNode, IsIntersection,
+# FetchStreets and FindClosestSegment and fixes/s, and writes them as JSON so runs on different commits can be compared.
+#
+# Usage: python benchmarks/suite.py [-s streets] [-b block size in m] [-n node spacing in m] [-f fixes] [-l log]
+#                                   [-o results.json] [-c baseline.json] [-t percent]
+#   -s 60 -b 150 -n 30    60 x 60 streets, 150m apart with a node every 30m (the default)
+#   -f 2000               Look up 2000 fixes driving through the grid (the default)
+#   -l patrol.json        Look up the fixes of a recorded gpsd JSON or NMEA log instead (see gpslog.py)
+#   -o results.json       Write the results to results.json
+#   -c baseline.json      Compare with the results of an earlier run, exits with 1 if anything got slower or bigger
+#   -t 20                 by more than 20% (the default)
+
+import os
+import sys
+import getopt
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+import timeit
+
+from synthetic import StreetGrid, BuildDatabase, WriteOsmFile, LoadImporter, Quietly, ORIGIN
+from database import DataBase
+from gpslog import ReadGpsLog
+from geolib import PointAt
+import mapfile
+
+RESULTS_VERSION = 1  # Bump when the layout of the results changes
+
+BACKENDS = ('sqlite', 'memory', 'mapfile')
+CALLS = ('FindClosestNode', 'IsIntersection', 'FetchStreets', 'FindClosestSegment')
+
+DEFAULT_STREETS = 60
+DEFAULT_BLOCK = 150  # m
+DEFAULT_NODE_SPACING = 30  # m
+DEFAULT_FIXES = 2000
+DEFAULT_THRESHOLD = 20  # %
+
+FIX_SPACING = 0.014  # km between synthetic fixes (50 km/h, one fix a second)
+GPS_ERROR = 0.008  # Up to 8m off the street
+
+
+def Percentile(Sorted, Percent):
+
+    return Sorted[min(len(Sorted) - 1, int(len(Sorted) * Percent / 100.0))]
+
+
+def Summary(Timings):
+    # Returns: {'calls', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'} of a list of seconds
+
+    if len(Timings) == 0:
+        return {'calls': 0}
+
+    Sorted = sorted(Timings)
+
+    return {'calls': len(Sorted), 'mean_ms': 1000.0 * sum(Sorted) / len(Sorted),
+            'p50_ms': 1000.0 * Percentile(Sorted, 50), 'p95_ms': 1000.0 * Percentile(Sorted, 95),
+            'p99_ms': 1000.0 * Percentile(Sorted, 99)}
+
+
+def SyntheticFixes(Streets, Block, Count, Random):
+    # Fixes driving along the streets of the grid, turning at random at the intersections: [(Lattitude, Longitude)]
+
+    Fixes = []
+    Row, Column = Random.randrange(Streets), Random.randrange(Streets)
+    Along = 0.0
+    Heading = (0, 1)
+
+    while len(Fixes) < Count:
+
+        if Along >= Block: # At the next intersection, pick a way to go that stays on the grid
+
+            Row, Column = Row + Heading[0], Column + Heading[1]
+            Along -= Block
+
+            Heading = Random.choice([Turn for Turn in ((0, 1), (0, -1), (1, 0), (-1, 0))
+                                     if 0 <= Row + Turn[0] < Streets and 0 <= Column + Turn[1] < Streets])
+
+        Start = PointAt(PointAt(ORIGIN, 0.0, Row * Block), 90.0, Column * Block)
+        Point = PointAt(Start, 90.0 if Heading[1] else 0.0, (Heading[0] + Heading[1]) * Along)
+        Fixes.append(PointAt(Point, Random.uniform(0.0, 360.0), Random.uniform(0.0, GPS_ERROR)))
+
+        Along += FIX_SPACING
+
+    return Fixes
+
+
+def CanParse():
+    # Is the importer's OSM parser (imposm) installed?
+
+    try:
+        import imposm.parser
+        return True
+
+    except ImportError:
+        return False
+
+
+def ImportGrid(Directory, Nodes, Ways):
+    # Returns: (database file, results) - with imposm the whole importer runs on an OSM file written from the grid,
+    # without it the grid goes straight to the importer's callbacks and writer process (see BuildDatabase)
+
+    Filename = os.path.join(Directory, 'grid.sqlite')
+    Results = {}
+
+    if CanParse():
+
+        OsmFile = os.path.join(Directory, 'grid.osm')
+        WriteOsmFile(OsmFile, Nodes, Ways)
+
+        Start = time.time()
+        Succeeded = Quietly(LoadImporter().Import, OsmFile, Filename)
+        Seconds = time.time() - Start
+
+        if not Succeeded:
+            raise Exception('Import of ' + OsmFile + ' failed')
+
+        Results['path'] = 'osm-importer.py'
+        Results['osm_bytes'] = os.path.getsize(OsmFile)
+        os.remove(OsmFile)
+
+    else:
+
+        Phases = {}
+
+        Start = time.time()
+        BuildDatabase(Filename, Nodes, Ways, Writer=True, Timings=Phases)
+        Seconds = time.time() - Start
+
+        Results['path'] = 'callbacks'
+        Results['phases_s'] = Phases
+
+    Database = sqlite3.connect(Filename)
+    Rows = sum(Database.execute('SELECT count(*) FROM ' + Table).fetchone()[0]
+               for Table in ('nodes', 'way_nodes', 'way_info'))
+
+    Start = time.time()
+    mapfile.Write(Database.cursor(), os.path.join(Directory, 'grid.map'))
+    Results['mapfile_s'] = time.time() - Start
+
+    Database.close()
+
+    Results['seconds'] = Seconds
+    Results['rows'] = Rows
+    Results['rows_per_s'] = Rows / Seconds
+    Results['db_bytes'] = os.path.getsize(Filename)
+    Results['map_bytes'] = os.path.getsize(os.path.join(Directory, 'grid.map'))
+
+    return Filename, Results
+
+
+def MeasureBackend(Backend, Filename, Fixes):
+    # Returns: {'startup_ms', 'fixes_per_s', call: Summary, ...} - no lookup caches, we're measuring the lookups
+
+    Start = timeit.default_timer()
+    Database = DataBase(Backend, CacheSize=0)
+    Quietly(Database.Connect, Filename)
+    Startup = timeit.default_timer() - Start
+
+    Timings = dict((Call, []) for Call in CALLS)
+    Clock = timeit.default_timer
+    Total = 0.0
+
+    for Fix in Fixes:
+
+        Start = Clock()
+        osmid = Database.FindClosestNode(Fix)
+        Timings['FindClosestNode'].append(Clock() - Start)
+
+        if not osmid is None:
+
+            Start = Clock()
+            Database.IsIntersection(osmid)
+            Timings['IsIntersection'].append(Clock() - Start)
+
+            Start = Clock()
+            Database.FetchStreets(osmid)
+            Timings['FetchStreets'].append(Clock() - Start)
+
+    for Call in ('FindClosestNode', 'IsIntersection', 'FetchStreets'):
+        Total += sum(Timings[Call])
+
+    if not Backend == 'mapfile': # Needs geo.sqlite
+
+        for Fix in Fixes:
+
+            Start = Clock()
+            Database.FindClosestSegment(Fix)
+            Timings['FindClosestSegment'].append(Clock() - Start)
+
+    Database.Close()
+
+    Results = {'startup_ms': 1000.0 * Startup, 'fixes_per_s': len(Fixes) / Total if Total > 0 else 0.0}
+
+    for Call in CALLS:
+
+        if len(Timings[Call]) > 0:
+            Results[Call] = Summary(Timings[Call])
+
+    return Results
+
+
+def Commit():
+    # The commit we're benchmarking, if we're in a git checkout
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=open(os.devnull, 'w'),
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def Flatten(Results, Prefix=''):
+    # {'a': {'b': 1}} -> {'a.b': 1}
+
+    Flat = {}
+
+    for Key, Value in Results.items():
+
+        if isinstance(Value, dict):
+            Flat.update(Flatten(Value, Prefix + Key + '.'))
+
+        elif isinstance(Value, (int, float)) and not isinstance(Value, bool):
+            Flat[Prefix + Key] = Value
+
+    return Flat
+
+
+def Compare(Results, Baseline, Threshold):
+    # Purpose: To find what got slower (or bigger) since the baseline run
+    # Returns: [(metric, baseline value, value, change in %)] of the metrics more than Threshold % worse
+
+    if not Baseline.get('grid') == Results.get('grid'):
+        print('Warning: the baseline was run on a different grid, the numbers may not be comparable')
+
+    Before = Flatten(Baseline)
+    After = Flatten(Results)
+    Regressions = []
+
+    for Metric in sorted(set(Before) & set(After)):
+
+        if Metric.endswith('_per_s'):
+            Worse = Before[Metric] - After[Metric] # Higher is better
+
+        elif Metric.endswith('_ms') or Metric.endswith('_s') or Metric.endswith('_bytes') or Metric == 'import.seconds':
+            Worse = After[Metric] - Before[Metric] # Lower is better
+
+        else:
+            continue
+
+        if Before[Metric] > 0 and 100.0 * Worse / Before[Metric] > Threshold:
+            Regressions.append((Metric, Before[Metric], After[Metric], 100.0 * Worse / Before[Metric]))
+
+    return Regressions
+
+
+def Usage():
+
+    print('Usage: python benchmarks/suite.py [-s streets] [-b block size in m] [-n node spacing in m] [-f fixes] '
+          '[-l log] [-o results.json] [-c baseline.json] [-t percent]')
+
+
+def Main(argv):
+
+    Streets = DEFAULT_STREETS
+    Block = DEFAULT_BLOCK
+    NodeSpacing = DEFAULT_NODE_SPACING
+    FixCount = DEFAULT_FIXES
+    Log = None
+    Output = None
+    Baseline = None
+    Threshold = DEFAULT_THRESHOLD
+
+    try:
+        Options, Arguments = getopt.getopt(argv, 's:b:n:f:l:o:c:t:')
+
+    except getopt.GetoptError:
+
+        Usage()
+        return 2
+
+    for Option, Argument in Options:
+
+        if Option == '-l':
+            Log = Argument
+
+        elif Option == '-o':
+            Output = Argument
+
+        elif Option == '-c':
+            Baseline = Argument
+
+        elif not Argument.isdigit() or int(Argument) < 1:
+
+            Usage()
+            return 2
+
+        elif Option == '-s':
+            Streets = int(Argument)
+
+        elif Option == '-b':
+            Block = int(Argument)
+
+        elif Option == '-n':
+            NodeSpacing = int(Argument)
+
+        elif Option == '-f':
+            FixCount = int(Argument)
+
+        elif Option == '-t':
+            Threshold = int(Argument)
+
+    Directory = tempfile.mkdtemp()
+
+    Nodes, Ways = StreetGrid(Streets, Block / 1000.0, NodeSpacing / 1000.0)
+
+    Results = {'version': RESULTS_VERSION, 'commit': Commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version, 'platform': platform.platform(),
+               'grid': {'streets': Streets, 'block_m': Block, 'node_spacing_m': NodeSpacing, 'nodes': len(Nodes),
+                        'ways': len(Ways)}}
+
+    print('%d x %d streets, %dm blocks with a node every %dm: %d nodes, %d ways' % (
+        Streets, Streets, Block, NodeSpacing, len(Nodes), len(Ways)))
+
+    Filename, Results['import'] = ImportGrid(Directory, Nodes, Ways)
+    Import = Results['import']
+
+    print('  import (%s)  %.2f s   %d rows  %.0f rows/s   geo.sqlite %d KB   geo.map %d KB' % (
+        Import['path'], Import['seconds'], Import['rows'], Import['rows_per_s'], Import['db_bytes'] // 1024,
+        Import['map_bytes'] // 1024))
+
+    if Log is None:
+        Fixes = SyntheticFixes(Streets, Block / 1000.0, FixCount, random.Random(FixCount))
+        Results['fixes'] = {'source': 'synthetic', 'count': len(Fixes)}
+
+    else:
+        Fixes = [(Report['lat'], Report['lon']) for Report in ReadGpsLog(Log) if 'lat' in Report and 'lon' in Report]
+        Results['fixes'] = {'source': os.path.basename(Log), 'count': len(Fixes)}
+
+    print('  %d %s fixes' % (len(Fixes), Results['fixes']['source']))
+
+    Results['lookups'] = {}
+
+    for Backend in BACKENDS:
+
+        Lookups = MeasureBackend(Backend, os.path.join(Directory, 'grid.map') if Backend == 'mapfile' else Filename,
+                                 Fixes)
+        Results['lookups'][Backend] = Lookups
+
+        print('  %-8s startup %7.1f ms  %7.0f fixes/s' % (Backend, Lookups['startup_ms'], Lookups['fixes_per_s']))
+
+        for Call in CALLS:
+
+            if Call in Lookups:
+                print('    %-18s p50 %7.3f ms  p95 %7.3f ms  p99 %7.3f ms' % (
+                    Call, Lookups[Call]['p50_ms'], Lookups[Call]['p95_ms'], Lookups[Call]['p99_ms']))
+
+    os.remove(Filename)
+    os.remove(os.path.join(Directory, 'grid.map'))
+    os.rmdir(Directory)
+
+    if not Output is None:
+
+        with open(Output, 'w') as File:
+            json.dump(Results, File, indent=2, sort_keys=True)
+
+        print('Results written to ' + Output)
+
+    if not Baseline is None:
+
+        with open(Baseline) as File:
+            Regressions = Compare(Results, json.load(File), Threshold)
+
+        for Metric, Before, After, Change in Regressions:
+            print('  REGRESSION %-45s %12.3f -> %12.3f  (%+.0f%%)' % (Metric, Before, After, Change))
+
+        print('%d metrics more than %d%% worse than %s' % (len(Regressions), Threshold, Baseline))
+
+        if len(Regressions) > 0:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(Main(sys.argv[1:]))
@@ -0,0 +1,188 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Synthetic street grids for the benchmarks, fed through the real importer code (osm_importer/osm-importer.py)
+
+import os
+import sys
+import imp
+import time
+from xml.sax.saxutils import quoteattr
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIRECTORY, '..'))
+
+from geolib import PointAt
+
+ORIGIN = (43.880000, -78.820000)  # South West corner of the grid (Oshawa, ON)
+
+STREET_TYPES = ('residential', 'residential', 'tertiary', 'secondary', 'primary')
+
+
+def LoadImporter():
+    # osm-importer.py isn't a valid module name, so load it by path
+
+    return imp.load_source('osm_importer', os.path.join(BENCHMARK_DIRECTORY, '..', 'osm_importer', 'osm-importer.py'))
+
+
+def StreetGrid(Streets, StreetSpacing, NodeSpacing, Origin=ORIGIN):
+    # Purpose: To create a square grid of Streets North/South streets crossing Streets East/West streets
+    # Usage: StreetGrid(20, 0.200, 0.050) - 20 x 20 streets, 200m apart with a node every 50m (distances in km)
+    # Returns: (Nodes, Ways) in the same format the OSM Parser hands to the importer's callbacks:
+    # Nodes = [(osmid, lon, lat), ...], Ways = [(wayid, tags, refs), ...]
+
+    NodesPerBlock = max(1, int(round(StreetSpacing / NodeSpacing)))
+    Points = (Streets - 1) * NodesPerBlock + 1 # Points along each street
+
+    def NodeID(Row, Column):
+        return 1 + Row * Points + Column
+
+    Nodes = []
+    Ways = []
+    Used = set()
+
+    for Street in range(Streets):
+
+        Row = Street * NodesPerBlock # East/West street along this row of points
+        Column = Street * NodesPerBlock # North/South street along this column of points
+
+        Tags = {'highway': STREET_TYPES[Street % len(STREET_TYPES)], 'name': 'East Street ' + str(Street)}
+
+        if Street % 3 == 0:
+            Tags['maxspeed'] = '60'
+
+        Ways.append((100000 + 2 * Street, Tags, [NodeID(Row, Point) for Point in range(Points)]))
+        Used.update((Row, Point) for Point in range(Points))
+
+        Tags = {'highway': STREET_TYPES[(Street + 2) % len(STREET_TYPES)], 'name': 'North Street ' + str(Street)}
+
+        if Street % 4 == 0:
+            Tags['maxspeed'] = '50'
+            Tags['oneway'] = 'yes'
+
+        Ways.append((100001 + 2 * Street, Tags, [NodeID(Point, Column) for Point in range(Points)]))
+        Used.update((Point, Column) for Point in range(Points))
+
+    for Row, Column in sorted(Used):
+
+        Lattitude, Longitude = PointAt(PointAt(Origin, 0.0, Row * NodeSpacing), 90.0, Column * NodeSpacing)
+        Nodes.append((NodeID(Row, Column), Longitude, Lattitude))
+
+    # Plenty of the nodes in a real extract aren't part of a street (buildings, trees, ...)
+    for Extra in range(len(Nodes) // 2):
+
+        Lattitude, Longitude = PointAt(PointAt(Origin, 0.0, (Extra % Points) * NodeSpacing + NodeSpacing / 3.0), 90.0,
+                                       ((Extra * 7) % Points) * NodeSpacing + NodeSpacing / 3.0)
+        Nodes.append((10000000 + Extra, Longitude, Lattitude))
+
+    return Nodes, Ways
+
+
+def Quietly(Function, *Arguments):
+    # The importer prints as it goes, keep the benchmark output readable
+
+    Stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+
+    try:
+        return Function(*Arguments)
+
+    finally:
+        sys.stdout.close()
+        sys.stdout = Stdout
+
+
+def WriteOsmFile(Filename, Nodes, Ways):
+    # Purpose: To write synthetic data as an OSM XML file, for the importer to read like any other extract
+    # Usage: WriteOsmFile('grid.osm', *StreetGrid(20, 0.200, 0.050))
+
+    OSM = open(Filename, 'w')
+    OSM.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="benchmarks">\n')
+
+    for osmid, Longitude, Lattitude in Nodes:
+        OSM.write('<node id="%d" lat="%.7f" lon="%.7f" version="1"/>\n' % (osmid, Lattitude, Longitude))
+
+    for wayid, Tags, Refs in Ways:
+
+        OSM.write('<way id="%d" version="1">\n' % wayid)
+        OSM.write(''.join('<nd ref="%d"/>' % Ref for Ref in Refs) + '\n')
+        OSM.write(''.join('<tag k=%s v=%s/>' % (quoteattr(Key), quoteattr(Value)) for Key, Value in sorted(Tags.items())))
+        OSM.write('\n</way>\n')
+
+    OSM.write('</osm>\n')
+    OSM.close()
+
+
+def BuildDatabase(Filename, Nodes, Ways, Finish=True, Writer=False, Timings=None):
+    # Purpose: To build a geo.sqlite from synthetic data using the importer's callbacks, as if OSM Parser had read it
+    # Finish=False stops before the indexes and derived tables are built (the way databases used to be)
+    # Writer=True sends the rows to a separate writer process, the way Import does
+    # Timings={} is filled in with the seconds each step took: rows (both passes), indexes, node_streets,
+    # way_adjacency and way_segments
+
+    Importer = LoadImporter()
+
+    if os.path.exists(Filename):
+        os.remove(Filename)
+
+    OSMDataBase = Importer.DataBase()
+    OSMDataBase.Connect(Filename)
+    OSMDataBase.ApplyImportSettings()
+    OSMDataBase.DropTables()
+    OSMDataBase.CreateTable()
+
+    if Writer:
+
+        OSMDataBase.Close()
+        RowWriter = Importer.RowWriter(Filename)
+        RowWriter.start()
+        OSMDataBase.SetWriteQueue(RowWriter.Queue)
+
+    OSM = Importer.__OSMData()
+    OSM.SetDatabase(OSMDataBase)
+
+    Timings = {} if Timings is None else Timings
+    Start = time.time()
+
+    # Two passes, like Import: the ways first, then the nodes they use
+    Quietly(OSM.FoundWay, Ways)
+    Quietly(OSMDataBase.CommitChanges)
+    Quietly(OSM.FinishedWays)
+    Quietly(OSM.FoundNode, Nodes)
+    Quietly(OSMDataBase.CommitChanges)
+
+    if Writer:
+
+        RowWriter.Stop()
+        OSMDataBase.SetWriteQueue(None)
+        OSMDataBase.Connect(Filename)
+
+    Timings['rows'] = time.time() - Start
+
+    if Finish:
+
+        for Step, Create in (('indexes', OSMDataBase.CreateIndexes), ('node_streets', OSMDataBase.CreateNodeStreets),
+                             ('way_adjacency', OSMDataBase.CreateWayAdjacency),
+                             ('way_segments', OSMDataBase.CreateWaySegments)):
+
+            Start = time.time()
+            Quietly(Create)
+            Timings[Step] = time.time() - Start
+
+    OSMDataBase.Close()
+
+    return Importer
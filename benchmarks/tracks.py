@@ -0,0 +1,173 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Annotating recorded tracks (see annotate.py): random routes through a street grid with a different speed limit every
+# CHUNK_BLOCKS blocks (see speedlimits.py), written as gpsd JSON, GPX and CSV tracks. Annotated by looking up every
+# point (FindClosestNode, IsIntersection and FetchStreets) and with annotate.py on 1 to WORKERS processes. Points a
+# second, and how often the street in the output is the street the route was really on.
+# Usage: python benchmarks/tracks.py
+
+import csv
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from synthetic import BuildDatabase, Quietly
+from corridor import RandomRoute, SPEED, FIX_INTERVAL
+from speedlimits import ChunkedGrid
+from database import DataBase, LOOKUP_CACHE_SIZE
+from gpslog import ReadGpsLog, FormatTime
+import annotate
+
+TRACKS = 12
+ROUTE_BLOCKS = 15
+WORKERS = (1, 2, 4)  # As many of these as there are cores for
+START_TIME = 1415898000.0  # 2014-11-13 17:00 UTC
+
+
+def WriteTrack(Filename, Route):
+    # Write a route as a gpsd JSON, GPX or CSV log, whichever the filename says. GPX and CSV get positions and times only,
+    # annotate.py works out the speed and bearing.
+
+    Output = open(Filename, 'w')
+
+    if Filename.endswith('.gpx'):
+        Output.write('<?xml version="1.0" encoding="UTF-8"?>\n<gpx version="1.1" creator="benchmarks" '
+                     'xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>\n')
+
+    elif Filename.endswith('.csv'):
+        Output.write('time,lat,lon\n')
+
+    for Second, (Coordinates, Bearing, Name, ToIntersection) in enumerate(Route):
+
+        Time = START_TIME + Second * FIX_INTERVAL
+
+        if Filename.endswith('.gpx'):
+            Output.write('<trkpt lat="%.7f" lon="%.7f"><time>%s</time></trkpt>\n' % (Coordinates[0], Coordinates[1],
+                                                                                       FormatTime(Time)))
+
+        elif Filename.endswith('.csv'):
+            Output.write('%.1f,%.7f,%.7f\n' % (Time, Coordinates[0], Coordinates[1]))
+
+        else:
+            Output.write(json.dumps({'class': 'TPV', 'mode': 3, 'time': FormatTime(Time), 'lat': Coordinates[0],
+                                     'lon': Coordinates[1], 'speed': SPEED / 3.6, 'track': Bearing % 360.0}) + '\n')
+
+    if Filename.endswith('.gpx'):
+        Output.write('</trkseg></trk></gpx>\n')
+
+    Output.close()
+
+
+def PointByPoint(Database, Track):
+    # Before: look up every point on its own
+    # Returns: [street name or None, ...] a point
+
+    Names = []
+
+    for Report in ReadGpsLog(Track):
+
+        osmid = Database.FindClosestNode((Report['lat'], Report['lon']))
+        Streets = None if Database.IsIntersection(osmid) else Database.FetchStreets(osmid)
+
+        Names.append(Streets[0].StreetName() if Streets else None)
+
+    return Names
+
+
+def Correct(Routes, Annotated):
+    # Returns: (Points whose street is the one the route was on, points)
+
+    Right = 0
+    Points = 0
+
+    for Route, Names in zip(Routes, Annotated):
+
+        Points += len(Route)
+        Right += len([Point for Point, Name in zip(Route, Names) if Name == Point[2]])
+
+    return Right, Points
+
+
+def Main():
+
+    Directory = tempfile.mkdtemp()
+    Filename = os.path.join(Directory, 'grid.sqlite')
+
+    Nodes, Ways = ChunkedGrid()
+    BuildDatabase(Filename, Nodes, Ways)
+
+    Routes = [RandomRoute(random.Random(Route), ROUTE_BLOCKS) for Route in range(TRACKS)]
+    Tracks = [os.path.join(Directory, 'track%02d.%s' % (Route, ('json', 'gpx', 'csv')[Route % 3]))
+              for Route in range(TRACKS)]
+
+    for Track, Route in zip(Tracks, Routes):
+        WriteTrack(Track, Route)
+
+    Points = sum(len(Route) for Route in Routes)
+
+    print('%d tracks (gpsd JSON, GPX and CSV), %d points, %d cores' % (TRACKS, Points, multiprocessing.cpu_count()))
+
+    for Label, CacheSize in (('cached', LOOKUP_CACHE_SIZE), ('uncached', 0)):
+
+        Database = DataBase('sqlite', CacheSize, ReadOnly=True)
+        Quietly(Database.Connect, Filename)
+
+        Started = time.time()
+        Annotated = [PointByPoint(Database, Track) for Track in Tracks]
+        Seconds = time.time() - Started
+
+        Database.Close()
+
+        print('  point by point, %-8s %6.0f points/sec on 1 core     street right for %d of %d points   all %d looked '
+              'up' % ((Label, Points / Seconds) + Correct(Routes, Annotated) + (Points,)))
+
+    for Workers in [Workers for Workers in WORKERS if Workers <= multiprocessing.cpu_count()]:
+
+        Output = os.path.join(Directory, 'annotated')
+
+        Started = time.time()
+        Results = Quietly(annotate.Annotate, Filename, Tracks, Output, Workers)
+        Seconds = time.time() - Started
+
+        Annotated = []
+
+        for Track in Tracks:
+
+            Rows = csv.reader(open(annotate.OutputFilename(Track, Output)))
+            next(Rows) # Header
+            Annotated.append([Row[4] or None for Row in Rows])
+
+        print('  annotate.py -j %d         %6.0f points/sec, %6.0f per core   street right for %d of %d points   '
+              '%d looked up, %d speeding in %d segments' % (
+                  (Workers, Points / Seconds, Points / sum(Result['seconds'] for Result in Results)) +
+                  Correct(Routes, Annotated) + (sum(Result['lookups'] for Result in Results),
+                                                sum(Result['speeding'] for Result in Results),
+                                                sum(Result['segments'] for Result in Results))))
+
+        shutil.rmtree(Output)
+
+    shutil.rmtree(Directory)
+
+
+if __name__ == '__main__':
+
+    Main()
@@ -18,7 +18,15 @@ __author__ = 'Steve Hollaway'
 from datetime import datetime
 
 # GPS Settings
+GPS_HOST = '127.0.0.1' # Where gpsd is listening
 GPS_PORT = 1337
+GPS_DEVICE = '/dev/ttyUSB0' # USB GPS receiver
+GPS_START_GPSD = True # Start gpsd on GPS_DEVICE if nothing answers on GPS_PORT (it's left running for next time)
+GPS_RETRY_DELAY = 0.1 # Seconds before trying gpsd again, doubling each time it isn't there...
+GPS_RETRY_MAX_DELAY = 2.0 # ...up to this
+GPS_POLL_TIMEOUT = 1.0 # Longest we wait for gpsd to send something before checking whether we should stop
+GPS_REPLAY_FILE = None # Replay a recorded gpsd JSON or NMEA log instead of using the GPS receiver (see gpsreplay.py)
+GPS_REPLAY_SPEED = 1.0 # How many times faster than real time to replay it (0 for as fast as it can be read)
 
 # Time Date Settings
 FORMAT_TIME = '%I:%M (%S) %p' # ex: 12:34 (04) PM
@@ -26,6 +34,24 @@ FORMAT_DATE = '%d %b %Y - %A' # ex: 13 Nov 2014 - Monday
 
 # Database Settings
 DATABASE_LOCATIONS = 'sqlite/geo.sqlite'
+DATABASE_BACKEND = 'sqlite' # Where to search for the closest node: 'sqlite' (R-Tree on disk) or 'memory' (in-memory grid, see spatialindex.py)
+                            # or 'mapfile' to read everything from DATABASE_MAP_LOCATION instead of SQLite (see mapfile.py)
+DATABASE_MAP_LOCATION = 'sqlite/geo.map' # Written by the importer: osm-importer.py -i <inputfile> -o <outputfile> -m <mapfile>
+DATABASE_TILE_CACHE = True # Prefetch the map tiles ahead of the vehicle into memory (see database.TileCache)
+
+# Instrumentation Settings (see instrument.py)
+INSTRUMENT = False # Record how long each stage of finding our location takes
+INSTRUMENT_SNAPSHOT_FILE = None # ie. 'instrument.json' - rewritten with everything recorded every INSTRUMENT_INTERVAL seconds
+INSTRUMENT_PORT = None # ie. 1338 - stream the same to whoever connects from this machine (nc localhost 1338)
+INSTRUMENT_INTERVAL = 10.0 # Seconds
+
+# Fleet Service Settings (see fleetservice.py)
+FLEET_HOST = '127.0.0.1' # Where the service listens, ie. '0.0.0.0' for the cars to reach it from outside
+FLEET_PORT = 1339 # The cars send their gpsd JSON here
+FLEET_SOCKET = None # ie. '/tmp/dashpad-fleet.sock' - also take position streams on this local socket
+FLEET_WATCH_PORT = 1340 # Dispatch connects here for every car's street and speed limit as they change
+FLEET_CACHE_SIZE = 65536 # Nodes the shared lookup caches remember (one car gets by with a few hundred, a fleet doesn't)
+FLEET_VEHICLE_TIMEOUT = 300.0 # Seconds without a fix before we forget a car
 
 # Date / Time Functions
 def TimeStamp(): return datetime.now().strftime(FORMAT_TIME)
@@ -33,7 +59,7 @@ def DateStamp(): return datetime.now().strftime(FORMAT_DATE)
 
 def Echo(LineToEcho):
 
-    print LineToEcho
+    print(LineToEcho)
 
 
 
@@ -16,12 +16,74 @@ __author__ = 'Steve Hollaway'
 # along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
 
 import sqlite3
+import math
+import os
+import re
+import time
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
 from geolib import *
 from common import *
+from spatialindex import SpatialIndex, INT64_TYPECODE
+import instrument
 
 MAX_DISTANCE = 1.00  # 1km (We should be able to find a node within 1km of our location)
-DISTANCE_TO_EXPAND = 0.005  # Expand search box by 5 meters at a time. Small increments
+DISTANCE_GROWTH_FACTOR = 4  # Grow search box 4x each time. 20m, 80m, 320m, 1km (At most 4 queries)
 DISTANCE_TO_START_SEARCH = 0.020  # Start our search box at 20 meters.
+CANDIDATES_TO_RANK = 8  # Number of closest candidates (by approximate distance) to measure accurately
+SEGMENT_BEARING_TOLERANCE = 45  # A street segment agrees with our bearing if it runs within 45 degrees of it (either way)
+
+# Lookup Cache Settings
+LOOKUP_CACHE_SIZE = 512  # Number of nodes to remember the coordinates, streets and intersection status of
+SPEED_LOOKAHEAD_DISTANCE = 2.0  # How far past the end of the street we're on to look for speed limit changes (km)
+SPEED_LOOKAHEAD_MAX_TURN = 45  # Only follow the street on to a way that carries on within 45 degrees of our heading
+SPEED_LOOKAHEAD_CACHE_SIZE = 64  # Number of (way, direction) speed limit lookaheads to remember
+DATABASE_CHECK_INTERVAL = 5.0  # How often (in seconds) to check if the database file has been replaced or updated
+
+NOT_CACHED = object() # Returned by LRUCache.Get when there is nothing cached (None is a perfectly good cached answer)
+
+# Tile Cache Settings
+TILE_SIZE = 0.005  # Size of a map tile in degrees (About 550m North/South, 400m East/West at 44 degrees lattitude)
+TILE_LOOKAHEAD_TIME = 60  # Prefetch the tiles we'll reach within this many seconds at our current speed
+TILE_MIN_LOOKAHEAD = 0.500  # Always prefetch at least 500 meters ahead (in km)
+TILE_PREFETCH_INTERVAL = 0.5  # How often (in seconds) to check our position and prefetch
+TILE_CACHE_SIZE = 32 * 1024 * 1024  # Approximate memory cap of the tile cache in bytes
+
+# maxspeed tags
+MAXSPEED_PATTERN = re.compile(r'\s*(\d+(?:\.\d+)?)\s*(mph|knots)?', re.IGNORECASE) # ie. '50', '30 mph', '50;60'
+MPH_TO_KPH = 1.609344
+KNOTS_TO_KPH = 1.852
+
+# Approximate memory used by the rows we keep for each tile (Python objects, not bytes on disk)
+TILE_WAY_NODE_SIZE = 150  # bytes per node -> ways entry
+TILE_WAY_INFO_SIZE = 400  # bytes per way_info row
+
+
+def ParseMaxSpeed(MaxSpeed):
+    # Purpose: To read a maxspeed tag as the importer stored it, OSM has plenty that aren't a plain number
+    # Usage: ParseMaxSpeed('30 mph') ex: 48, ParseMaxSpeed('signals'), ParseMaxSpeed('CA:urban') ex: 0
+    # Returns: The speed limit in km/h (the first one if there are several), 0 if it's unknown
+
+    if isinstance(MaxSpeed, (int, float)):
+        return int(MaxSpeed)
+
+    Match = MAXSPEED_PATTERN.match(MaxSpeed or '')
+
+    if Match is None:
+        return 0 # 'signals', 'none', 'walk', 'CA:urban', ... we can't tell
+
+    Speed = float(Match.group(1))
+    Unit = (Match.group(2) or '').lower()
+
+    if Unit == 'mph':
+        Speed *= MPH_TO_KPH
+
+    elif Unit == 'knots':
+        Speed *= KNOTS_TO_KPH
+
+    return int(round(Speed))
 
 
 class Street():
@@ -33,16 +95,20 @@ class Street():
     __StreetName = None
     __MaxSpeed = int
     __TypeOfStreet = 'residental'
+    __WayID = None
 
-    def __init__(self, StreetName, IsOneWay=False, NumOfLanes=0, MaxSpeed=0, TypeOfStreet='residental'):
+    def __init__(self, StreetName, IsOneWay=False, NumOfLanes=0, MaxSpeed=0, TypeOfStreet='residental', WayID=None):
 
         # Setup street information
+        self.__WayID = WayID # OSM way the street information came from
         self.__IsOneWay = IsOneWay
         self.__NumOfLanes = NumOfLanes
         self.__TypeOfStreet = TypeOfStreet
         self.__StreetName = StreetName
 
-        if int(MaxSpeed) == 0: # Speed is not known, so lets take a guess:
+        MaxSpeed = ParseMaxSpeed(MaxSpeed)
+
+        if MaxSpeed == 0: # Speed is not known, so lets take a guess:
             
             if TypeOfStreet == 'residential':
 
@@ -80,17 +146,529 @@ class Street():
 
         return self.__StreetName
 
+    def IsOneWay(self):
+
+        return self.__IsOneWay
+
+    def TypeOfStreet(self):
+
+        return self.__TypeOfStreet
+
     def MaxSpeed(self):
+        # Returns: km/h, a guess from the type of street if SpeedIsKnown is False
 
         return self.__MaxSpeed
 
+    def WayID(self):
+
+        return self.__WayID
+
+
+class LRUCache():
+
+    # Thread safe cache that remembers the most recently used Size answers and forgets the least recently used
+
+    def __init__(self, Size=LOOKUP_CACHE_SIZE):
+
+        self.__Size = Size
+        self.__Items = OrderedDict() # Key: answer, least recently used first
+        self.__Lock = threading.Lock()
+
+        # Statistics
+        self.__Hits = 0
+        self.__Misses = 0
+        self.__Evictions = 0
+
+    def Get(self, Key):
+        # Returns the cached answer or NOT_CACHED
+
+        with self.__Lock:
+
+            Value = self.__Items.pop(Key, NOT_CACHED)
+
+            if Value is NOT_CACHED:
+                self.__Misses += 1
+
+            else:
+                self.__Items[Key] = Value # Move to the most recently used end
+                self.__Hits += 1
+
+            return Value
+
+    def Put(self, Key, Value):
+
+        with self.__Lock:
+
+            self.__Items.pop(Key, None)
+            self.__Items[Key] = Value
+
+            while len(self.__Items) > self.__Size:
+
+                self.__Items.popitem(last=False) # Forget the least recently used
+                self.__Evictions += 1
+
+    def Clear(self):
+
+        with self.__Lock:
+            self.__Items.clear()
+
+    def Statistics(self):
+
+        with self.__Lock:
+            return {'hits': self.__Hits, 'misses': self.__Misses, 'evictions': self.__Evictions,
+                    'size': len(self.__Items)}
+
+
+class Tile():
+
+    # The map data of one tile: its nodes (in a spatial index), the ways each node belongs to and the way_info of those ways
+
+    def __init__(self, Cursor, Row, Column, TileSize=TILE_SIZE):
+
+        self.Row = Row
+        self.Column = Column
+
+        SWCorner = (Row * TileSize, Column * TileSize)
+        NECorner = ((Row + 1) * TileSize, (Column + 1) * TileSize)
+        Box = (SWCorner[1], NECorner[1], SWCorner[0], NECorner[0])
+
+        self.Index = SpatialIndex()
+        self.Index.Load(Cursor, SWCorner, NECorner)
+
+        self.Ways = {} # osmid: list of wayids the node belongs to
+        self.WayInfo = {} # wayid: (street_name, num_of_lanes, maxspeed, street_type, oneway)
+
+        # The same nodes as the index (see SpatialIndex.Load)
+        Cursor.execute('''SELECT osmid, wayid, street_name, num_of_lanes, maxspeed, street_type, oneway
+        FROM node_streets WHERE osmid IN
+        (SELECT osmid FROM nodes WHERE min_lon>=? AND min_lon<? AND min_lat>=? AND min_lat<?);''', Box)
+
+        for NodeStreet in Cursor:
+
+            self.Ways.setdefault(NodeStreet[0], []).append(NodeStreet[1])
+            self.WayInfo[NodeStreet[1]] = NodeStreet[2:]
+
+        self.Size = (self.Index.MemoryUsage() + len(self.Ways) * TILE_WAY_NODE_SIZE +
+                     len(self.WayInfo) * TILE_WAY_INFO_SIZE)
+
+
+class TileCache(threading.Thread):
+
+    # Keeps the map tiles around and ahead of the vehicle in memory.
+    # A background thread watches our position, bearing and speed and loads the tiles we are about to drive into
+    # (with its own connection to the database) so the lookups don't have to wait on the disk. The least recently used
+    # tiles (the ones behind us) are dropped once the cache grows past its memory cap.
+
+    def __init__(self, Filename, GPSDevice, TileSize=TILE_SIZE, LookaheadTime=TILE_LOOKAHEAD_TIME,
+                 MemoryLimit=TILE_CACHE_SIZE):
+
+        # Initialize Threading
+        threading.Thread.__init__(self)
+        self.daemon = True # Set as a daemon thread to run in background
+
+        self.__Filename = Filename
+        self.__GPSDevice = GPSDevice
+        self.__TileSize = float(TileSize)
+        self.__LookaheadTime = LookaheadTime
+        self.__MemoryLimit = MemoryLimit
+
+        self.__Tiles = OrderedDict() # (row, column): Tile, least recently used first
+        self.__Size = 0 # Approximate memory used by the tiles
+        self.__Lock = threading.Lock() # The tiles are shared between the prefetch thread and the lookups
+        self.__Wakeup = threading.Event() # Set to prefetch straight away instead of waiting for the next interval
+        self.__Running = True
+        self.__LastTile = None # Tile that answered the last nearest node search (most likely to hold the next node asked about)
+
+        # Statistics
+        self.__Hits = 0 # Lookups answered from the cache
+        self.__Misses = 0 # Lookups that had to go to the database
+        self.__Loads = 0 # Tiles loaded
+        self.__Evictions = 0 # Tiles dropped to stay under the memory cap
+
+    def __TileOf(self, Coordinates):
+
+        return int(math.floor(Coordinates[0] / self.__TileSize)), int(math.floor(Coordinates[1] / self.__TileSize))
+
+    def __Get(self, Key):
+        # Returns the tile and marks it as recently used, or None if it isn't loaded
+
+        with self.__Lock:
+
+            Tile = self.__Tiles.pop(Key, None)
+
+            if not Tile is None:
+                self.__Tiles[Key] = Tile # Move to the most recently used end
+
+            return Tile
+
+    def __Hit(self):
+
+        with self.__Lock: # Lookups can come from more than one thread
+            self.__Hits += 1
+
+    def __Miss(self):
+
+        with self.__Lock:
+            self.__Misses += 1
+
+        self.__Wakeup.set() # Go and fetch whatever we're missing
+
+    def FindClosestNodes(self, Coordinates, Count, MaxDistance):
+        # Purpose: Same as DataBase.FindClosestNodes, from the tiles in memory
+        # Returns: A list of up to Count (osmid, distance in km) tuples sorted closest first, or None if the tiles
+        # needed to be sure of the answer aren't loaded
+
+        Row, Column = self.__TileOf(Coordinates)
+        Tile = self.__Get((Row, Column))
+
+        if Tile is None:
+            self.__Miss()
+            return None
+
+        Nodes = Tile.Index.FindClosestNodes(Coordinates, Count, MaxDistance)
+
+        # How far we are from the edge of our tile. Anything outside of it is at least this far away.
+        SWCorner = (Row * self.__TileSize, Column * self.__TileSize)
+        NECorner = ((Row + 1) * self.__TileSize, (Column + 1) * self.__TileSize)
+
+        ToEdge = min(DistancesFrom(Coordinates, [(SWCorner[0], Coordinates[1]), (NECorner[0], Coordinates[1]),
+                                                 (Coordinates[0], SWCorner[1]), (Coordinates[0], NECorner[1])]))
+
+        if len(Nodes) < Count or Nodes[-1][1] > ToEdge:
+
+            # The closest nodes might be in a neighbouring tile. The tiles around us are prefetched as well, and
+            # nothing closer than TileSize is outside of them.
+            Wanted = MaxDistance if len(Nodes) < Count else Nodes[-1][1]
+
+            # Width of a tile East/West (the narrow way) where we are, as far as the neighbours can answer for
+            TileWidth = DistanceBetween(Coordinates, (Coordinates[0], Coordinates[1] + self.__TileSize))
+            SearchDistance = min(Wanted, TileWidth)
+
+            for RowOffset in (-1, 0, 1):
+                for ColumnOffset in (-1, 0, 1):
+
+                    if RowOffset == 0 and ColumnOffset == 0:
+                        continue
+
+                    Neighbour = self.__Get((Row + RowOffset, Column + ColumnOffset))
+
+                    if Neighbour is None:
+                        self.__Miss()
+                        return None
+
+                    Nodes.extend(Neighbour.Index.FindClosestNodes(Coordinates, Count, SearchDistance))
+
+            Nodes.sort(key=lambda Node: Node[1])
+            Nodes = Nodes[:Count]
+
+            # Short of Count within the tiles around us (ie. open road), there might be more further out
+            if SearchDistance < Wanted and (len(Nodes) < Count or Nodes[-1][1] > SearchDistance):
+                self.__Miss()
+                return None
+
+        with self.__Lock: # Cleared by the prefetch thread when the tile is dropped (see run)
+            self.__LastTile = Tile
+
+        self.__Hit()
+
+        return Nodes
+
+    def WaysOfNode(self, osmid):
+        # Purpose: To find the ways a node belongs to and their way_info rows
+        # Returns: A list of (wayid, (street_name, num_of_lanes, maxspeed, street_type, oneway)) tuples (way_info is None
+        # if the way has no information), or None if the node isn't in a loaded tile
+
+        with self.__Lock:
+            Tile = self.__LastTile
+
+        if Tile is None or not osmid in Tile.Ways:
+
+            with self.__Lock:
+                Tiles = list(self.__Tiles.values())
+
+            Tile = None
+
+            for Candidate in reversed(Tiles): # Most recently used first
+
+                if osmid in Candidate.Ways:
+                    Tile = Candidate
+                    break
+
+        if Tile is None:
+            self.__Miss()
+            return None
+
+        self.__Hit()
+
+        return [(wayid, Tile.WayInfo.get(wayid)) for wayid in Tile.Ways[osmid]]
+
+    def Statistics(self):
+        # Hit/miss counters used to tune the tile size and lookahead
+
+        with self.__Lock:
+            return {'hits': self.__Hits, 'misses': self.__Misses, 'loads': self.__Loads,
+                    'evictions': self.__Evictions, 'tiles': len(self.__Tiles), 'size': self.__Size}
+
+    def __TilesAhead(self):
+        # Returns the tiles we want loaded, most urgent first: the tiles around us, then the tiles along our bearing
+
+        Fix = self.__GPSDevice.LatestFix() # All from the same fix (see gpsfix.py)
+
+        if Fix is None:
+            return [] # No fix yet
+
+        Lattitude, Longitude, Bearing, Speed = Fix.lat, Fix.lon, Fix.track, Fix.speed
+        Location = (Lattitude, Longitude)
+        Row, Column = self.__TileOf(Location)
+
+        Wanted = []
+
+        for RowOffset in (0, -1, 1):
+            for ColumnOffset in (0, -1, 1):
+                Wanted.append((Row + RowOffset, Column + ColumnOffset))
+
+        if isinstance(Bearing, (int, float)) and isinstance(Speed, (int, float)):
+
+            Lookahead = max(TILE_MIN_LOOKAHEAD, Speed * self.__LookaheadTime / 3600.0) # km/hr -> km
+            Step = DistanceBetween(Location, (Lattitude + self.__TileSize, Longitude)) / 2.0 # Half a tile (North/South)
+
+            Distance = Step
+
+            while Distance <= Lookahead:
+
+                AheadRow, AheadColumn = self.__TileOf(PointAt(Location, Bearing, Distance))
+
+                # The tile ahead and its neighbours, so a search near the edge of a tile can be answered from memory
+                for RowOffset in (0, -1, 1):
+                    for ColumnOffset in (0, -1, 1):
+
+                        Key = (AheadRow + RowOffset, AheadColumn + ColumnOffset)
+
+                        if not Key in Wanted:
+                            Wanted.append(Key)
+
+                Distance += Step
+
+        return Wanted
+
+    # Function Over-ride - Called when thread is started
+    def run(self):
+
+        Database = sqlite3.connect(self.__Filename) # Our own connection, the lookups keep using theirs
+        Cursor = Database.cursor()
+
+        while self.__Running:
+
+            self.__Wakeup.wait(TILE_PREFETCH_INTERVAL)
+            self.__Wakeup.clear()
+
+            Wanted = self.__TilesAhead()
+
+            for Key in Wanted:
+
+                with self.__Lock: # The lookups reorder the tiles as they use them (see __Get)
+                    Loaded = Key in self.__Tiles
+
+                if Loaded:
+                    continue
+
+                NewTile = Tile(Cursor, Key[0], Key[1], self.__TileSize)
+
+                with self.__Lock:
+
+                    self.__Tiles[Key] = NewTile
+                    self.__Size += NewTile.Size
+                    self.__Loads += 1
+
+                    # Drop the least recently used tiles (the ones behind us) to stay under our memory cap
+                    while self.__Size > self.__MemoryLimit and len(self.__Tiles) > 1:
+
+                        OldKey, OldTile = self.__Tiles.popitem(last=False)
+                        self.__Size -= OldTile.Size
+                        self.__Evictions += 1
+
+                        if OldTile is self.__LastTile:
+                            self.__LastTile = None
+
+                    Full = self.__Size > self.__MemoryLimit * 0.9
+
+                # Once the tiles we want no longer fit, stop rather than throw away the more urgent tiles we just loaded
+                if Full:
+                    break
+
+            # Mark the tiles we want as recently used, most urgent last, so they are the last to go
+            for Key in reversed(Wanted):
+                self.__Get(Key)
+
+        Database.close()
+
+    def Close(self):
+
+        self.__Running = False # Stop prefetching
+        self.__Wakeup.set()
+
+
+class StreetGraph():
+
+    # In-memory graph of the intersections: the ways that meet at each one and the nodes on either side of it along each
+    # way (see way_adjacency in osm-importer.py). Kept in compact arrays sorted by osmid like SpatialIndex, so it costs
+    # about 32 bytes per way at each intersection plus one Street per way that has an intersection.
+
+    def __init__(self):
+
+        self.__OSMIDs = array(INT64_TYPECODE) # Sorted osmids of the intersections
+        self.__Starts = array('i') # Position of each intersection's first way in the arrays below (plus one past the end)
+        self.__WayIDs = array(INT64_TYPECODE) # Ways meeting at each intersection
+        self.__Previous = array(INT64_TYPECODE) # Node before the intersection along the way (0 at the start of the way)
+        self.__Next = array(INT64_TYPECODE) # Node after the intersection along the way (0 at the end of the way)
+        self.__Streets = {} # wayid: Street
+
+    def Load(self, Cursor):
+        # Purpose: To build the graph from the way_adjacency and way_info tables of geo.sqlite, replacing whatever it held
+        # (see DataBase.Connect reloading it when the database file changes)
+        # Usage: Load(Database.cursor())
+
+        OSMIDs = array(INT64_TYPECODE)
+        Starts = array('i')
+        WayIDs = array(INT64_TYPECODE)
+        PreviousNodes = array(INT64_TYPECODE)
+        NextNodes = array(INT64_TYPECODE)
+        Streets = {}
+
+        Cursor.execute('''SELECT osmid, wayid, coalesce(previous_osmid, 0), coalesce(next_osmid, 0) FROM way_adjacency
+        ORDER BY osmid, wayid, orderid;''')
+
+        for osmid, wayid, Previous, Next in Cursor:
+
+            if len(OSMIDs) == 0 or not OSMIDs[-1] == osmid:
+
+                OSMIDs.append(osmid)
+                Starts.append(len(WayIDs))
+
+            WayIDs.append(wayid)
+            PreviousNodes.append(Previous)
+            NextNodes.append(Next)
+
+        Starts.append(len(WayIDs))
+
+        Cursor.execute('''SELECT wayid, street_name, num_of_lanes, maxspeed, street_type, oneway FROM way_info
+        WHERE wayid IN (SELECT wayid FROM way_adjacency);''')
+
+        for WayInfo in Cursor:
+
+            if not WayInfo[0] in Streets: # Only the first row of a way counts, the same as the way_info queries
+                Streets[WayInfo[0]] = Street(WayInfo[1], bool(WayInfo[5]), WayInfo[2], WayInfo[3], WayInfo[4], WayInfo[0])
+
+        # Swap the new graph in only once it's complete
+        self.__OSMIDs, self.__Starts, self.__WayIDs = OSMIDs, Starts, WayIDs
+        self.__Previous, self.__Next, self.__Streets = PreviousNodes, NextNodes, Streets
+
+    def Clear(self):
+        # Purpose: To forget every intersection (the database no longer has way_adjacency)
+
+        self.__init__()
+
+    def IntersectionCount(self):
+
+        return len(self.__OSMIDs)
+
+    def IsIntersection(self, osmid):
+
+        Position = bisect_left(self.__OSMIDs, osmid)
+
+        return Position < len(self.__OSMIDs) and self.__OSMIDs[Position] == osmid
+
+    def WaysAt(self, osmid):
+        # Returns: A list of (wayid, previous osmid, next osmid) of the ways meeting at an intersection (0 at the ends of
+        # a way), an empty list if osmid isn't an intersection
+
+        Position = bisect_left(self.__OSMIDs, osmid)
+
+        if Position == len(self.__OSMIDs) or not self.__OSMIDs[Position] == osmid:
+            return []
+
+        return [(self.__WayIDs[Way], self.__Previous[Way], self.__Next[Way])
+                for Way in range(self.__Starts[Position], self.__Starts[Position + 1])]
+
+    def Street(self, wayid):
+
+        return self.__Streets.get(wayid)
+
+    def Resolve(self, osmid, LastKnownWayID=None, LastKnownNodeID=None):
+        # Purpose: To work out which street we're on at an intersection and what the cross streets are
+        # Usage: Resolve(Intersection, LastKnownWayID, LastKnownNodeID) where the last known way and node are from the last
+        # node we passed that wasn't an intersection (it only belongs to the street we were on)
+        # Returns: (Street we're on or None if we can't tell, [cross Streets])
+
+        Ways = self.WaysAt(osmid)
+        Current = None
+
+        for wayid, Previous, Next in Ways:
+
+            if wayid == LastKnownWayID:
+                Current = wayid
+                break
+
+        if Current is None and not LastKnownNodeID is None:
+
+            for wayid, Previous, Next in Ways:
+
+                if LastKnownNodeID == Previous or LastKnownNodeID == Next: # We came from the next node along this way
+                    Current = wayid
+                    break
+
+        CurrentStreet = self.Street(Current)
+        CrossStreets = []
+        Names = set()
+
+        if not CurrentStreet is None:
+            Names.add(CurrentStreet.StreetName()) # A street is often split into two ways where another street crosses
+
+        for wayid, Previous, Next in Ways:
+
+            CrossStreet = self.Street(wayid)
+
+            if not CrossStreet is None and not CrossStreet.StreetName() in Names:
+
+                Names.add(CrossStreet.StreetName())
+                CrossStreets.append(CrossStreet)
+
+        return CurrentStreet, CrossStreets
+
 
 class DataBase():
     
-    def __init__(self):
-        
+    def __init__(self, Backend=DATABASE_BACKEND, CacheSize=LOOKUP_CACHE_SIZE, ReadOnly=False, WatchFile=True):
+        # ReadOnly=True refuses to change the database file (ie. one connection for each of annotate.py's processes)
+        # WatchFile=False never reconnects when the database file is replaced or updated, it takes a restart (ie. a
+        # service that can't stop every lookup while the map reloads)
+
+        if not Backend in ('sqlite', 'memory', 'mapfile'):
+            raise Exception('Unknown database backend: ' + str(Backend))
+
+        # Search for nodes with the R-Tree in SQLite, with an in-memory index, or use a memory mapped map file instead
+        # of SQLite altogether (see mapfile.py)
+        self.__Backend = Backend
+        self.__ReadOnly = ReadOnly
+        self.__WatchFile = WatchFile
         self.__Database = None # Database Object
         self.__Cursor = None # Cursor Object used to search databases
+        self.__Index = None # In-memory spatial index of the nodes (memory backend only)
+        self.__Map = None # Memory mapped map file (mapfile backend only)
+        self.__Filename = None # Database file we're connected to
+        self.__TileCache = None # Prefetches map tiles ahead of the vehicle (see StartTileCache)
+        self.__GPSDevice = None # GPS device the tile cache follows
+
+        # Remember the answers for the nodes we asked about most recently (we ask about the same few over and over
+        # while we're stopped at a light or crawling in traffic)
+        self.__CoordinatesCache = LRUCache(CacheSize)
+        self.__IntersectionCache = LRUCache(CacheSize)
+        self.__StreetCache = LRUCache(CacheSize)
+        self.__SpeedLimitCache = LRUCache(SPEED_LOOKAHEAD_CACHE_SIZE) # (wayid, forward): speed limit changes ahead
+
+        self.__StreetGraphs = [] # Every StreetGraph we've loaded, reloaded when we reconnect (see LoadStreetGraph)
+        self.__FileSignature = None # Identifies the version of the database file we're connected to
+        self.__LastFileCheck = 0 # When we last checked if the database file was replaced
 
 
     def __del__(self): # Cleanup
@@ -100,28 +678,159 @@ class DataBase():
             self.__Database.commit() # Commit the changes to the database
             self.__Database.close() # Close the database
 
-    def Connect(self):
+    def Connect(self, Filename=None):
+
+        if Filename is None:
+            Filename = DATABASE_MAP_LOCATION if self.__Backend == 'mapfile' else DATABASE_LOCATIONS
+
+        if not self.__Database is None: # Reconnecting
+            self.__Database.close()
+            self.__Database = None
+
+        if not self.__Map is None:
+            self.__Map.Close()
+            self.__Map = None
+
+        # Anything we remember is from the old connection
+        self.__CoordinatesCache.Clear()
+        self.__IntersectionCache.Clear()
+        self.__StreetCache.Clear()
+        self.__SpeedLimitCache.Clear()
 
-        self.__Database = sqlite3.connect(DATABASE_LOCATIONS, check_same_thread=False)  # Connect to database
+        self.__Filename = Filename
+        self.__FileSignature = self.__Signature()
+        self.__LastFileCheck = time.time()
+
+        if self.__Backend == 'mapfile':
+
+            from mapfile import MapFile # Only needed with this backend
+
+            self.__Map = MapFile(Filename)
+
+            Echo('Mapped ' + str(self.__Map.NodeCount()) + ' nodes and ' + str(self.__Map.WayCount()) + ' ways (' +
+                 str(self.__Map.FileSize() // 1024) + ' KB)')
+
+            return
+
+        self.__Database = sqlite3.connect(Filename, check_same_thread=False)  # Connect to database
         self.__Cursor = self.__Database.cursor()  # Get a cursor so we can work with our database
 
+        if self.__ReadOnly:
+            self.__Cursor.execute('PRAGMA query_only = ON;') # Anything that would write fails instead
+
+        if self.__Backend == 'memory':
+
+            self.__Index = SpatialIndex()
+            self.__Index.Load(self.__Database.cursor()) # Build the index from the nodes table
+
+            Echo('Loaded ' + str(self.__Index.NodeCount()) + ' nodes into memory (' +
+                 str(self.__Index.MemoryUsage() // 1024) + ' KB)')
+
+        if not self.__TileCache is None: # The tiles are from the old connection, start over
+            self.__TileCache.Close()
+            self.StartTileCache(self.__GPSDevice)
+
+        for Graph in self.__StreetGraphs: # The intersections are from the old connection too
+            self.__LoadStreetGraph(Graph)
+
+
+    def __Signature(self):
+        # Changes when the database file is replaced (new inode) or updated in place (new modification time / size)
+
+        try:
+            Status = os.stat(self.__Filename)
+
+        except OSError:
+            return None
+
+        return Status.st_ino, Status.st_mtime, Status.st_size
+
+
+    def __CheckDatabaseFile(self):
+        # Reconnect (and forget everything we cached) if the database file has been replaced or updated
+
+        if not self.__WatchFile:
+            return
+
+        Now = time.time()
+
+        if Now - self.__LastFileCheck < DATABASE_CHECK_INTERVAL:
+            return
+
+        self.__LastFileCheck = Now
+
+        Signature = self.__Signature()
+
+        if not Signature is None and not Signature == self.__FileSignature:
+
+            Echo('Database file changed, reconnecting: ' + self.__Filename)
+            self.Connect(self.__Filename)
+
+
+    def CacheStatistics(self):
+        # Hit/miss/eviction counters of the lookup caches
+
+        return {'coordinates': self.__CoordinatesCache.Statistics(),
+                'intersections': self.__IntersectionCache.Statistics(),
+                'streets': self.__StreetCache.Statistics(),
+                'speed_limits': self.__SpeedLimitCache.Statistics()}
+
+
+    def StartTileCache(self, GPSDevice):
+        # Purpose: To start prefetching the map tiles ahead of the vehicle so lookups are answered from memory
+        # Usage: StartTileCache(GpsModule())
+
+        if not self.__Map is None:
+            return # The map file is already read straight from the OS page cache
+
+        self.__GPSDevice = GPSDevice
+        self.__TileCache = TileCache(self.__Filename, GPSDevice)
+        self.__TileCache.start() # Start a new thread and execute TileCache.run()
+
+
+    def TileCacheStatistics(self):
+
+        if self.__TileCache is None:
+            return None
+
+        return self.__TileCache.Statistics()
+
 
     def CommitChanges(self):
 
-        self.__Database.commit()  # Commit changes to database
+        if not self.__Database is None:
+            self.__Database.commit()  # Commit changes to database
 
 
     def GetNodeCoordinates(self, osmid):
 
-        Echo('Retrieving node coordinates for OSMID: ' + osmid)
+        self.__CheckDatabaseFile()
+
+        Coordinates = self.__CoordinatesCache.Get(osmid)
+
+        if Coordinates is NOT_CACHED:
+
+            Coordinates = self.__LookupNodeCoordinates(osmid)
+            self.__CoordinatesCache.Put(osmid, Coordinates)
+
+        return Coordinates
 
-        self.__Cursor.execute('''SELECT lat, lon FROM nodes WHERE osmid=?;''', (osmid,))
+
+    def __LookupNodeCoordinates(self, osmid):
+
+        Echo('Retrieving node coordinates for OSMID: ' + str(osmid))
+
+        if not self.__Map is None:
+            return self.__Map.NodeCoordinates(osmid)
+
+        # A node is stored in the R-Tree as a box with no size (min == max) so either corner is the node itself
+        self.__Cursor.execute('''SELECT min_lat, min_lon FROM nodes WHERE osmid=?;''', (osmid,))
 
         Node = self.__Cursor.fetchone()
 
         if not Node is None:
 
-            Echo('Node coordinates for:' + osmid + Node[0] + Node[1])
+            Echo('Node coordinates for: ' + str(osmid) + ' ' + str(Node[0]) + ', ' + str(Node[1]))
             return Node[0], Node[1]
 
         else:
@@ -131,12 +840,43 @@ class DataBase():
 
     def IsIntersection(self, osmid):
 
+        Started = instrument.Start()
+
+        self.__CheckDatabaseFile()
+
+        Intersection = self.__IntersectionCache.Get(osmid)
+
+        if Intersection is NOT_CACHED:
+
+            Intersection = self.__LookupIsIntersection(osmid)
+            self.__IntersectionCache.Put(osmid, Intersection)
+
+        instrument.Stop('database.is_intersection', Started)
+
+        return Intersection
+
+
+    def __LookupIsIntersection(self, osmid):
+
         # Find out how many 'ways' the node belongs to. If the count is greater than 1 then it is an intersection.
         # If 1 is returned the function will report false because 1-1 is 0. Anything non zero is true.
 
-        self.__Cursor.execute('''SELECT count(wayid) FROM way_nodes WHERE osmid=?;''', (osmid,))
+        if not self.__Map is None:
+            return bool((self.__Map.WayCountOfNode(osmid) or 1) - 1) # None if not part of any street
+
+        if not self.__TileCache is None:
+
+            Ways = self.__TileCache.WaysOfNode(osmid)
+
+            if not Ways is None:
+                return len(Ways) > 1
+
+        self.__Cursor.execute('''SELECT way_count FROM node_streets WHERE osmid=? LIMIT 1;''', (osmid,))
         NodeCount = self.__Cursor.fetchone()
 
+        if NodeCount is None: # Not part of any street
+            return False
+
         return bool(int(NodeCount[0])-1)
 
 
@@ -164,29 +904,56 @@ class DataBase():
 
     def FetchStreets(self, osmid):
 
+        Started = instrument.Start()
+
+        self.__CheckDatabaseFile()
+
+        Streets = self.__StreetCache.Get(osmid)
+
+        if Streets is NOT_CACHED:
+
+            Streets = self.__LookupStreets(osmid)
+            self.__StreetCache.Put(osmid, Streets)
+
+        instrument.Stop('database.fetch_streets', Started)
+
+        if Streets is None:
+            return None
+
+        return list(Streets) # The caller gets their own list, the Street objects themselves are never changed
+
+
+    def __LookupStreets(self, osmid):
+
         # print 'Fetching Street Names Connected to OSMID: ', osmid
 
-        self.__Cursor.execute('''SELECT wayid FROM way_nodes WHERE osmid=?;''', (osmid,))
+        if not self.__Map is None:
+            Ways = self.__Map.WaysOfNode(osmid) or []
 
-        Ways = self.__Cursor.fetchall() # Find all the 'ways'
+        elif not self.__TileCache is None:
+            Ways = self.__TileCache.WaysOfNode(osmid)
 
-        Streets = [] # Create a new list to store the streets we found
+        else:
+            Ways = None
 
-        if not len(Ways) == 0:  # Did we find any ways that match our query?
+        if not Ways is None: # From memory
 
-            for Way in Ways:
+            if len(Ways) == 0:
+                return None
 
-                self.__Cursor.execute(
-                    '''SELECT street_name, num_of_lanes, maxspeed, street_type, oneway FROM way_info WHERE wayid=?;''',
-                    (Way[0],))
+            return [Street(WayInfo[0], bool(WayInfo[4]), WayInfo[1], WayInfo[2], WayInfo[3], wayid)
+                    for wayid, WayInfo in Ways if not WayInfo is None]
+
+        # One row per street the node belongs to (see node_streets in osm-importer.py)
+        self.__Cursor.execute('''SELECT street_name, num_of_lanes, maxspeed, street_type, oneway, wayid FROM node_streets
+        WHERE osmid=?;''', (osmid,))
 
-                WayInfo = self.__Cursor.fetchone()
+        Ways = self.__Cursor.fetchall() # Find all the 'ways'
 
-                if not WayInfo is None:
-                    Streets.append(Street(WayInfo[0], bool(WayInfo[4]), WayInfo[1], WayInfo[2], WayInfo[3]))
+        if not len(Ways) == 0:  # Did we find any ways that match our query?
 
             # print 'Done! Finished Fetching Street Names.'
-            return Streets
+            return [Street(WayInfo[0], bool(WayInfo[4]), WayInfo[1], WayInfo[2], WayInfo[3], WayInfo[5]) for WayInfo in Ways]
 
         else:
 
@@ -195,63 +962,349 @@ class DataBase():
 
 
     def FindClosestNode(self, Coordinates):
-        # Lets create a box around our location starting with a small box and expanding as necessary
+
+        # Returns the OSMID of the node closest to our location or None if nothing is within MAX_DISTANCE
+
+        Node = self.FindClosestNodeWithDistance(Coordinates)
+
+        if Node is None:
+            return None # We didn't find anything...
+
+        return Node[0]
+
+
+    def FindClosestNodeWithDistance(self, Coordinates):
+        # Purpose: To find the node closest to our location and how far away it is
+        # Usage: FindClosestNodeWithDistance((43.894655, -78.802791))
+        # Returns: (osmid, distance in km) or None if no node is within MAX_DISTANCE
+
+        Nodes = self.FindClosestNodes(Coordinates, 1)
+
+        if len(Nodes) == 0:
+            return None # We didn't find anything...
+
+        return Nodes[0]
+
+
+    def FindClosestNodes(self, Coordinates, Count):
+        # Purpose: To find the closest nodes to our location
+        # Usage: FindClosestNodes((43.894655, -78.802791), 5)
+        # Returns: A list of up to Count (osmid, distance in km) tuples sorted closest first
+
+        Started = instrument.Start()
+
+        Nodes = self.__FindClosestNodes(Coordinates, Count)
+
+        instrument.Stop('database.closest_nodes', Started)
+
+        return Nodes
+
+
+    def __FindClosestNodes(self, Coordinates, Count):
+
+        if not self.__Index is None:
+            return self.__Index.FindClosestNodes(Coordinates, Count, MAX_DISTANCE)
+
+        if not self.__Map is None:
+            return self.__Map.FindClosestNodes(Coordinates, Count, MAX_DISTANCE)
+
+        if not self.__TileCache is None:
+
+            Nodes = self.__TileCache.FindClosestNodes(Coordinates, Count, MAX_DISTANCE)
+
+            if not Nodes is None:
+                return Nodes
+
+        # Lets create a box around our location starting with a small box and growing it 4x at a time so we never run
+        # more than a handful of queries. The R-Tree finds the nodes inside the box and SQLite ranks them using a flat
+        # (equirectangular) approximation of their distance, so we only measure the few closest ones accurately.
+
+        Lattitude = float(Coordinates[0])
+        Longitude = float(Coordinates[1])
+
+        # At short distances a degree of longitude is only cos(lattitude) as long as a degree of lattitude
+        LongitudeScale = math.cos(math.radians(Lattitude)) ** 2
 
         Distance = DISTANCE_TO_START_SEARCH  # Start our search within a 20 meter (default) box of our given location
 
-        while Distance <= MAX_DISTANCE:
+        while True:
 
-            # print '\nSeach Radius of: ', Distance, 'meters'
             SWCorner, NECorner = CreateBox(Distance, Coordinates)
 
-            # print 'SELECT osmid FROM nodes WHERE lon>=' + str(SWCorner[1]) + ' AND lon<= ' + str(NECorner[1]) + \
-            # ' AND lat>=' + str(SWCorner[0]) + ' AND lat<= ' + str(NECorner[0]) + ';'
+            self.__Cursor.execute(
+                '''SELECT osmid, min_lat, min_lon FROM nodes
+                WHERE min_lon>=? AND max_lon<=? AND min_lat>=? AND max_lat<=?
+                ORDER BY (min_lat-?)*(min_lat-?) + (min_lon-?)*(min_lon-?)*? LIMIT ?;''',
+                (float(SWCorner[1]), float(NECorner[1]), float(SWCorner[0]), float(NECorner[0]),
+                 Lattitude, Lattitude, Longitude, Longitude, LongitudeScale, max(CANDIDATES_TO_RANK, 2 * Count)))
+
+            Rows = self.__Cursor.fetchall()
+
+            Nodes = list(zip([Row[0] for Row in Rows], DistancesFrom(Coordinates, [(Row[1], Row[2]) for Row in Rows])))
+            Nodes.sort(key=lambda Node: Node[1])
+            Nodes = Nodes[:Count]
+
+            # A node in the corner of the box can be further away than a node just outside of the box. Only when the
+            # closest nodes are within the search distance do we know nothing outside of the box could be closer.
+            if len(Nodes) == Count and Nodes[-1][1] <= Distance:
+                return Nodes
+
+            if Distance >= MAX_DISTANCE:
+                return [Node for Node in Nodes if Node[1] <= MAX_DISTANCE] # Whatever we found (if anything) within MAX_DISTANCE
+
+            Distance = min(Distance * DISTANCE_GROWTH_FACTOR, MAX_DISTANCE)  # Grow our box
+
+
+    def LoadStreetGraph(self):
+        # Purpose: To load the intersections into memory (see StreetGraph). The graph is reloaded in place whenever we
+        # reconnect to a changed database file (see __CheckDatabaseFile), so whoever holds it keeps the current map.
+        # Returns: StreetGraph, or None with the mapfile backend or a database from before way_adjacency
+
+        if self.__Cursor is None:
+            return None
+
+        Graph = StreetGraph()
+
+        if not self.__LoadStreetGraph(Graph):
+            return None
+
+        self.__StreetGraphs.append(Graph)
+
+        return Graph
+
 
+    def __LoadStreetGraph(self, Graph):
+        # Returns: False if the database has no way_adjacency table (the graph is left empty)
+
+        self.__Cursor.execute('''SELECT count(*) FROM sqlite_master WHERE name='way_adjacency';''')
+
+        if self.__Cursor.fetchone()[0] == 0:
+
+            Graph.Clear()
+            return False
+
+        Graph.Load(self.__Database.cursor())
+
+        Echo('Loaded ' + str(Graph.IntersectionCount()) + ' intersections into memory')
+
+        return True
+
+
+    def FindClosestSegment(self, Coordinates, Bearing=None):
+        # Purpose: To find the street we're on: the closest piece of street between two nodes (see way_segments in
+        # osm-importer.py). Unlike the closest node this doesn't depend on how far apart the nodes of a street are.
+        # Usage: FindClosestSegment((43.894655, -78.802791)) or FindClosestSegment((43.894655, -78.802791), Gps.Bearing())
+        # to only consider the streets running the same way we are (in either direction)
+        # Returns: (wayid, Street, (Lattitude, Longitude) of the closest point on the street, distance to it in km,
+        # (osmid, osmid) of the nodes at each end of the segment) or None if no street is within MAX_DISTANCE
+        # Needs geo.sqlite, so None with the mapfile backend
+
+        Started = instrument.Start()
+
+        Segment = self.__FindClosestSegment(Coordinates, Bearing)
+
+        instrument.Stop('database.closest_segment', Started)
+
+        return Segment
+
+
+    def __FindClosestSegment(self, Coordinates, Bearing):
+
+        if self.__Cursor is None:
+            return None
+
+        Distance = DISTANCE_TO_START_SEARCH
+
+        while True:
+
+            SWCorner, NECorner = CreateBox(Distance, Coordinates)
+
+            # Every segment that passes within Distance of us has a bounding box that overlaps our search box
             self.__Cursor.execute(
-                '''SELECT osmid, lat, lon FROM nodes WHERE lon>=? AND lon <=? AND lat>=? AND lat <=?;''',
-                (float(SWCorner[1]), float(NECorner[1]), float(SWCorner[0]), float(NECorner[0])))
+                '''SELECT segments.wayid, from_osmid, to_osmid, from_lat, from_lon, to_lat, to_lon,
+                street_name, num_of_lanes, maxspeed, street_type, oneway
+                FROM way_segments JOIN segments ON segments.id = way_segments.id
+                JOIN way_info ON way_info.wayid = segments.wayid
+                WHERE way_segments.min_lon<=? AND way_segments.max_lon>=? AND way_segments.min_lat<=?
+                AND way_segments.max_lat>=?;''',
+                (float(NECorner[1]), float(SWCorner[1]), float(NECorner[0]), float(SWCorner[0])))
 
-            Nodes = self.__Cursor.fetchall()
+            Closest = None
 
-            if not len(Nodes) == 0:  # Did we find any nodes that match our query?
+            for Row in self.__Cursor.fetchall():
 
-                ShortestDistance = None  # Used to store the distance of the closest node and determine which one is in fact closest
-                NodeOSMID = 0  # OSMID of node
+                Start = (Row[3], Row[4])
+                End = (Row[5], Row[6])
 
-                for Node in Nodes:
+                if not Bearing is None and not Start == End:
 
-                    NodeDistance = DistanceBetween((Node[1], Node[2]), Coordinates)
+                    Angle = AngleBetween(Bearing, BearingBetween(Start, End))
 
-                    if ShortestDistance is None:
+                    if SEGMENT_BEARING_TOLERANCE < Angle < 180 - SEGMENT_BEARING_TOLERANCE: # Crossing our path
+                        continue
 
-                        ShortestDistance = NodeDistance
-                        # NodeID = Node[0] # ID of found node
-                        NodeOSMID = Node[0]
+                Point, PointDistance, Fraction = ClosestPointOnSegment(Coordinates, Start, End)
 
-                    if NodeDistance < ShortestDistance:
+                if Closest is None or PointDistance < Closest[3]:
+                    Closest = (Row[0], Row[7:], Point, PointDistance, (Row[1], Row[2]))
 
-                        ShortestDistance = NodeDistance
-                        # NodeID = Node[0] # ID of found node with shortest distance
-                        NodeOSMID = Node[0]
+            # Only when the closest segment is within the search distance do we know nothing outside of the box is closer
+            if not Closest is None and Closest[3] <= Distance:
+                break
 
-                        # print('{0}: {1}, {2}'.format(Node[0], Node[1], Node[2]))
+            if Distance >= MAX_DISTANCE:
 
-                if not NodeOSMID == 0:
+                if not Closest is None and Closest[3] > MAX_DISTANCE:
+                    Closest = None
 
-                    # print '\nNode with shortest distance: ', NodeID, '(', ShortestDistance, ') OSMID: ', NodeOSMID
-                    return NodeOSMID  # We found our closest node, no need to search further
+                break
 
-                else:
+            Distance = min(Distance * DISTANCE_GROWTH_FACTOR, MAX_DISTANCE)  # Grow our box
 
-                    # print 'No matching nodes found.. Expanding search area..'
-                    Distance += DISTANCE_TO_EXPAND  # Expand our box
+        if Closest is None:
+            return None # We didn't find anything...
 
-            else:
-                # print 'No matching nodes found.. Expanding search area..'
-                Distance += DISTANCE_TO_EXPAND  # Expand our box
+        wayid, WayInfo, Point, PointDistance, Nodes = Closest
 
-        return None  # We didn't find anything...
+        return wayid, Street(WayInfo[0], bool(WayInfo[4]), WayInfo[1], WayInfo[2], WayInfo[3], wayid), Point, PointDistance, Nodes
+
+
+    def FetchWayGeometry(self, wayid):
+        # Purpose: To get the shape of a street so we can follow it without asking the database (see tracker.py)
+        # Usage: FetchWayGeometry(Street.WayID())
+        # Returns: [(osmid, (Lattitude, Longitude), is it an intersection), ...] in order along the way, or None if we
+        # don't know the way (or with the mapfile backend, which doesn't keep the order of a way's nodes)
+
+        if self.__Cursor is None:
+            return None
+
+        self.__CheckDatabaseFile()
+
+        self.__Cursor.execute('''SELECT way_nodes.osmid, min_lat, min_lon, coalesce(way_count, 1) FROM way_nodes
+        JOIN nodes ON nodes.osmid = way_nodes.osmid
+        LEFT JOIN node_streets ON node_streets.osmid = way_nodes.osmid AND node_streets.wayid = way_nodes.wayid
+        WHERE way_nodes.wayid=? ORDER BY orderid;''', (wayid,))
+
+        Nodes = [(osmid, (Lattitude, Longitude), WayCount > 1) for osmid, Lattitude, Longitude, WayCount in
+                 self.__Cursor.fetchall()]
+
+        if len(Nodes) < 2:
+            return None
+
+        return Nodes
+
+
+    def SpeedLimitsAhead(self, wayid, Forward):
+        # Purpose: To find where the speed limit changes after the end of the street we're on, following the street on
+        # to the ways that carry on from it in the direction we're travelling. Worked out once for each way and
+        # direction, after that it's remembered.
+        # Usage: SpeedLimitsAhead(Street.WayID(), True) - Forward is True if we're travelling in the order of the way's
+        # nodes (see StreetTracker.Position)
+        # Returns: [(km past the end of the way, Street with the new speed limit), ...] closest first, up to
+        # SPEED_LOOKAHEAD_DISTANCE past the end, or None if we don't know the way (or with the mapfile backend)
+
+        self.__CheckDatabaseFile()
+
+        Key = (wayid, Forward)
+        Changes = self.__SpeedLimitCache.Get(Key)
+
+        if Changes is NOT_CACHED:
+
+            Changes = self.__WalkSpeedLimits(wayid, Forward)
+            self.__SpeedLimitCache.Put(Key, Changes)
+
+        return Changes
+
+
+    def __WayStreet(self, wayid):
+
+        self.__Cursor.execute('''SELECT street_name, num_of_lanes, maxspeed, street_type, oneway FROM way_info
+        WHERE wayid=? LIMIT 1;''', (wayid,))
+
+        WayInfo = self.__Cursor.fetchone()
+
+        if WayInfo is None:
+            return None
+
+        return Street(WayInfo[0], bool(WayInfo[4]), WayInfo[1], WayInfo[2], WayInfo[3], wayid)
+
+
+    def __WalkSpeedLimits(self, wayid, Forward):
+
+        Geometry = self.FetchWayGeometry(wayid)
+        Current = None if Geometry is None else self.__WayStreet(wayid)
+
+        if Current is None:
+            return None
+
+        if not Forward:
+            Geometry = Geometry[::-1]
+
+        Changes = []
+        Travelled = 0.0 # km past the end of the way we're on
+        Visited = set([wayid])
+
+        while Travelled < SPEED_LOOKAHEAD_DISTANCE:
+
+            End = Geometry[-1][0]
+            Heading = BearingBetween(Geometry[-2][1], Geometry[-1][1])
+            Best = None
+
+            # Which of the ways that start or end where this one ends carries on the way we're going? The same street if
+            # it's split into ways here, otherwise the one that turns the least.
+            for Onward in self.FetchStreets(End) or []:
+
+                if Onward.WayID() in Visited:
+                    continue
+
+                OnwardGeometry = self.FetchWayGeometry(Onward.WayID())
+
+                if OnwardGeometry is None:
+                    continue
+
+                if not OnwardGeometry[0][0] == End:
+
+                    if not OnwardGeometry[-1][0] == End or Onward.IsOneWay(): # A cross street, or one way against us
+                        continue
+
+                    OnwardGeometry = OnwardGeometry[::-1]
+
+                Turn = AngleBetween(Heading, BearingBetween(OnwardGeometry[0][1], OnwardGeometry[1][1]))
+                Rank = (not Onward.StreetName() == Current.StreetName(), Turn)
+
+                if Turn <= SPEED_LOOKAHEAD_MAX_TURN and (Best is None or Rank < Best[0]):
+                    Best = (Rank, Onward, OnwardGeometry)
+
+            if Best is None: # The street ends, or we can't tell which way they'll go
+                break
+
+            Rank, Onward, Geometry = Best
+            Visited.add(Onward.WayID())
+
+            if not Onward.MaxSpeed() == Current.MaxSpeed():
+                Changes.append((Travelled, Onward))
+
+            Current = Onward
+            Travelled += sum(DistanceBetween(Geometry[Node][1], Geometry[Node + 1][1]) for Node in range(len(Geometry) - 1))
+
+        return Changes
 
 
     def Close(self):
-        self.__Database.close()
\ No newline at end of file
+
+        if not self.__TileCache is None:
+            self.__TileCache.Close()
+            self.__TileCache = None
+
+        self.__CoordinatesCache.Clear()
+        self.__IntersectionCache.Clear()
+        self.__StreetCache.Clear()
+        self.__SpeedLimitCache.Clear()
+
+        if not self.__Database is None:
+            self.__Database.close()
+            self.__Database = None
+
+        if not self.__Map is None:
+            self.__Map.Close()
+            self.__Map = None
\ No newline at end of file
@@ -15,78 +15,136 @@ __author__ = 'Steve Hollaway'
 # You should have received a copy of the GNU General Public License
 # along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
 
-from gpsmodule import *
-from database import *
+# Joins the GPS, the lookups (see locator.py) and the GUI. The only part of finding our location that needs Qt: the
+# answers are worked out on a LocationWorker's thread and handed to the GUI thread with a queued Qt signal.
+
+from common import *
+from database import DataBase
+from locationworker import LocationWorker
+from locator import Locator
+import time
+import instrument
 from PyQt4.QtCore import QObject, pyqtSignal
 
 class EventHandler(QObject):
 
-    def __init__(self):
+    # Signals
+    signalLocationChanged = pyqtSignal(object) # (Street we're on or None, [cross Streets]) - delivered on the GUI thread
+    signalStreetChanged = pyqtSignal(str) # Name of the street we're on, for the GUI to show
+    signalMaxSpeedChanged = pyqtSignal(int, bool) # Speed limit in km/h, False if it's a guess (see Street.SpeedIsKnown)
+
+    def __init__(self, GPSDevice=None):
+        # Usage: EventHandler() for the GPS receiver (or GPS_REPLAY_FILE), EventHandler(GpsReplay('patrol.json', 0)) to
+        # drive it with a recorded log as fast as it can keep up
+
+        QObject.__init__(self)
+
+        self.__Booted = time.time() # For how long it takes to show our first location
+        self.__FirstLocationTime = None
+
+        if INSTRUMENT: # Record how long each stage takes (see instrument.py)
+
+            instrument.Enable()
+
+            self.__Reporter = instrument.Reporter(INSTRUMENT_SNAPSHOT_FILE, INSTRUMENT_PORT, INSTRUMENT_INTERVAL)
+            self.__Reporter.start()
+
+        else:
+            self.__Reporter = None
 
-        self.__Busy = False  # Are we doing something and need to wait?
-        
         # Initiate our GPS device and start receiving data
-        self.GPSDevice = GpsModule()  # Setup GPS device
-        self.GPSDevice.start()  # Start a new thread and execute GPS.run()
+        if GPSDevice is None:
+            GPSDevice = NewGpsDevice()
+
+        self.GPSDevice = GPSDevice  # Setup GPS device
         
         # Initialize Datase
         self.__Database = DataBase()  # Pointer to our Database.
         self.__Database.Connect()
 
-        self.__Location_ClosestNodeID = None # Store the node id of the node closest to our current gps coordinates
-        self.__Location_LastKnownNodeID = None # Store the node id of the last known node that is NOT an intersection
-        # ^ used to determine what road your travelling on when you encounter an intersection since an intersection will report
-        # more than one road. The last known node id that was not an intersection node will only belong to the road you were travelling on
-        # so you can assume that if it doesnt belong to the other roads reported back, then those roads are your cross streets and can be
-        # treated as such.
+        if DATABASE_TILE_CACHE:
+            self.__Database.StartTileCache(self.GPSDevice) # Prefetch the map ahead of us using our bearing and speed
+
+        # Only used by the location worker's thread
+        self.__Locator = Locator(self.__Database, self.__Database.LoadStreetGraph())
+
+        # Look up our location on a thread of its own, always for the newest fix (see locationworker.py)
+        self.__LocationWorker = LocationWorker(self.__Locator.Locate, self.signalLocationChanged.emit,
+                                               self.__Locator.Prepare)
+        self.__LocationWorker.start() # Start a new thread and execute LocationWorker.run()
 
         # Slots - Connect signals to slots
-        self.GPSDevice.signalLatitudeChanged.connect(self.__GetLocation) # Get the location if the lattitude changes
+        self.GPSDevice.signalFixChanged.connect(self.__NewFix) # Get the location for every fix
+        self.signalLocationChanged.connect(self.__ShowLocation)
+
+        if self.GPSDevice.ident is None: # Not started yet (once we're listening, as a replay starts right away)
+            self.GPSDevice.start()  # Start a new thread and execute GPS.run()
         
     def __del__(self):
 
         # Clean Up
+        if not self.__Reporter is None:
+            self.__Reporter.Close()
+
+        self.__LocationWorker.Close() # Clean up
         self.GPSDevice.Close() # Clean up
         self.GPSDevice = None # Clean up
 
+    def LocationStatistics(self):
+        # Fixes looked up and coalesced, time spent waiting and looking up (see LocationWorker.Statistics), the fixes
+        # the tracker skipped and lookups per km (see StreetTracker.Statistics), how often the answer was looked up
+        # before the fix arrived and the time that saved (see Predictor.Statistics), and how long until our first location
+
+        Statistics = self.__LocationWorker.Statistics()
+        Statistics.update(self.__Locator.Statistics())
+        Statistics['first_location_s'] = self.__FirstLocationTime # Seconds from starting until we showed where we are
+
+        return Statistics
+
+    def SpeedLimitsAhead(self):
+        # Purpose: To tell the officer about the speed limit changes coming up on the street we're on (and the ones it
+        # carries on to) as of the last fix
+        # Returns: ((km ahead of us, Street with the new speed limit), ...) (see Locator.SpeedLimitsAhead)
+
+        return self.__Locator.SpeedLimitsAhead()
+
+    def __NewFix(self, Fix):
 
-    def __GetLocation(self):
+        # Hand the fix (a GpsFix, see gpsfix.py) to the location worker. If it is still busy with an older fix, this
+        # one replaces whatever was waiting so it is the next one looked up.
+        self.__LocationWorker.Post(Fix)
 
-        if not self.__Busy == True:
+    def __ShowLocation(self, Location):
 
-            self.__Busy = True # Don't run another location search until we're finished with the current search
+        Started = instrument.Start()
 
-            self.__Location_ClosestNodeID = self.__Database.FindClosestNode((self.__Gps.Lattitude(), self.__Gps.Longitude()))
+        Street, CrossStreets = Location
 
-            if self.__Location_ClosestNodeID == self.__Location_LastKnownNodeID:
-                # Our last known location is the same as our closest ID so theres no point running a database check to
-                # find out what street we are on, because we already know. Only run a check when our ClosestNodeID and our
-                # LastKnownNodeID don't match. (ie. we've moved)
+        if not Street is None:
 
-                self.__Busy = False # Done checks (No longer busy)
-                return # No need to check any further, we know where we are
+            if self.__FirstLocationTime is None:
 
-            if not self.__Database.IsIntersection(self.__Location_ClosestNodeID): # Our current location is NOT an intersection
+                self.__FirstLocationTime = time.time() - self.__Booted
+                instrument.Record('startup.first_location', self.__FirstLocationTime)
+                Echo('First location after %.2f seconds' % self.__FirstLocationTime)
 
-                self.__Location_LastKnownNodeID = self.__Location_ClosestNodeID # Keep track of the last known node thats not an intersection
+            self.signalStreetChanged.emit(Street.StreetName() or '')
+            self.signalMaxSpeedChanged.emit(Street.MaxSpeed(), Street.SpeedIsKnown())
 
-                Streets = self.__Database.FetchStreets(self.__Location_ClosestNodeID) # Check database for list of streets connected to the node we're close to
+        if len(CrossStreets) > 0:
+            Echo('Cross streets: ' + ', '.join(CrossStreet.StreetName() for CrossStreet in CrossStreets))
 
-                if not Streets is None:
+        instrument.Stop('gui.show_location', Started)
 
-                    for Street in Streets:
-                        self.__Gui.CurrentLocation(Street.StreetName())
-                        self.__Gui.MaxSpeed(Street.MaxSpeed(), Street.SpeedIsKnown())
 
-                self.__Busy = False  # Done checks (No longer busy)
+def NewGpsDevice():
+    # Purpose: To make the GPS device the settings ask for, only importing the one we use
+    # Returns: GpsModule() for the GPS receiver, or a GpsReplay of GPS_REPLAY_FILE
 
-            else:
-                pass
-                # todo
-                # We are at or close to an intersection so we need to do some figuring out to determine which street we are actually
-                # travelling on and which streets intersect.
+    if GPS_REPLAY_FILE is None:
 
-                # 1. Check each street, 2. If our last known node is a part of that street then that is the street we are currently on
-                # 2. Or don't do a street check. (Remain on last known road until known otherwise)
+        from gpsmodule import GpsModule
+        return GpsModule()
 
-            return
+    from gpsreplay import GpsReplay
+    return GpsReplay(GPS_REPLAY_FILE, GPS_REPLAY_SPEED)
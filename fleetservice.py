@@ -0,0 +1,605 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Service mode for dispatch: the street and speed limit of every car in the fleet, live, on one box.
+#
+# Each car streams its gpsd JSON (gpspipe -w | nc dispatch 1339) to FLEET_PORT, or to FLEET_SOCKET from this machine.
+# A stream is one car, named by a {"class": "VEHICLE", "id": "car-12"} line before its reports (otherwise by where it
+# connected from); a gateway can send many cars down one stream with a "vehicle" key in each TPV report instead.
+# Every car is located the same way as on its pad (see locator.py), with a Locator of its own that keeps its last known
+# node, the way it's on and the tracker following it, so while a car stays on the same street nothing is looked up.
+# All the cars share one read-only connection with the nodes in memory (the memory backend, see spatialindex.py), its
+# lookup caches and the intersections (see StreetGraph). A new map takes a restart, reloading it would hold up every
+# car while it loads. A garbled report is counted and dropped on its own, the rest of its stream carries on.
+#
+# Dispatch connects to FLEET_WATCH_PORT and is sent every car we know of, then each car again whenever its street, cross
+# streets or (with -a) the speed limit changes ahead of it change, one line of JSON each. Sending ?STATS gets a line of
+# statistics back.
+#
+# Everything runs on one thread with asyncio (Python 3 only): a lookup takes well under a millisecond, so the cars are
+# simply located one after the other as their reports are read. Reports that arrive together for the same car are
+# located once, from the newest (like LocationWorker does).
+#
+# Usage: python3 fleetservice.py -d sqlite/geo.sqlite [-H <host>] [-p <port>] [-s <socket>] [-w <watchport>] [-a] [-i]
+
+import asyncio
+import getopt
+import json
+import os
+import signal
+import sys
+import time
+from common import *
+from database import DataBase
+from gpslog import TpvReport, FormatTime
+from gpsfix import NextFix
+from locator import Locator
+import instrument
+
+MAX_LINE = 65536  # Bytes - a stream that sends a longer line than this isn't sending gpsd JSON, it's dropped
+WATCH_BUFFER_LIMIT = 4 * 1024 * 1024  # Bytes waiting to be sent to a watcher before we give up on it (it isn't reading)
+EXPIRE_INTERVAL = 10.0  # Seconds between looking for cars that have gone quiet
+
+
+def WayIDs(Streets):
+    # ie. [Street, None, Street] -> (wayid, None, wayid)
+
+    return tuple(None if Street is None else Street.WayID() for Street in Streets)
+
+
+class Vehicle():
+
+    # One car: its own Locator and where it was as of its last fix
+
+    def __init__(self, VehicleID, Database, StreetGraph, LookAhead):
+
+        self.__ID = VehicleID
+        self.__Locator = Locator(Database, StreetGraph, LookAhead)
+        self.__LookAhead = LookAhead
+        self.__Fix = None # The last GpsFix
+        self.__Street = None # The street it's on, as of the last fix that told us
+        self.__CrossStreets = [] # At an intersection
+        self.__SpeedLimitsAhead = () # (km ahead, Street) closest first (see Locator.SpeedLimitsAhead)
+        self.__LastSeen = 0.0
+
+    def ID(self):
+
+        return self.__ID
+
+    def LastSeen(self):
+
+        return self.__LastSeen
+
+    def Fix(self):
+
+        return self.__Fix
+
+    def Locator(self):
+
+        return self.__Locator
+
+    def Update(self, Report, Now):
+        # Purpose: To take a car's next report (see gpslog.py), without locating it yet (see Locate)
+        # Returns: True if it had a position
+
+        Fix = NextFix(self.__Fix, Report)
+
+        if Fix is None:
+            return False
+
+        # A position that isn't numbers raises here rather than in the lookups later on
+        Fix = Fix._replace(lat=float(Fix.lat), lon=float(Fix.lon), time=Now if Fix.time is None else Fix.time)
+
+        self.__Fix = Fix
+        self.__LastSeen = Now
+
+        return True
+
+    def Locate(self):
+        # Purpose: To work out where the car is as of its last fix
+        # Returns: True if that changed what dispatch sees (see Report)
+
+        Location = self.__Locator.Locate(self.__Fix)
+        Changed = False
+
+        if not Location is None: # None is nothing changed
+
+            # Keep the street we were on until we know otherwise (like the pad does)
+            Street = self.__Street if Location[0] is None else Location[0]
+
+            Changed = not WayIDs([Street] + list(Location[1])) == WayIDs([self.__Street] + self.__CrossStreets)
+
+            self.__Street = Street
+            self.__CrossStreets = list(Location[1])
+
+        if self.__LookAhead: # Where the limit changes, not how far ahead (that changes every fix)
+
+            Ahead = self.__Locator.SpeedLimitsAhead()
+
+            Changed = Changed or not WayIDs(Street for Distance, Street in Ahead) == WayIDs(
+                Street for Distance, Street in self.__SpeedLimitsAhead)
+
+            self.__SpeedLimitsAhead = Ahead
+
+        return Changed
+
+    def Report(self):
+        # Returns: Where the car is as a dictionary (ready for json.dumps), the street and cross streets are None and
+        # empty until we know
+
+        Fix = self.__Fix
+        Street = self.__Street
+
+        Report = {'class': 'LOCATION', 'vehicle': self.__ID, 'time': FormatTime(Fix.time), 'lat': Fix.lat,
+                  'lon': Fix.lon, 'speed': Fix.speed, 'track': Fix.track,
+                  'street': None if Street is None else Street.StreetName(),
+                  'street_type': None if Street is None else Street.TypeOfStreet(),
+                  'maxspeed': None if Street is None else Street.MaxSpeed(),
+                  'maxspeed_known': None if Street is None else Street.SpeedIsKnown(),
+                  'cross_streets': [CrossStreet.StreetName() for CrossStreet in self.__CrossStreets]}
+
+        if self.__LookAhead:
+            Report['speed_limits_ahead'] = [[round(Distance, 3), Ahead.MaxSpeed(), Ahead.StreetName()]
+                                            for Distance, Ahead in self.__SpeedLimitsAhead]
+
+        return Report
+
+
+class PositionStream(asyncio.Protocol):
+
+    # A connection a car (or a gateway for several) sends its gpsd JSON down
+
+    def __init__(self, Service):
+
+        self.__Service = Service
+        self.__Transport = None
+        self.__Partial = b'' # The start of a line we haven't had the end of yet
+        self.__VehicleID = None # Who the reports are from if they don't say (see Identify)
+
+    def connection_made(self, Transport):
+
+        self.__Transport = Transport
+
+        Peer = Transport.get_extra_info('peername')
+
+        if isinstance(Peer, tuple): # TCP, until it tells us who it is
+            self.__VehicleID = '%s:%d' % Peer[:2]
+
+        else: # A local socket has no name worth using
+            self.__VehicleID = 'local:%d' % id(self)
+
+        self.__Service.StreamOpened(self)
+
+    def connection_lost(self, Problem):
+
+        self.__Service.StreamClosed(self)
+
+    def data_received(self, Data):
+
+        Lines = (self.__Partial + Data).split(b'\n')
+        self.__Partial = Lines.pop()
+
+        if len(self.__Partial) > MAX_LINE:
+
+            Echo('Dropped ' + self.__VehicleID + ', it isn\'t sending gpsd JSON')
+            self.__Transport.abort()
+            return
+
+        if len(Lines) > 0:
+            self.__Service.Receive(self, Lines)
+
+    def Identify(self, VehicleID):
+
+        self.__VehicleID = VehicleID
+
+    def VehicleID(self):
+
+        return self.__VehicleID
+
+    def Close(self):
+
+        self.__Transport.close()
+
+
+class WatchStream(asyncio.Protocol):
+
+    # A connection dispatch watches the fleet through
+
+    def __init__(self, Service):
+
+        self.__Service = Service
+        self.__Transport = None
+        self.__Partial = b''
+
+    def connection_made(self, Transport):
+
+        self.__Transport = Transport
+        self.__Service.WatcherOpened(self)
+
+    def connection_lost(self, Problem):
+
+        self.__Service.WatcherClosed(self)
+
+    def data_received(self, Data):
+
+        Lines = (self.__Partial + Data).split(b'\n')
+        self.__Partial = Lines.pop()[-MAX_LINE:]
+
+        for Line in Lines:
+
+            if Line.strip() == b'?STATS':
+                self.Send((json.dumps(self.__Service.Statistics(), sort_keys=True) + '\n').encode('utf-8'))
+
+    def Send(self, Data):
+
+        if self.__Transport.is_closing():
+            return
+
+        if self.__Transport.get_write_buffer_size() > WATCH_BUFFER_LIMIT: # Whoever's watching has stopped reading
+
+            Echo('Dropped a watcher that stopped reading')
+            self.__Transport.abort()
+            return
+
+        self.__Transport.write(Data)
+
+    def Close(self):
+
+        self.__Transport.close()
+
+
+class FleetService():
+
+    def __init__(self, Database, StreetGraph=None, LookAhead=False, Loop=None):
+        # Usage: FleetService(Database, Database.LoadStreetGraph()).Start() then .Run() - Database is shared by every
+        # car, only use it from the loop's thread. LookAhead=True also tells dispatch the speed limit changes ahead of
+        # each car (see Locator.SpeedLimitsAhead).
+
+        self.__Database = Database
+        self.__StreetGraph = StreetGraph
+        self.__LookAhead = LookAhead
+        self.__Loop = asyncio.new_event_loop() if Loop is None else Loop
+        self.__Servers = []
+        self.__Socket = None # Local socket file we made (see Start)
+
+        self.__Vehicles = {} # Vehicle id: Vehicle
+        self.__Streams = set() # PositionStreams connected
+        self.__Watchers = set() # WatchStreams connected
+
+        # Statistics
+        self.__Started = time.time()
+        self.__Reports = 0 # TPV reports with a position
+        self.__Located = 0 # Fixes located (the rest arrived together with a newer one for the same car)
+        self.__BadLines = 0 # Lines that weren't JSON, or were garbled reports
+        self.__Errors = 0 # Fixes that couldn't be located (the lookup raised)
+        self.__Sent = 0 # Location changes sent to dispatch (once for all the watchers)
+        self.__Busy = 0.0 # Seconds spent reading reports and locating cars
+        self.__Forgotten = 0 # Cars that went quiet for FLEET_VEHICLE_TIMEOUT
+
+    def Start(self, Host=FLEET_HOST, Port=FLEET_PORT, Socket=FLEET_SOCKET, WatchPort=FLEET_WATCH_PORT):
+        # Purpose: To start listening for position streams on Port (and Socket if it isn't None) and for dispatch on
+        # WatchPort
+
+        self.__Servers.append(self.__Loop.run_until_complete(
+            self.__Loop.create_server(lambda: PositionStream(self), Host, Port)))
+
+        if not Socket is None:
+
+            if os.path.exists(Socket): # Left behind by the last time we ran
+                os.remove(Socket)
+
+            self.__Servers.append(self.__Loop.run_until_complete(
+                self.__Loop.create_unix_server(lambda: PositionStream(self), Socket)))
+            self.__Socket = Socket
+
+        self.__Servers.append(self.__Loop.run_until_complete(
+            self.__Loop.create_server(lambda: WatchStream(self), Host, WatchPort)))
+
+        self.__Loop.call_later(EXPIRE_INTERVAL, self.__Expire)
+
+        Echo('Taking position streams on %s:%d%s, dispatch on %s:%d' % (
+            Host, Port, '' if Socket is None else ' and ' + Socket, Host, WatchPort))
+
+    def Run(self):
+        # Purpose: To serve until Stop is called (or SIGINT / SIGTERM)
+
+        try:
+
+            for Signal in (signal.SIGINT, signal.SIGTERM):
+                self.__Loop.add_signal_handler(Signal, self.__Loop.stop)
+
+        except (NotImplementedError, RuntimeError): # Not on this platform, or not the main thread
+            pass
+
+        self.__Loop.run_forever()
+
+    def Stop(self):
+
+        self.__Loop.call_soon_threadsafe(self.__Loop.stop)
+
+    def Close(self):
+
+        for Server in self.__Servers:
+
+            Server.close()
+            self.__Loop.run_until_complete(Server.wait_closed())
+
+        for Stream in list(self.__Streams) + list(self.__Watchers):
+            Stream.Close()
+
+        if not self.__Socket is None and os.path.exists(self.__Socket):
+            os.remove(self.__Socket)
+
+        self.__Servers = []
+
+    def StreamOpened(self, Stream):
+
+        self.__Streams.add(Stream)
+
+    def StreamClosed(self, Stream):
+
+        self.__Streams.discard(Stream) # The car is forgotten once it's been quiet long enough (see __Expire)
+
+    def WatcherOpened(self, Watcher):
+
+        self.__Watchers.add(Watcher)
+
+        # Everything we know so far, then the changes as they happen
+        Reports = [json.dumps(Car.Report()) + '\n' for Car in self.__Vehicles.values()]
+
+        if len(Reports) > 0:
+            Watcher.Send(''.join(Reports).encode('utf-8'))
+
+    def WatcherClosed(self, Watcher):
+
+        self.__Watchers.discard(Watcher)
+
+    def Receive(self, Stream, Lines):
+        # Purpose: To take the lines a stream sent and locate the cars they were from
+
+        Started = instrument.Start()
+        Now = time.time()
+
+        Pending = [] # The cars with a new fix to locate, in the order they first sent one
+        Seen = set()
+
+        for Line in Lines:
+
+            try:
+                Car = self.__Read(Stream, Line, Now)
+
+            except Exception: # Anything garbled in it (ie. a time or position that isn't one), only drop this report
+                Car = None
+                self.__BadLines += 1
+                instrument.Count('fleet.bad_reports')
+
+            if not Car is None and not Car in Seen:
+                Seen.add(Car)
+                Pending.append(Car)
+
+        for Car in Pending: # Only the newest fix of each car
+
+            try:
+                Changed = Car.Locate()
+
+            except Exception as Problem: # Don't let one car's fix take the others on its stream down with it
+                Changed = False
+                self.__Errors += 1
+                instrument.Count('fleet.locate_errors')
+
+                if self.__Errors == 1: # Say what it was the first time, the count is in Statistics after that
+                    Echo('Couldn\'t locate ' + Car.ID() + ': ' + repr(Problem))
+
+            if Changed:
+                self.__Broadcast(Car)
+
+            instrument.Record('fleet.lag', max(time.time() - Car.Fix().time, 0.0)) # How old the fix was once located
+
+        self.__Located += len(Pending)
+        self.__Busy += time.time() - Now
+
+        instrument.Stop('fleet.receive', Started)
+
+    def __Read(self, Stream, Line, Now):
+
+        # Takes one line of a stream: a car naming itself, or a car's report (see Vehicle.Update)
+        # Returns: The Vehicle with a new fix to locate, or None
+        if not Line.strip():
+            return None
+
+        Report = json.loads(Line.decode('utf-8'))
+
+        if not isinstance(Report, dict):
+            raise ValueError('not a JSON object')
+
+        Class = Report.get('class')
+
+        if Class == 'VEHICLE' and 'id' in Report:
+            Stream.Identify(str(Report['id']))
+
+        if not Class == 'TPV': # Everything else gpsd sends (SKY, VERSION, DEVICES, ...) we don't need
+            return None
+
+        Fix = TpvReport(Report)
+        VehicleID = str(Report['vehicle']) if 'vehicle' in Report else Stream.VehicleID()
+        Car = self.__Vehicles.get(VehicleID)
+
+        if Car is None: # Only kept once it has a position, so dispatch never sees a car without one
+
+            Car = Vehicle(VehicleID, self.__Database, self.__StreetGraph, self.__LookAhead)
+
+            if not Car.Update(Fix, Now):
+                return None
+
+            self.__Vehicles[VehicleID] = Car
+
+        elif not Car.Update(Fix, Now):
+            return None
+
+        self.__Reports += 1
+
+        return Car
+
+    def __Broadcast(self, Car):
+
+        # Tell every watcher where the car is now
+        self.__Sent += 1
+
+        if len(self.__Watchers) == 0:
+            return
+
+        Data = (json.dumps(Car.Report()) + '\n').encode('utf-8')
+
+        for Watcher in list(self.__Watchers):
+            Watcher.Send(Data)
+
+    def __Expire(self):
+
+        # Forget the cars that have gone quiet, and tell dispatch
+        Oldest = time.time() - FLEET_VEHICLE_TIMEOUT
+
+        for VehicleID, Car in list(self.__Vehicles.items()):
+
+            if Car.LastSeen() < Oldest:
+
+                del self.__Vehicles[VehicleID]
+                self.__Forgotten += 1
+
+                Data = (json.dumps({'class': 'GONE', 'vehicle': VehicleID}) + '\n').encode('utf-8')
+
+                for Watcher in list(self.__Watchers):
+                    Watcher.Send(Data)
+
+        self.__Loop.call_later(EXPIRE_INTERVAL, self.__Expire)
+
+    def Statistics(self):
+        # Returns: How busy we've been as a dictionary (ready for json.dumps): cars, streams and watchers connected,
+        # reports read and located, lookups the cars' trackers couldn't skip, the shared caches (see
+        # DataBase.CacheStatistics) and, when instrumenting, everything recorded (see instrument.Snapshot)
+
+        Lookups = 0
+        Skipped = 0
+
+        for Car in self.__Vehicles.values():
+
+            Statistics = Car.Locator().Statistics()
+            Lookups += Statistics['tracker_lookups']
+            Skipped += Statistics['tracker_skipped']
+
+        Uptime = time.time() - self.__Started
+
+        Statistics = {'class': 'STATS', 'time': time.time(), 'uptime': Uptime, 'vehicles': len(self.__Vehicles),
+                      'streams': len(self.__Streams), 'watchers': len(self.__Watchers), 'reports': self.__Reports,
+                      'located': self.__Located, 'bad_lines': self.__BadLines, 'errors': self.__Errors, 'sent': self.__Sent,
+                      'forgotten': self.__Forgotten, 'busy': self.__Busy, 'lookups': Lookups, 'skipped': Skipped,
+                      'caches': self.__Database.CacheStatistics()}
+
+        if instrument.Enabled:
+            Statistics['instrument'] = instrument.Snapshot()
+
+        return Statistics
+
+
+def Usage():
+
+    Echo('Proper usage: fleetservice.py -d <database> [-H <host>] [-p <port>] [-s <socket>] [-w <watchport>] [-a] [-i]'
+         '\n'
+         'Takes gpsd JSON from the cars on <host>:<port> (default %s:%d) and <socket>, dispatch watches on '
+         '<host>:<watchport> (default %d)'
+         '\n'
+         '-a also sends the speed limit changes ahead of each car, -i records how long everything takes (see '
+         'instrument.py)' % (FLEET_HOST, FLEET_PORT, FLEET_WATCH_PORT))
+
+
+def Main(argv):
+
+    DatabaseFile = DATABASE_LOCATIONS
+    Host = FLEET_HOST
+    Port = FLEET_PORT
+    Socket = FLEET_SOCKET
+    WatchPort = FLEET_WATCH_PORT
+    LookAhead = False
+
+    try:
+
+        Options, Arguments = getopt.getopt(argv, "d:H:p:s:w:ai")
+
+    except getopt.GetoptError:
+
+        Usage()
+        sys.exit(2)
+
+    for Option, Argument in Options:
+
+        if Option == '-d':
+            DatabaseFile = Argument
+
+        elif Option == '-H':
+            Host = Argument
+
+        elif Option in ('-p', '-w'):
+
+            if not Argument.isdigit():
+
+                Usage()
+                sys.exit(2)
+
+            if Option == '-p':
+                Port = int(Argument)
+
+            else:
+                WatchPort = int(Argument)
+
+        elif Option == '-s':
+            Socket = Argument
+
+        elif Option == '-a':
+            LookAhead = True
+
+        elif Option == '-i':
+            instrument.Enable()
+
+    if len(Arguments) > 0:
+
+        Usage()
+        sys.exit(2)
+
+    # One for the whole fleet. Reloading the map if the file changed would stop every car while it loads, restart the
+    # service for a new map instead.
+    Database = DataBase('memory', FLEET_CACHE_SIZE, ReadOnly=True, WatchFile=False)
+    Database.Connect(DatabaseFile)
+
+    Service = FleetService(Database, Database.LoadStreetGraph(), LookAhead)
+    Service.Start(Host, Port, Socket, WatchPort)
+
+    try:
+        Service.Run()
+
+    finally:
+
+        Service.Close()
+        Database.Close()
+
+        Statistics = Service.Statistics()
+        Echo('%d cars, %d reports, %d located, %d looked up, %.1f seconds busy' % (
+            Statistics['vehicles'], Statistics['reports'], Statistics['located'], Statistics['lookups'],
+            Statistics['busy']))
+
+
+if __name__ == "__main__":
+
+    Main(sys.argv[1:])
@@ -28,6 +28,7 @@ def DistanceBetween(FirstCoordinates, SecondCoordinates):
     # Purpose: To determine the distance from one location to another
     # Usage: DistanceBetween((43.894655, -78.802791), (43.894245, -78.804540))
     # Coordinates are in (Lattitude, Longitude) format
+    # Uses the haversine formula which (unlike the spherical law of cosines) stays accurate down to a few meters
 
     if not (len(FirstCoordinates) == 2) or not (len(SecondCoordinates) == 2):
         raise Exception('Improper Usage: - (LattitudeA, LongitudeA), (LattitudeB, LongitudeB)')
@@ -40,12 +41,114 @@ def DistanceBetween(FirstCoordinates, SecondCoordinates):
     LattitudeB = math.radians(SecondCoordinates[0])
     LongitudeB = math.radians(SecondCoordinates[1])
 
-    return EARTH_RADIUS * math.acos(
-                math.sin(LattitudeA) *
-                math.sin(LattitudeB) +
-                math.cos(LattitudeA) *
-                math.cos(LattitudeB) *
-                math.cos(LongitudeA - LongitudeB))
+    Haversine = (math.sin((LattitudeB - LattitudeA) / 2.0) ** 2 +
+                 math.cos(LattitudeA) * math.cos(LattitudeB) * math.sin((LongitudeB - LongitudeA) / 2.0) ** 2)
+
+    return 2.0 * EARTH_RADIUS * math.asin(math.sqrt(min(Haversine, 1.0)))
+
+def DistancesFrom(Coordinates, ListOfCoordinates):
+    # Purpose: To determine the distance from one location to many others in one call
+    # Usage: DistancesFrom((43.894655, -78.802791), [(43.894245, -78.804540), (43.895012, -78.801123)])
+    # Coordinates are in (Lattitude, Longitude) format
+    # Returns: A list of distances in km in the same order as ListOfCoordinates
+
+    if not len(Coordinates) == 2:
+        raise Exception('Improper Usage: - (LattitudeA, LongitudeA), [(LattitudeB, LongitudeB), ...]')
+
+    # Work out everything about our origin once
+    Lattitude = math.radians(Coordinates[0])
+    Longitude = math.radians(Coordinates[1])
+    CosLattitude = math.cos(Lattitude)
+
+    Radians = math.pi / 180.0
+    sin = math.sin
+    cos = math.cos
+    asin = math.asin
+    sqrt = math.sqrt
+
+    Distances = []
+
+    for OtherLattitude, OtherLongitude in ListOfCoordinates:
+
+        OtherLattitude *= Radians
+
+        Haversine = (sin((OtherLattitude - Lattitude) * 0.5) ** 2 +
+                     CosLattitude * cos(OtherLattitude) * sin((OtherLongitude * Radians - Longitude) * 0.5) ** 2)
+
+        Distances.append(2.0 * EARTH_RADIUS * asin(sqrt(min(Haversine, 1.0))))
+
+    return Distances
+
+def FastDistancesFrom(Coordinates, ListOfCoordinates):
+    # Purpose: Same as DistancesFrom but treats the earth as flat around our location (equirectangular projection).
+    # Much faster and accurate to better than 0.1% within about 10km, which is all we need to rank nearby nodes.
+    # Usage: FastDistancesFrom((43.894655, -78.802791), [(43.894245, -78.804540), (43.895012, -78.801123)])
+    # Returns: A list of distances in km in the same order as ListOfCoordinates
+
+    if not len(Coordinates) == 2:
+        raise Exception('Improper Usage: - (LattitudeA, LongitudeA), [(LattitudeB, LongitudeB), ...]')
+
+    Lattitude = float(Coordinates[0])
+    Longitude = float(Coordinates[1])
+
+    KilometersPerDegree = math.radians(1) * EARTH_RADIUS
+    LongitudeScale = math.cos(math.radians(Lattitude)) # A degree of longitude shrinks as we move away from the equator
+
+    sqrt = math.sqrt
+
+    Distances = []
+
+    for OtherLattitude, OtherLongitude in ListOfCoordinates:
+
+        DeltaLattitude = OtherLattitude - Lattitude
+        DeltaLongitude = (OtherLongitude - Longitude) * LongitudeScale
+
+        Distances.append(KilometersPerDegree * sqrt(DeltaLattitude * DeltaLattitude + DeltaLongitude * DeltaLongitude))
+
+    return Distances
+
+def DistancesBetween(FirstListOfCoordinates, SecondListOfCoordinates):
+    # Purpose: To determine the distance between pairs of locations in one call. The first location in the first list
+    # is paired with the first location in the second list and so on.
+    # Usage: DistancesBetween([(43.894655, -78.802791), ...], [(43.894245, -78.804540), ...])
+    # Returns: A list of distances in km, one for each pair
+
+    if not len(FirstListOfCoordinates) == len(SecondListOfCoordinates):
+        raise Exception('Improper Usage: - Both lists of coordinates must be the same length')
+
+    Radians = math.pi / 180.0
+    sin = math.sin
+    cos = math.cos
+    asin = math.asin
+    sqrt = math.sqrt
+
+    Distances = []
+
+    for (LattitudeA, LongitudeA), (LattitudeB, LongitudeB) in zip(FirstListOfCoordinates, SecondListOfCoordinates):
+
+        LattitudeA *= Radians
+        LattitudeB *= Radians
+
+        Haversine = (sin((LattitudeB - LattitudeA) * 0.5) ** 2 +
+                     cos(LattitudeA) * cos(LattitudeB) * sin((LongitudeB - LongitudeA) * Radians * 0.5) ** 2)
+
+        Distances.append(2.0 * EARTH_RADIUS * asin(sqrt(min(Haversine, 1.0))))
+
+    return Distances
+
+def ClosestOf(Coordinates, ListOfCoordinates):
+    # Purpose: To find which of many locations is closest to our location
+    # Usage: ClosestOf((43.894655, -78.802791), [(43.894245, -78.804540), (43.895012, -78.801123)])
+    # Returns: (position in ListOfCoordinates, distance in km) or None if ListOfCoordinates is empty
+    # Ranks with the fast flat earth distance, then measures the winner accurately
+
+    if len(ListOfCoordinates) == 0:
+        return None
+
+    Distances = FastDistancesFrom(Coordinates, ListOfCoordinates)
+    Closest = min(range(len(Distances)), key=Distances.__getitem__)
+
+    return Closest, DistanceBetween(Coordinates, ListOfCoordinates[Closest])
 
 def Direction(Bearing):
     # Purpose: To determine the direction of travel (ie. North) based on supplied bearing
@@ -111,6 +214,141 @@ def BearingBetween(FirstCoordinates, SecondCoordinates):
     return (math.degrees(math.atan2(FormulaOne, FormulaTwo)) + 360.0) % 360.0
 
 
+def BearingsFrom(Coordinates, ListOfCoordinates):
+    # Purpose: To determine the bearing in degrees from one location to many others in one call
+    # Usage: BearingsFrom((43.894655, -78.802791), [(43.894245, -78.804540), (43.895012, -78.801123)])
+    # Coordinates are in (Lattitude, Longitude) format
+    # Returns: A list of bearings in the same order as ListOfCoordinates (same formula as BearingBetween)
+
+    if not len(Coordinates) == 2:
+        raise Exception('Improper Usage: - (LattitudeA, LongitudeA), [(LattitudeB, LongitudeB), ...]')
+
+    Longitude = math.radians(Coordinates[1])
+    Mercator = math.log(math.tan(math.radians(Coordinates[0]) / 2.0 + math.pi / 4.0)) # Work out our origin once
+
+    Radians = math.pi / 180.0
+    Degrees = 180.0 / math.pi
+    QuarterTurn = math.pi / 4.0
+    log = math.log
+    tan = math.tan
+    atan2 = math.atan2
+    pi = math.pi
+
+    Bearings = []
+
+    for OtherLattitude, OtherLongitude in ListOfCoordinates:
+
+        FormulaOne = OtherLongitude * Radians - Longitude
+        FormulaTwo = log(tan(OtherLattitude * Radians / 2.0 + QuarterTurn)) - Mercator
+
+        if FormulaOne > pi:
+            FormulaOne -= 2.0 * pi
+
+        elif FormulaOne < -pi:
+            FormulaOne += 2.0 * pi
+
+        Bearings.append((atan2(FormulaOne, FormulaTwo) * Degrees + 360.0) % 360.0)
+
+    return Bearings
+
+def BearingsBetween(FirstListOfCoordinates, SecondListOfCoordinates):
+    # Purpose: To determine the bearing between pairs of locations in one call. The first location in the first list
+    # is paired with the first location in the second list and so on.
+    # Usage: BearingsBetween([(43.894655, -78.802791), ...], [(43.894245, -78.804540), ...])
+    # Returns: A list of bearings in degrees, one for each pair
+
+    if not len(FirstListOfCoordinates) == len(SecondListOfCoordinates):
+        raise Exception('Improper Usage: - Both lists of coordinates must be the same length')
+
+    Radians = math.pi / 180.0
+    Degrees = 180.0 / math.pi
+    QuarterTurn = math.pi / 4.0
+    log = math.log
+    tan = math.tan
+    atan2 = math.atan2
+    pi = math.pi
+
+    Bearings = []
+
+    for (LattitudeA, LongitudeA), (LattitudeB, LongitudeB) in zip(FirstListOfCoordinates, SecondListOfCoordinates):
+
+        FormulaOne = (LongitudeB - LongitudeA) * Radians
+        FormulaTwo = log(tan(LattitudeB * Radians / 2.0 + QuarterTurn) / tan(LattitudeA * Radians / 2.0 + QuarterTurn))
+
+        if FormulaOne > pi:
+            FormulaOne -= 2.0 * pi
+
+        elif FormulaOne < -pi:
+            FormulaOne += 2.0 * pi
+
+        Bearings.append((atan2(FormulaOne, FormulaTwo) * Degrees + 360.0) % 360.0)
+
+    return Bearings
+
+
+def PointAt(Coordinates, Bearing, Distance):
+    # Purpose: To determine the location we would reach by travelling a distance along a bearing
+    # Usage: PointAt((43.894655, -78.802791), 201.0, 0.500)
+    # distance is in km
+    # Coordinates are in (Lattitude, Longitude) format
+    # Returns: (Lattitude, Longitude)
+
+    if not len(Coordinates) == 2:
+        raise Exception('Improper Usage: - (LattitudeA, LongitudeA)')
+
+    Lattitude = math.radians(float(Coordinates[0]))
+    Longitude = math.radians(float(Coordinates[1]))
+    Bearing = math.radians(float(Bearing))
+
+    # Angular distance in radians on a great circle
+    Angular_Distance = Distance / EARTH_RADIUS
+
+    DestinationLattitude = math.asin(math.sin(Lattitude) * math.cos(Angular_Distance) +
+                                     math.cos(Lattitude) * math.sin(Angular_Distance) * math.cos(Bearing))
+
+    DestinationLongitude = Longitude + math.atan2(math.sin(Bearing) * math.sin(Angular_Distance) * math.cos(Lattitude),
+                                                  math.cos(Angular_Distance) - math.sin(Lattitude) * math.sin(DestinationLattitude))
+
+    # Keep our longitude within -180 to 180 degrees
+    DestinationLongitude = (DestinationLongitude + 3.0 * math.pi) % (2.0 * math.pi) - math.pi
+
+    return math.degrees(DestinationLattitude), math.degrees(DestinationLongitude)
+
+
+def ClosestPointOnSegment(Coordinates, StartCoordinates, EndCoordinates):
+    # Purpose: To find the point of a line segment (ie. a piece of a street between two nodes) closest to our location
+    # Usage: ClosestPointOnSegment((43.894655, -78.802791), (43.894245, -78.804540), (43.895012, -78.801123))
+    # Coordinates are in (Lattitude, Longitude) format
+    # Treats the earth as flat around our location (see FastDistancesFrom), street segments are short enough for that
+    # Returns: ((Lattitude, Longitude) of the closest point, distance to it in km, how far along the segment it is 0 to 1)
+
+    Lattitude = float(Coordinates[0])
+    Longitude = float(Coordinates[1])
+
+    LongitudeScale = math.cos(math.radians(Lattitude)) # A degree of longitude shrinks as we move away from the equator
+
+    # Segment and our location in flat (x, y) degrees with the start of the segment at (0, 0)
+    SegmentX = (EndCoordinates[1] - StartCoordinates[1]) * LongitudeScale
+    SegmentY = EndCoordinates[0] - StartCoordinates[0]
+    LocationX = (Longitude - StartCoordinates[1]) * LongitudeScale
+    LocationY = Lattitude - StartCoordinates[0]
+
+    LengthSquared = SegmentX * SegmentX + SegmentY * SegmentY
+
+    if LengthSquared == 0.0: # Both ends are the same node
+        Fraction = 0.0
+
+    else:
+        Fraction = min(max((LocationX * SegmentX + LocationY * SegmentY) / LengthSquared, 0.0), 1.0)
+
+    DeltaX = LocationX - Fraction * SegmentX
+    DeltaY = LocationY - Fraction * SegmentY
+
+    Point = (StartCoordinates[0] + Fraction * (EndCoordinates[0] - StartCoordinates[0]),
+             StartCoordinates[1] + Fraction * (EndCoordinates[1] - StartCoordinates[1]))
+
+    return Point, math.radians(1) * EARTH_RADIUS * math.sqrt(DeltaX * DeltaX + DeltaY * DeltaY), Fraction
+
 def CreateBox(Distance, Coordinates):
     # Purpose: To create a box around a location using the distance supplied. The box can then be used in a search to find
     # nearby coordinates that fall inside the box.
@@ -169,19 +407,31 @@ def IsInSight(Bearing, FirstCoordinates, SecondCoordinates, FieldOfVisionDegrees
     # Usage: IsInSight(201.0, (43.894655, -78.802791), (43.894245, -78.804540), 45)
     # Returns: True or False
 
-    LeftSide = Bearing - FieldOfVisionDegrees # Left side of the cone (originating from our bearing)
-    Rightside = Bearing + FieldOfVisionDegrees # Right side of the cone (originating from our bearing)
+    return AngleBetween(Bearing, BearingBetween(FirstCoordinates, SecondCoordinates)) <= FieldOfVisionDegrees
 
-    if LeftSide < 0: # Keep our value within the 360 degrees of our circle/compass
-        LeftSide += 360 # ex: -15 + 360 = 345 degrees (End of the circle again) Moving left around the circle
+def AreInSight(Bearing, Coordinates, ListOfCoordinates, FieldOfVisionDegrees=45):
+    # Purpose: Same as IsInSight but tests many locations in one call
+    # Usage: AreInSight(201.0, (43.894655, -78.802791), [(43.894245, -78.804540), (43.895012, -78.801123)], 45)
+    # Returns: A list of True or False in the same order as ListOfCoordinates
 
-    if Rightside > 360: # Keep our value within the 360 degrees of our circle/compass
-        Rightside -= 360 # ex: 380 - 360 = 20 degrees (Start of the circle again) Moving right around the circle
+    InSight = []
 
-    DestinationBearing = BearingBetween(FirstCoordinates, SecondCoordinates)
+    for DestinationBearing in BearingsFrom(Coordinates, ListOfCoordinates):
 
-    if DestinationBearing < LeftSide or DestinationBearing > Rightside:
-        return  False
+        Angle = abs(Bearing - DestinationBearing) % 360.0 # Same as AngleBetween, without the function call
 
-    else:
-        return True
\ No newline at end of file
+        InSight.append(Angle <= FieldOfVisionDegrees or 360.0 - Angle <= FieldOfVisionDegrees)
+
+    return InSight
+
+def AngleBetween(FirstBearing, SecondBearing):
+    # Purpose: To determine how many degrees apart two bearings are, going the short way around the circle/compass
+    # Usage: AngleBetween(350.0, 10.0) ex: 20 degrees
+    # Returns: 0 to 180 degrees
+
+    Angle = abs(FirstBearing - SecondBearing) % 360.0
+
+    if Angle > 180.0: # Keep our value within the 180 degrees of a half circle
+        Angle = 360.0 - Angle # ex: 340 degrees to the right is the same as 20 degrees to the left
+
+    return Angle
@@ -0,0 +1,156 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Talks to gpsd (its JSON protocol, the same as gpspipe -w) without ever waiting on it for long. We use the gpsd that's
+# already running rather than restarting it, and only start one ourselves if nothing answers. If gpsd isn't there yet,
+# or goes away, we try again after a short wait that doubles each time. Reports are read as they arrive, so nothing
+# waits on the first fix. Doesn't need Qt or the gps module.
+
+import os
+import select
+import socket
+import threading
+from common import *
+from gpslog import ReadGpsdLog
+
+WATCH = '?WATCH={"enable":true,"json":true};\n'  # Ask gpsd to send us its reports
+CONNECT_TIMEOUT = 1.0  # gpsd on this machine answers right away, this is for one that's stuck
+RECEIVE_SIZE = 4096
+
+
+class GpsdClient():
+
+    def __init__(self, Host=GPS_HOST, Port=GPS_PORT, Device=GPS_DEVICE, StartGpsd=GPS_START_GPSD,
+                 RetryDelay=GPS_RETRY_DELAY, MaxRetryDelay=GPS_RETRY_MAX_DELAY):
+        # Usage: GpsdClient() for the gpsd in common.py, GpsdClient('127.0.0.1', 2947, StartGpsd=False) for the
+        # system's gpsd on its usual port
+
+        self.__Host = Host
+        self.__Port = Port
+        self.__Device = Device
+        self.__StartGpsd = StartGpsd
+        self.__RetryDelay = RetryDelay
+        self.__MaxRetryDelay = MaxRetryDelay
+
+        self.__Socket = None
+        self.__Buffer = '' # What we've received of the next report
+        self.__Delay = RetryDelay # How long to wait before trying again
+        self.__Closed = threading.Event() # Set by Close to stop waiting
+
+        self.__Attempts = 0 # Times we tried to connect
+        self.__Connections = 0 # Times we succeeded
+        self.__Launched = False # Did we start gpsd?
+
+    def Connected(self):
+
+        return not self.__Socket is None
+
+    def Connect(self):
+        # Purpose: To connect to gpsd and ask it for reports. If nothing answers we start gpsd (once, and only if
+        # allowed to and the receiver is plugged in) and wait before returning, a little longer each time.
+        # Returns: True if we're connected, False if gpsd isn't there yet (just call Connect again)
+
+        if self.__Closed.is_set():
+            return False
+
+        self.__Attempts += 1
+
+        try:
+
+            Socket = socket.create_connection((self.__Host, self.__Port), CONNECT_TIMEOUT)
+            Socket.sendall(WATCH.encode())
+
+        except socket.error:
+
+            if self.__Attempts == 1:
+                Echo('gpsd is not answering on port ' + str(self.__Port))
+
+            if self.__StartGpsd and not self.__Launched:
+                self.__LaunchGpsd()
+
+            self.__Closed.wait(self.__Delay)
+            self.__Delay = min(self.__Delay * 2, self.__MaxRetryDelay)
+
+            return False
+
+        self.__Socket = Socket
+        self.__Buffer = ''
+        self.__Delay = self.__RetryDelay # Start over if we lose it again
+        self.__Connections += 1
+
+        return True
+
+    def Poll(self, Timeout=GPS_POLL_TIMEOUT):
+        # Purpose: To read whatever gpsd has sent, waiting at most Timeout seconds (0 to not wait at all)
+        # Returns: A list of reports (see gpslog.py), empty if nothing arrived or we lost gpsd (see Connected)
+
+        if self.__Socket is None:
+            return []
+
+        try:
+
+            if len(select.select([self.__Socket], [], [], Timeout)[0]) == 0:
+                return []
+
+            Received = self.__Socket.recv(RECEIVE_SIZE)
+
+        except (select.error, socket.error, ValueError): # Closed under us
+            Received = None
+
+        if not Received: # gpsd went away
+
+            if not self.__Closed.is_set():
+                Echo('Lost gpsd, reconnecting')
+
+            self.__Disconnect()
+            return []
+
+        Lines = (self.__Buffer + Received.decode('ascii', 'replace')).split('\n')
+        self.__Buffer = Lines.pop() # The start of a report that hasn't all arrived yet
+
+        return list(ReadGpsdLog(Lines))
+
+    def Statistics(self):
+
+        return {'attempts': self.__Attempts, 'connections': self.__Connections, 'launched': self.__Launched}
+
+    def Close(self):
+
+        self.__Closed.set()
+        self.__Disconnect()
+
+    def __LaunchGpsd(self):
+
+        if not os.path.exists(self.__Device): # Check to see if USB GPS device is connected
+
+            if self.__Attempts == 1:
+                Echo('GPS Device not connected! Waiting for gpsd')
+
+            return
+
+        self.__Launched = True # Only the once, after that we just wait for it
+
+        Echo('Starting gpsd on ' + self.__Device)
+        os.system('sudo gpsd ' + self.__Device + ' -F /var/run/gpsd.sock -S ' + str(self.__Port)) # Returns once it's running in the background
+
+    def __Disconnect(self):
+
+        Socket = self.__Socket
+        self.__Socket = None
+
+        if not Socket is None:
+            Socket.close()
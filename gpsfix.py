@@ -0,0 +1,65 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# One GPS fix, everything from the same report. GpsModule and GpsReplay make one for each report with a position and
+# hand it out whole (signalFixChanged, LatestFix), so nobody ever pairs a new latitude with an old longitude. It can't
+# be changed once made, so it's safe to share between threads without a lock.
+
+from collections import namedtuple
+
+MPS_TO_KPH = 3.6  # Same as gps.MPS_TO_KPH
+STOPPED_SPEED = 2  # km/h - Sometimes the GPS reports a speed of 1 or 2 when not in motion
+
+# time: Seconds since 1970 (UTC) or None, mode: 2 (2d) or 3 (3d), lat & lon: Degrees, speed: km/h rounded (0 when we
+# aren't moving), track: Bearing in degrees or None, epx & epy: Expected longitude & latitude error in meters, eps:
+# Expected speed error in m/s (the errors are None if the receiver didn't say)
+GpsFix = namedtuple('GpsFix', 'time mode lat lon speed track epx epy eps')
+
+
+def NextFix(LastFix, Report):
+    # Purpose: To make the fix for a report (see gpslog.py). Reports don't always have a speed or a track (ie. while
+    # stopped), if not we keep the last fix's.
+    # Usage: Fix = NextFix(Fix, Report)
+    # Returns: A GpsFix, or None if the report has no position
+
+    if not 'lat' in Report or not 'lon' in Report:
+        return None
+
+    if 'speed' in Report:
+
+        Speed = int(round(Report['speed'] * MPS_TO_KPH)) # Convert speed to kilometers; round to the nearest number; then drop the decimal
+
+        # We are most likely not moving nor are we interested in speeds that low
+        if Speed <= STOPPED_SPEED: Speed = 0
+
+    else:
+        Speed = None if LastFix is None else LastFix.speed
+
+    if 'track' in Report:
+        Track = Report['track']
+
+    else:
+        Track = None if LastFix is None else LastFix.track
+
+    if 'mode' in Report:
+        Mode = Report['mode']
+
+    else:
+        Mode = 2 if LastFix is None else LastFix.mode
+
+    return GpsFix(Report.get('time'), Mode, Report['lat'], Report['lon'], Speed, Track, Report.get('epx'),
+                  Report.get('epy'), Report.get('eps'))
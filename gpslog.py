@@ -0,0 +1,397 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Recorded GPS logs: gpsd JSON (gpspipe -w > patrol.json), raw NMEA from the receiver (gpspipe -r > patrol.nmea), GPX
+# tracks or CSV with a header row, any of them gzipped. Every log is read into the same reports: a dictionary like gpsd's TPV report with only the
+# keys the log had a value for, 'class', 'time' (seconds since 1970), 'mode', 'lat', 'lon', 'speed' (m/s), 'track' and
+# gpsd's error estimates 'epx', 'epy' (m) and 'eps' (m/s) (see gpsfix.py for what we make of them).
+# Used by GpsReplay (see gpsreplay.py), GpsdClient (see gpsdclient.py), annotate.py, fleetservice.py and the
+# benchmarks, nothing here needs Qt or gpsd.
+
+import calendar
+import csv
+import gzip
+import json
+import time
+from datetime import datetime
+
+KNOTS_TO_MPS = 0.514444  # NMEA speeds are in knots, gpsd's in meters per second
+
+TPV_KEYS = ('mode', 'lat', 'lon', 'speed', 'track', 'epx', 'epy', 'eps')  # What we keep from a gpsd TPV report (besides its time)
+
+# CSV column names we know (in lower case) and the report key each one is
+CSV_COLUMNS = {'time': 'time', 'timestamp': 'time', 'lat': 'lat', 'latitude': 'lat', 'lon': 'lon', 'lng': 'lon',
+               'long': 'lon', 'longitude': 'lon', 'speed': 'speed', 'track': 'track', 'course': 'track',
+               'bearing': 'track', 'heading': 'track', 'mode': 'mode'}
+
+
+def OpenGpsLog(Filename, Binary=False):
+
+    if Filename.endswith('.gz'):
+        return gzip.open(Filename, 'rb' if Binary else 'rt')
+
+    return open(Filename, 'rb' if Binary else 'r')
+
+
+def ParseTime(Time):
+    # Purpose: To read the time of a gpsd report
+    # Usage: ParseTime('2014-11-13T17:04:51.000Z'), older versions of gpsd send seconds since 1970 instead. GPX and CSV
+    # logs can also have a space instead of the T and a UTC offset instead of the Z, ie. '2014-11-13 12:04:51-05:00'
+    # Returns: Seconds since 1970 (UTC)
+
+    if isinstance(Time, (int, float)):
+        return float(Time)
+
+    Time = Time.strip().rstrip('Z')
+    Offset = 0
+
+    for Length in (6, 5): # +HH:MM or +HHMM, after the date (its dashes aren't a sign)
+
+        Sign = len(Time) - Length
+
+        if Sign > 10 and Time[Sign] in '+-':
+
+            Zone = Time[Sign + 1:].replace(':', '')
+
+            if not len(Zone) == 4 or not Zone.isdigit():
+                raise ValueError('Unknown UTC offset: ' + Time)
+
+            Offset = (int(Zone[:2]) * 3600 + int(Zone[2:]) * 60) * (-1 if Time[Sign] == '-' else 1)
+            Time = Time[:Sign]
+            break
+
+    Seconds, Dot, Fraction = Time.partition('.')
+
+    if len(Seconds) == 19 and Seconds[10] in 'T ': # The usual, read it straight off (strptime takes much longer)
+        Date = (int(Seconds[0:4]), int(Seconds[5:7]), int(Seconds[8:10]), int(Seconds[11:13]), int(Seconds[14:16]),
+                int(Seconds[17:19]))
+
+    else:
+        Date = datetime.strptime(Seconds.replace(' ', 'T', 1), '%Y-%m-%dT%H:%M:%S').timetuple()[:6]
+
+    return calendar.timegm(Date) + float('0.' + (Fraction or '0')) - Offset
+
+
+def FormatTime(Time):
+    # Purpose: The opposite of ParseTime
+    # Usage: FormatTime(1415898291.0) ex: '2014-11-13T17:04:51.000Z'
+
+    Seconds, Milliseconds = divmod(int(round(Time * 1000.0)), 1000) # Rounded together, 59.9996 is the next second
+
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(Seconds)) + '.%03dZ' % Milliseconds
+
+
+def ReadGpsdLog(Lines):
+    # Purpose: To read the TPV reports of a gpsd JSON log, skipping everything else (SKY, VERSION, DEVICES, ...)
+    # Usage: ReadGpsdLog(open('patrol.json'))
+    # Returns: A generator of reports
+
+    for Line in Lines:
+
+        if not '"TPV"' in Line:
+            continue
+
+        try:
+            Report = json.loads(Line)
+
+        except ValueError: # A line cut short at the end of the recording
+            continue
+
+        if not Report.get('class') == 'TPV':
+            continue
+
+        yield TpvReport(Report)
+
+
+def TpvReport(Report):
+    # Purpose: To make one of our reports from a gpsd TPV report that's already been decoded (see ReadGpsdLog, and
+    # fleetservice.py which reads them off the network)
+    # Usage: TpvReport(json.loads(Line))
+    # Returns: A report
+
+    Fix = {'class': 'TPV'}
+
+    if 'time' in Report:
+        Fix['time'] = ParseTime(Report['time'])
+
+    for Key in TPV_KEYS:
+
+        if Key in Report:
+            Fix[Key] = Report[Key]
+
+    return Fix
+
+
+def NmeaChecksumIsValid(Sentence):
+
+    Body, Star, Checksum = Sentence.partition('*')
+
+    if not Star: # No checksum to check
+        return True
+
+    Sum = 0
+
+    for Character in Body[1:]: # Everything between the $ and the *
+        Sum ^= ord(Character)
+
+    try:
+        return Sum == int(Checksum[:2], 16)
+
+    except ValueError:
+        return False
+
+
+def NmeaDegrees(Value, Hemisphere):
+    # Purpose: To convert an NMEA position (ddmm.mmmm or dddmm.mmmm) to degrees
+    # Usage: NmeaDegrees('4353.6793', 'N') ex: 43.894655
+
+    Dot = Value.index('.') if '.' in Value else len(Value)
+    Degrees = float(Value[:Dot - 2]) + float(Value[Dot - 2:]) / 60.0
+
+    return -Degrees if Hemisphere in ('S', 'W') else Degrees
+
+
+def ReadNmeaLog(Lines):
+    # Purpose: To read the RMC sentences of an NMEA log into reports, with the fix mode from the GGA sentences
+    # Usage: ReadNmeaLog(open('patrol.nmea'))
+    # Returns: A generator of reports
+
+    Mode = 2 # Until a GGA sentence tells us we have an altitude too
+
+    for Line in Lines:
+
+        Sentence = Line.strip()
+
+        if not Sentence.startswith('$') or len(Sentence) < 7 or not NmeaChecksumIsValid(Sentence):
+            continue
+
+        Fields = Sentence.partition('*')[0].split(',')
+        Type = Fields[0][3:] # Skip the $ and the talker (GP, GN, GL, ...)
+
+        try:
+
+            if Type == 'GGA' and len(Fields) > 9:
+
+                if not Fields[6] in ('', '0'): # Fix quality (0 is no fix)
+                    Mode = 3 if Fields[9] else 2 # Altitude
+
+            elif Type == 'RMC' and len(Fields) > 9:
+
+                Fix = {'class': 'TPV'}
+
+                if Fields[1] and len(Fields[9]) == 6: # hhmmss.ss and ddmmyy
+                    Fix['time'] = calendar.timegm(datetime.strptime(Fields[9] + Fields[1].split('.')[0],
+                                                                    '%d%m%y%H%M%S').timetuple())
+                    Fix['time'] += float('0.' + Fields[1].partition('.')[2]) if '.' in Fields[1] else 0.0
+
+                if not Fields[2] == 'A': # V is a warning, we don't have a fix
+                    Fix['mode'] = 1
+                    yield Fix
+                    continue
+
+                Fix['mode'] = Mode
+                Fix['lat'] = NmeaDegrees(Fields[3], Fields[4])
+                Fix['lon'] = NmeaDegrees(Fields[5], Fields[6])
+
+                if Fields[7]:
+                    Fix['speed'] = float(Fields[7]) * KNOTS_TO_MPS
+
+                if Fields[8]:
+                    Fix['track'] = float(Fields[8])
+
+                yield Fix
+
+        except ValueError: # A garbled sentence that still had a good checksum (or none)
+            continue
+
+
+def LocalName(Tag):
+    # ie. '{http://www.topografix.com/GPX/1/1}trkpt' -> 'trkpt'
+
+    return Tag.rpartition('}')[2]
+
+
+def ReadGpxLog(File):
+    # Purpose: To read the track points (and route points) of a GPX file into reports, a point at a time so a long
+    # track never has to fit in memory
+    # Usage: ReadGpxLog(open('patrol.gpx', 'rb'))
+    # Returns: A generator of reports
+
+    try:
+        from xml.etree import cElementTree as ElementTree # Python 2's fast one
+
+    except ImportError:
+        from xml.etree import ElementTree # Python 3 is always fast
+
+    Parents = [] # The elements we're inside of
+
+    for Event, Element in ElementTree.iterparse(File, events=('start', 'end')):
+
+        if Event == 'start':
+            Parents.append(Element)
+            continue
+
+        Parents.pop()
+
+        if not LocalName(Element.tag) in ('trkpt', 'rtept'):
+            continue
+
+        try:
+
+            Fix = {'class': 'TPV', 'mode': 2, 'lat': float(Element.get('lat')), 'lon': float(Element.get('lon'))}
+
+            for Child in Element.iter():
+
+                Name = LocalName(Child.tag)
+
+                if Name == 'time' and Child.text:
+                    Fix['time'] = ParseTime(Child.text.strip())
+
+                elif Name == 'ele' and Child.text:
+                    Fix['mode'] = 3
+
+                elif Name == 'speed' and Child.text: # GPX 1.0, or an extension in 1.1 (m/s either way)
+                    Fix['speed'] = float(Child.text)
+
+                elif Name == 'course' and Child.text:
+                    Fix['track'] = float(Child.text)
+
+        except (TypeError, ValueError): # A point without a position, or with a garbled value
+            continue
+
+        finally:
+
+            if len(Parents) > 0: # Done with it, don't keep it in the tree
+                Parents[-1].remove(Element)
+
+        yield Fix
+
+
+def ReadCsvLog(Lines):
+    # Purpose: To read a CSV log with a header row naming its columns (see CSV_COLUMNS, others are ignored). Times can
+    # be seconds since 1970 or like gpsd's, speeds are in m/s like gpsd's.
+    # Usage: ReadCsvLog(open('patrol.csv'))
+    # Returns: A generator of reports
+
+    Rows = csv.reader(Lines)
+
+    for Header in Rows:
+
+        Columns = [(Column, CSV_COLUMNS[Name.strip().lower()]) for Column, Name in enumerate(Header)
+                   if Name.strip().lower() in CSV_COLUMNS]
+        break
+
+    else:
+        return # Empty
+
+    for Row in Rows:
+
+        Fix = {'class': 'TPV', 'mode': 2}
+
+        try:
+
+            for Column, Key in Columns:
+
+                if Column >= len(Row) or not Row[Column].strip():
+                    continue
+
+                Value = Row[Column].strip()
+
+                if Key == 'time':
+                    Fix['time'] = float(Value) if Value.replace('.', '', 1).isdigit() else ParseTime(Value)
+
+                elif Key == 'mode':
+                    Fix['mode'] = int(Value)
+
+                else:
+                    Fix[Key] = float(Value)
+
+        except ValueError: # A garbled row
+            continue
+
+        yield Fix
+
+
+def Chain(First, Lines):
+    # The lines of a log again, after we've already read the first one
+
+    yield First
+
+    for Line in Lines:
+        yield Line
+
+
+def ReadGpsLog(Filename):
+    # Purpose: To read a gpsd JSON, NMEA, GPX or CSV log, whichever it is
+    # Usage: ReadGpsLog('patrol.json.gz')
+    # Returns: A generator of reports
+
+    Lines = OpenGpsLog(Filename)
+
+    try:
+
+        for Line in Lines:
+
+            if Line.strip(): # The first line tells us what kind of log this is
+
+                Start = Line.lstrip()[:1]
+                Rest = Chain(Line, Lines)
+
+                if Start == '<': # XML, the parser reads the file itself
+                    Lines.close()
+                    Lines = OpenGpsLog(Filename, Binary=True)
+                    Reports = ReadGpxLog(Lines)
+
+                elif Start == '$':
+                    Reports = ReadNmeaLog(Rest)
+
+                elif Start == '{':
+                    Reports = ReadGpsdLog(Rest)
+
+                else:
+                    Reports = ReadCsvLog(Rest)
+
+                for Fix in Reports:
+                    yield Fix
+
+                break
+
+    finally:
+        Lines.close()
+
+
+def Replay(Reports, Speed=1.0):
+    # Purpose: To hand out recorded reports at the pace they were recorded
+    # Usage: Replay(ReadGpsLog('patrol.json'), 10.0) for 10 times faster than real time, Replay(..., 0) for as fast as
+    # we can take them
+    # Returns: A generator of reports
+
+    Start = None # (Time of the first report, when we handed it out)
+
+    for Report in Reports:
+
+        if Speed > 0 and 'time' in Report:
+
+            if Start is None:
+                Start = (Report['time'], time.time())
+
+            Delay = Start[1] + (Report['time'] - Start[0]) / Speed - time.time()
+
+            if Delay > 0:
+                time.sleep(Delay)
+
+        yield Report
@@ -15,53 +15,43 @@ __author__ = 'Steve Hollaway'
 # You should have received a copy of the GNU General Public License
 # along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
 
-import gps
 import threading
-import os
+import time
 from common import *
 from geolib import *
-from time import sleep
-from PyQt4.QtCore import QObject, pyqtSignal # Used to emit signals
+from gpsdclient import GpsdClient
+from gpslog import FormatTime
+from gpsfix import NextFix
+import instrument
+from signals import Signal # Used to emit signals (see qtsignals.py to show them in the GUI)
 
 GPS_STATUS = {'nostatus': 0, 'nofix': 1, '2d': 2, '3d': 3}
 
-class GpsModule(threading.Thread, QObject):
+class GpsModule(threading.Thread):
 
-    # Signals
-    signalSpeedChanged = pyqtSignal(int)
-    signalBearingChanged = pyqtSignal()
-    signalLatitudeChanged = pyqtSignal()
-    signalLongitudeChanged = pyqtSignal()
-
-    def __init__(self):
-
-        # Initialize GPS device
-        if not os.path.exists('/dev/ttyUSB0'): # Check to see if USB GPS device is connected
-            raise Exception('GPS Device not connected!')
-
-        # GPS Services
-        os.system('sudo killall gpsd') # Shutdown gps daemon
-        sleep(0.5) # Give our above command time to work
-
-        os.system(str('sudo gpsd /dev/ttyUSB0 -F /var/run/gpsd.sock -S ' + GPS_PORT)) # Start gps daemon (spits out GPS data from device to USB port)
-        sleep(1) # Wait a second for gps daemon to initialize before trying to work with it
+    def __init__(self, Client=None):
+        # Usage: GpsModule() for gpsd on GPS_PORT (see gpsdclient.py), GpsModule(GpsdClient('127.0.0.1', 2947)) for
+        # another one. Returns right away, connecting to gpsd and waiting for a fix happen on the thread (see run)
 
         # Initialize Threading (So we can do stuff while we're doing stuff)
         threading.Thread.__init__(self) # Open a new thread
         self.daemon = True # Set as a daemon thread to run in background
 
+        # Signals - emitted on our thread
+        self.signalFixChanged = Signal() # A GpsFix (see gpsfix.py) for every report with a position
 
         # GPS Information
-        self.__Latitude = int # Lattitude
-        self.__Longitude = int # Longitutde
-        self.__Speed = int # Speed in km
-        self.__Bearing = float # Bearing/Direction of travel in degrees
-        self.__Status = int # Store the status of our GPS device (0 no status, 1 no fix, 2 2d mode, 3, 3d mode)
+        self.__Fix = None # The latest GpsFix, replaced whole with each report (never changed) so it needs no lock
+        self.__Status = GPS_STATUS['nostatus'] # Store the status of our GPS device (0 no status, 1 no fix, 2 2d mode, 3, 3d mode)
+
+        # How long it took to get going (see StartupTimes)
+        self.__Created = time.time()
+        self.__ConnectTime = None
+        self.__FirstFixTime = None
 
-        # Initiate GPS session
-        self.__GPSDevice = gps.gps("localhost", GPS_PORT)
-        self.__GPSDevice.stream(gps.WATCH_ENABLE | gps.WATCH_NEWSTYLE)
-        self.__Polling = False # If set to true then continually check the GPS for incomming data
+        # GPS session
+        self.__GPSDevice = GpsdClient() if Client is None else Client
+        self.__Polling = True # While true continually check the GPS for incomming data
 
     def Status(self):
         # Used with GPS_STATUS
@@ -71,77 +61,81 @@ class GpsModule(threading.Thread, QObject):
         # (3) 3d mode (lattitude, longittude, and altittude) visible
         return self.__Status
 
-    def Speed(self): # How fast are we travelling?
-        return self.__Speed
+    def LatestFix(self):
+        # Returns: The latest GpsFix (see gpsfix.py), or None before the first one. Read it once and use that, rather
+        # than the accessors below one after the other, to be sure everything is from the same fix.
+        return self.__Fix
+
+    def Speed(self): # How fast are we travelling? (km/h)
+        return None if self.__Fix is None else self.__Fix.speed
 
     def Bearing(self): # Whats our bearing?
-        return self.__Bearing
+        return None if self.__Fix is None else self.__Fix.track
 
     def Direction(self): # Whats our direction of travel?
-        return Direction(self.__Bearing)
+        return Direction(self.Bearing())
 
     def Longitude(self): # GPS Longitude
-        return self.__Longitude
+        return None if self.__Fix is None else self.__Fix.lon
 
     def Lattitude(self): # GPS Latitude
-        return self.__Latitude
+        return None if self.__Fix is None else self.__Fix.lat
 
     def Time(self): # What time is it based on the sattelite?
-        return self.__GPSDevice.utc
 
-    # Function Over-ride - Called when thread is started
-    def run(self):
+        Fix = self.__Fix
 
-        while self.__Polling: # Continually check for new GPS information (poll)
+        if Fix is None or Fix.time is None:
+            return ''
 
-            try: # Allow us to catch errors if something unexpected happens
+        return FormatTime(Fix.time)
 
-                Report = self.__GPSDevice.next() # Grab report from GPS device
+    def StartupTimes(self):
+        # Returns: Seconds from creating the module until we were connected to gpsd and until our first fix (None
+        # until they happen)
 
-                if Report['class'] == 'TPV':
+        return {'connect_s': self.__ConnectTime, 'first_fix_s': self.__FirstFixTime}
 
-                    if hasattr(Report, 'mode'):
+    # Function Over-ride - Called when thread is started
+    def run(self):
 
-                        self.__Status = Report.mode
+        while self.__Polling: # Continually check for new GPS information (poll)
 
-                    if hasattr(Report, 'track'):
+            if not self.__GPSDevice.Connected():
 
-                        self.__Bearing = Report.track
-                        self.signalBearingChanged.emit() # Emit signal
+                if not self.__GPSDevice.Connect(): # Not there yet (Connect waited a little before returning)
+                    continue
 
-                    if hasattr(Report, 'speed'):
+                if self.__ConnectTime is None:
 
-                        self.__Speed = int(round(Report.speed * gps.MPS_TO_KPH)) # Convert speed to kilometers; round to the nearest number; then drop the decimal
+                    self.__ConnectTime = time.time() - self.__Created
+                    instrument.Record('gps.connect', self.__ConnectTime)
+                    Echo('Connected to gpsd after %.2f seconds' % self.__ConnectTime)
 
-                        # Sometimes the GPS reports a speed of 1 or 2 when not in motion.
-                        # So if the speed is equal to or less than 2 then just report 0 as our speed
-                        # We are most likely not moving nor are we interested in speeds that low
-                        if self.__Speed <= 2: self.__Speed = 0  # Set speed to zero
+            for Report in self.__GPSDevice.Poll(GPS_POLL_TIMEOUT): # Grab reports from GPS device
 
-                        self.signalSpeedChanged.emit(self.__Speed) # Emit signal
+                Started = instrument.Start() # Time handling the report (not waiting for it)
 
-                    if hasattr(Report, 'lat'):
+                if 'mode' in Report:
+                    self.__Status = Report['mode']
 
-                        self.__Latitude = Report.lat
-                        self.signalLatitudeChanged.emit() # Emit signal
+                Fix = NextFix(self.__Fix, Report)
 
-                    if hasattr(Report, 'lon'):
+                if not Fix is None:
 
-                        self.__Longitude = Report.lon
-                        self.signalLongitudeChanged.emit() # Emit signal
+                    self.__Fix = Fix # All of it at once
+                    self.signalFixChanged.emit(Fix) # Emit signal
 
-            except KeyError:
-                pass # Ignore
+                    if self.__FirstFixTime is None:
 
-            except KeyboardInterrupt:
-                quit()
+                        self.__FirstFixTime = time.time() - self.__Created
+                        instrument.Record('gps.first_fix', self.__FirstFixTime)
+                        Echo('First GPS fix after %.2f seconds' % self.__FirstFixTime)
 
-            except StopIteration:
-                self.__GPSDevice = None
-                Echo('GPS Dameon has stopped')
+                instrument.Stop('gps.report', Started)
 
     def Close(self):
 
         # Clean up
         self.__Polling = False # Stop polling
-        os.system('sudo killall gpsd')  # Shutdown gps daemon
\ No newline at end of file
+        self.__GPSDevice.Close() # Leaves gpsd running for whoever wants it next
@@ -0,0 +1,116 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# A GPS device that replays a recorded log instead of talking to gpsd (see gpslog.py). It has the same accessors and
+# signals as GpsModule, so EventHandler and the tile cache can't tell the difference. No GPS receiver or gpsd needed.
+
+import threading
+from common import *
+from geolib import *
+from gpslog import ReadGpsLog, Replay, FormatTime
+from gpsfix import NextFix
+import instrument
+from signals import Signal # Used to emit signals (see qtsignals.py to show them in the GUI)
+
+
+class GpsReplay(threading.Thread):
+
+    def __init__(self, Filename, Speed=GPS_REPLAY_SPEED):
+        # Usage: GpsReplay('patrol.json.gz') for real time, GpsReplay('patrol.nmea', 60.0) for an hour a minute,
+        # GpsReplay('patrol.nmea', 0) for as fast as we can
+
+        # Initialize Threading
+        threading.Thread.__init__(self) # Open a new thread
+        self.daemon = True # Set as a daemon thread to run in background
+
+        # Signals - emitted on our thread
+        self.signalFixChanged = Signal() # A GpsFix (see gpsfix.py) for every report with a position
+        self.signalFinished = Signal() # Emitted once we reach the end of the log
+
+        self.__Filename = Filename
+        self.__Speed = Speed
+
+        # GPS Information
+        self.__Fix = None # The latest GpsFix (see GpsModule)
+        self.__Status = 0 # Store the status of our GPS device (0 no status, 1 no fix, 2 2d mode, 3, 3d mode)
+
+        self.__Polling = True # Set to false to stop replaying
+        self.__Reports = 0 # Reports replayed so far
+
+    def Status(self):
+        return self.__Status
+
+    def LatestFix(self): # The latest GpsFix, or None before the first one (see GpsModule.LatestFix)
+        return self.__Fix
+
+    def Speed(self): # How fast are we travelling? (km/h)
+        return None if self.__Fix is None else self.__Fix.speed
+
+    def Bearing(self): # Whats our bearing?
+        return None if self.__Fix is None else self.__Fix.track
+
+    def Direction(self): # Whats our direction of travel?
+        return Direction(self.Bearing())
+
+    def Longitude(self): # GPS Longitude
+        return None if self.__Fix is None else self.__Fix.lon
+
+    def Lattitude(self): # GPS Latitude
+        return None if self.__Fix is None else self.__Fix.lat
+
+    def Time(self): # What time was it when this was recorded? (in the same format as gpsd)
+
+        Fix = self.__Fix
+
+        if Fix is None or Fix.time is None:
+            return ''
+
+        return FormatTime(Fix.time)
+
+    def Reports(self): # How many reports have we replayed?
+        return self.__Reports
+
+    # Function Over-ride - Called when thread is started
+    def run(self):
+
+        for Report in Replay(ReadGpsLog(self.__Filename), self.__Speed):
+
+            if not self.__Polling:
+                break
+
+            # The same as GpsModule.run
+            Started = instrument.Start()
+            self.__Reports += 1
+
+            if 'mode' in Report:
+                self.__Status = Report['mode']
+
+            Fix = NextFix(self.__Fix, Report)
+
+            if not Fix is None:
+
+                self.__Fix = Fix # All of it at once
+                self.signalFixChanged.emit(Fix) # Emit signal
+
+            instrument.Stop('gps.report', Started)
+
+        Echo('GPS replay finished after ' + str(self.__Reports) + ' reports')
+        self.signalFinished.emit()
+
+    def Close(self):
+
+        self.__Polling = False # Stop replaying
@@ -0,0 +1,287 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Where did the time go? Latency histograms and counters for the stages a fix goes through (GPS report, closest node,
+# streets, GUI update) and the importer's phases.
+#
+# Usage:
+#   Started = instrument.Start()
+#   ... the work ...
+#   instrument.Stop('database.closest_nodes', Started)
+#
+# Everything is off until Enable() is called: Start returns None and Stop returns straight away, so the calls can stay
+# in the hot paths. When on, a stage costs two clock reads and a bucket increment. The histograms have fixed buckets
+# (1, 2, 5, 10, 20, 50 ... microseconds up to 10 seconds) so they never grow, however long we run.
+# A Reporter thread writes a snapshot of everything to a file and/or streams it to whoever connects to a local port.
+# json and socket are only imported once something is reported, everything that times itself imports this module.
+
+import os
+import threading
+import time
+import timeit
+from bisect import bisect_left
+from common import Echo
+
+# Upper bound of each bucket in seconds: 1us, 2us, 5us, 10us ... 5s, 10s (anything slower goes in one last bucket)
+BUCKET_BOUNDS = tuple(Mantissa * 10 ** Exponent / 1e6 for Exponent in range(8) for Mantissa in (1, 2, 5))[:-2]
+
+REPORT_INTERVAL = 10.0  # Seconds between snapshots
+
+# Where things are in a histogram (see NewHistogram)
+COUNT = 0
+TOTAL = 1
+LONGEST = 2
+BUCKETS = 3
+
+Clock = timeit.default_timer
+
+Enabled = False # Are we recording?
+
+__Histograms = {} # name: Histogram
+__Counters = {} # name: count
+__Started = time.time() # When we started recording
+
+
+def NewHistogram():
+    # A histogram is a list: [count, total seconds, longest seconds, then the count in each bucket]. A list rather
+    # than a class because Stop is in the hot path and indexing a list costs about half as much as updating attributes.
+    # Only one thread records each stage, so there are no locks; a snapshot taken while a value is being recorded may
+    # be off by that one value.
+
+    return [0, 0.0, 0.0] + [0] * (len(BUCKET_BOUNDS) + 1)
+
+
+def Percentile(Histogram, Percent):
+    # Returns: The upper bound (in seconds) of the bucket the Percent'th percentile falls in, the longest time recorded
+    # for the last bucket
+
+    Wanted = Histogram[COUNT] * Percent / 100.0
+    Seen = 0
+
+    for Bucket, Count in enumerate(Histogram[BUCKETS:]):
+
+        Seen += Count
+
+        if Count > 0 and Seen >= Wanted:
+            return BUCKET_BOUNDS[Bucket] if Bucket < len(BUCKET_BOUNDS) else Histogram[LONGEST]
+
+    return 0.0
+
+
+def HistogramSnapshot(Histogram):
+
+    return {'count': Histogram[COUNT], 'total_ms': 1000.0 * Histogram[TOTAL],
+            'mean_ms': 1000.0 * Histogram[TOTAL] / Histogram[COUNT] if Histogram[COUNT] > 0 else 0.0,
+            'max_ms': 1000.0 * Histogram[LONGEST], 'p50_ms': 1000.0 * Percentile(Histogram, 50),
+            'p95_ms': 1000.0 * Percentile(Histogram, 95), 'p99_ms': 1000.0 * Percentile(Histogram, 99),
+            'buckets': list(Histogram[BUCKETS:])}
+
+
+def Enable():
+    # Start recording
+
+    global Enabled
+
+    Enabled = True
+
+
+def Disable():
+
+    global Enabled
+
+    Enabled = False
+
+
+def Reset():
+    # Forget everything recorded so far
+
+    global __Started
+
+    __Histograms.clear()
+    __Counters.clear()
+    __Started = time.time()
+
+
+def Start():
+    # Returns: The time now to hand to Stop, or None when we aren't recording
+
+    if Enabled:
+        return Clock()
+
+    return None
+
+
+def Stop(Name, Started):
+    # Record how long the stage Name took since Start
+
+    if Started is None:
+        return
+
+    Seconds = Clock() - Started
+    Histogram = __Histograms.get(Name) # The same as Record, but one call less in the hot path
+
+    if Histogram is None:
+        Histogram = __Histograms.setdefault(Name, NewHistogram())
+
+    Histogram[BUCKETS + bisect_left(BUCKET_BOUNDS, Seconds)] += 1
+    Histogram[COUNT] += 1
+    Histogram[TOTAL] += Seconds
+
+    if Seconds > Histogram[LONGEST]:
+        Histogram[LONGEST] = Seconds
+
+
+def Record(Name, Seconds):
+    # Record a duration we timed ourselves (ie. an importer phase)
+
+    if not Enabled:
+        return
+
+    Histogram = __Histograms.get(Name)
+
+    if Histogram is None:
+        Histogram = __Histograms.setdefault(Name, NewHistogram())
+
+    Histogram[BUCKETS + bisect_left(BUCKET_BOUNDS, Seconds)] += 1
+    Histogram[COUNT] += 1
+    Histogram[TOTAL] += Seconds
+
+    if Seconds > Histogram[LONGEST]:
+        Histogram[LONGEST] = Seconds
+
+
+def Count(Name, Amount=1):
+
+    if not Enabled:
+        return
+
+    __Counters[Name] = __Counters.get(Name, 0) + Amount
+
+
+def Snapshot():
+    # Returns: Everything recorded so far as a dictionary (ready for json.dumps)
+
+    return {'time': time.time(), 'uptime': time.time() - __Started, 'bucket_bounds_us': [int(round(Bound * 1e6))
+                                                                                          for Bound in BUCKET_BOUNDS],
+            'histograms': dict((Name, HistogramSnapshot(Histogram)) for Name, Histogram in list(__Histograms.items())),
+            'counters': dict(__Counters)}
+
+
+def WriteSnapshot(Filename):
+    # Write a snapshot to a file, replacing the last one in one go so a reader never sees half of it
+
+    import json
+
+    Temporary = Filename + '.tmp'
+
+    with open(Temporary, 'w') as File:
+        json.dump(Snapshot(), File, indent=1, sort_keys=True)
+
+    os.rename(Temporary, Filename)
+
+
+class Reporter(threading.Thread):
+
+    # Every Interval seconds writes a snapshot to Filename and/or sends it (one line of JSON) to every client connected
+    # to Port on this machine, ie. nc localhost 1338
+
+    def __init__(self, Filename=None, Port=None, Interval=REPORT_INTERVAL):
+
+        threading.Thread.__init__(self)
+        self.daemon = True # Don't hold up the app on exit
+
+        self.__Filename = Filename
+        self.__Interval = Interval
+        self.__Clients = []
+        self.__Closed = threading.Event()
+        self.__Listener = None
+
+        if not Port is None:
+
+            import socket
+
+            self.__Listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.__Listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.__Listener.bind(('127.0.0.1', Port)) # Local only
+            self.__Listener.listen(5)
+
+    def run(self):
+
+        import json
+        import select
+
+        NextReport = time.time() + self.__Interval
+
+        while not self.__Closed.is_set():
+
+            Wait = max(NextReport - time.time(), 0.0)
+
+            if self.__Listener is None:
+                self.__Closed.wait(Wait)
+
+            elif len(select.select([self.__Listener], [], [], min(Wait, 1.0))[0]) > 0: # Someone connected
+
+                Client, Address = self.__Listener.accept()
+                self.__Clients.append(Client)
+                self.__Send(Client, json.dumps(Snapshot()) + '\n') # Something to look at right away
+                continue
+
+            if time.time() >= NextReport and not self.__Closed.is_set():
+
+                NextReport += self.__Interval
+                self.Report()
+
+        for Client in self.__Clients:
+            Client.close()
+
+        if not self.__Listener is None:
+            self.__Listener.close()
+
+    def Report(self):
+
+        if not self.__Filename is None:
+
+            try:
+                WriteSnapshot(self.__Filename)
+
+            except (IOError, OSError) as Error:
+                Echo('Could not write instrumentation snapshot: ' + str(Error))
+
+        if len(self.__Clients) > 0:
+
+            import json
+
+            Line = json.dumps(Snapshot()) + '\n'
+
+            for Client in list(self.__Clients):
+                self.__Send(Client, Line)
+
+    def __Send(self, Client, Line):
+
+        import socket
+
+        try:
+            Client.sendall(Line.encode())
+
+        except socket.error: # They went away
+
+            self.__Clients.remove(Client)
+            Client.close()
+
+    def Close(self):
+
+        self.__Closed.set()
@@ -0,0 +1,191 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Location lookups on a thread of their own, always working on the newest GPS fix.
+#
+# The GPS hands us fixes faster than we can look some of them up (at an intersection, or when the page cache is cold).
+# Fixes wait in a mailbox with a single slot: a new fix replaces the one waiting, so once the worker is free it always
+# picks up where we are now rather than where we were a few fixes ago.
+
+import threading
+import time
+from common import Echo
+import instrument
+
+
+class Mailbox():
+
+    # Holds one item. Put replaces whatever is waiting, Get waits for something to arrive.
+
+    def __init__(self):
+
+        self.__Condition = threading.Condition()
+        self.__Item = None
+        self.__Posted = None # When the waiting item was Put
+        self.__Full = False
+        self.__Closed = False
+        self.__Coalesced = 0 # Items replaced before anyone took them
+
+    def Put(self, Item):
+
+        with self.__Condition:
+
+            if self.__Full:
+                self.__Coalesced += 1
+
+            self.__Item = Item
+            self.__Posted = time.time()
+            self.__Full = True
+
+            self.__Condition.notify()
+
+    def Get(self):
+        # Returns: (Item, time it was Put), or None once the mailbox is closed
+
+        with self.__Condition:
+
+            while not self.__Full and not self.__Closed:
+                self.__Condition.wait()
+
+            if self.__Closed:
+                return None
+
+            self.__Full = False
+
+            return self.__Item, self.__Posted
+
+    def Waiting(self):
+        # Returns: True if there's something waiting to be picked up
+
+        with self.__Condition:
+            return self.__Full
+
+    def Coalesced(self):
+
+        return self.__Coalesced
+
+    def Close(self):
+
+        with self.__Condition:
+
+            self.__Closed = True
+            self.__Condition.notify()
+
+
+class LocationWorker(threading.Thread):
+
+    # Runs Lookup(Fix) for the newest fix Posted and hands anything it returns (other than None) to Publish.
+    # Lookup runs on this thread only, so it can keep its own state without locks. Publish is called from this thread
+    # too, connect it to a queued Qt signal to get the result onto the GUI thread.
+    # Prepare() (if given) is called on this thread after each lookup, unless another fix is already waiting, to get
+    # ready for the next fix (see predictor.py).
+
+    def __init__(self, Lookup, Publish, Prepare=None):
+
+        threading.Thread.__init__(self)
+        self.daemon = True # Don't hold up the app on exit
+
+        self.__Lookup = Lookup
+        self.__Publish = Publish
+        self.__Prepare = Prepare
+        self.__Mailbox = Mailbox()
+        self.__Lock = threading.Lock()
+
+        # Statistics
+        self.__Posted = 0
+        self.__Lookups = 0
+        self.__Failures = 0
+        self.__WaitTotal = 0.0 # Seconds fixes spent in the mailbox before we picked them up
+        self.__WaitLongest = 0.0
+        self.__LookupTotal = 0.0 # Seconds spent in Lookup
+        self.__LookupLongest = 0.0
+
+    def Post(self, Fix):
+        # Safe to call from any thread, never blocks
+
+        with self.__Lock:
+            self.__Posted += 1
+
+        self.__Mailbox.Put(Fix)
+
+    def run(self):
+
+        while True:
+
+            Letter = self.__Mailbox.Get()
+
+            if Letter is None: # Closed
+                break
+
+            Fix, Posted = Letter
+
+            Start = time.time()
+
+            try:
+                Result = self.__Lookup(Fix)
+
+            except Exception as Error: # Keep going, the next fix may be fine
+                Echo('Location lookup failed: ' + str(Error))
+                Result = None
+
+                with self.__Lock:
+                    self.__Failures += 1
+
+            Finish = time.time()
+
+            instrument.Record('location.wait', Start - Posted)
+            instrument.Record('location.lookup', Finish - Start)
+
+            with self.__Lock:
+
+                self.__Lookups += 1
+                self.__WaitTotal += Start - Posted
+                self.__WaitLongest = max(self.__WaitLongest, Start - Posted)
+                self.__LookupTotal += Finish - Start
+                self.__LookupLongest = max(self.__LookupLongest, Finish - Start)
+
+            if not Result is None:
+                self.__Publish(Result)
+
+            if not self.__Prepare is None and not self.__Mailbox.Waiting():
+
+                Start = time.time()
+
+                try:
+                    self.__Prepare()
+
+                except Exception as Error: # Only getting ready, the next fix will be looked up anyway
+                    Echo('Getting ready for the next fix failed: ' + str(Error))
+
+                instrument.Record('location.prepare', time.time() - Start)
+
+    def Statistics(self):
+        # Fixes posted, looked up, failed and coalesced (replaced by a newer fix before we got to them), mean and longest
+        # seconds waiting in the mailbox and spent looking up
+
+        with self.__Lock:
+
+            Lookups = max(self.__Lookups, 1)
+
+            return {'posted': self.__Posted, 'lookups': self.__Lookups, 'failures': self.__Failures,
+                    'coalesced': self.__Mailbox.Coalesced(),
+                    'wait': self.__WaitTotal / Lookups, 'wait_longest': self.__WaitLongest,
+                    'lookup': self.__LookupTotal / Lookups, 'lookup_longest': self.__LookupLongest}
+
+    def Close(self):
+
+        self.__Mailbox.Close()
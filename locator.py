@@ -0,0 +1,193 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Works out where we are from each GPS fix: the street we're on and the cross streets at an intersection. Only needs the
+# database, so it runs the same in the GUI (see eventmanager.py, which runs it on a LocationWorker and shows the
+# answers), in a batch job or on a server.
+
+import time
+import instrument
+from tracker import StreetTracker
+from predictor import Predictor
+
+
+class Locator():
+
+    def __init__(self, Database, StreetGraph=None, LookAhead=True):
+        # Usage: Locator(Database, Database.LoadStreetGraph()) - call Locate (and Prepare) from one thread only, it keeps
+        # its state without locks. LookAhead=False doesn't keep SpeedLimitsAhead up to date (nobody's watching).
+
+        self.__Database = Database
+        self.__StreetGraph = StreetGraph # Intersections in memory (None if the database has none)
+        self.__WatchSpeedLimits = LookAhead
+
+        self.__Location_ClosestNodeID = None # Store the node id of the node closest to our current gps coordinates
+        self.__Location_LastKnownNodeID = None # Store the node id of the last known node that is NOT an intersection
+        # ^ used to determine what road your travelling on when you encounter an intersection since an intersection will report
+        # more than one road. The last known node id that was not an intersection node will only belong to the road you were travelling on
+        # so you can assume that if it doesnt belong to the other roads reported back, then those roads are your cross streets and can be
+        # treated as such.
+        self.__Location_LastKnownWayID = None # Store the way (street) the last known node belongs to
+        self.__Tracker = StreetTracker() # Follows the street we're on so most fixes don't need a lookup at all
+        self.__Predictor = Predictor() # Looks up where the next fix will be before it arrives
+        self.__SpeedLimitsAhead = () # Replaced whole on the Locate thread, read on any (see SpeedLimitsAhead)
+
+    def Statistics(self):
+        # The fixes the tracker skipped and lookups per km (see StreetTracker.Statistics), how often the answer was
+        # looked up before the fix arrived and the time that saved (see Predictor.Statistics)
+
+        Statistics = dict(('tracker_' + Key, Value) for Key, Value in self.__Tracker.Statistics().items())
+        Statistics.update(('prediction_' + Key, Value) for Key, Value in self.__Predictor.Statistics().items())
+
+        return Statistics
+
+    def Following(self):
+        # Returns: The wayid of the street we're following as of the last fix, None if we aren't on one (off the map, or
+        # nothing located yet)
+
+        return self.__Tracker.WayID()
+
+    def SpeedLimitsAhead(self):
+        # Purpose: To tell the officer about the speed limit changes coming up on the street we're on (and the ones it
+        # carries on to) as of the last fix. Safe to call from any thread.
+        # Returns: ((km ahead of us, Street with the new speed limit), ...) closest first, empty if there aren't any
+        # within SPEED_LOOKAHEAD_DISTANCE of the end of the street or we don't know which way we're going on it
+
+        return self.__SpeedLimitsAhead
+
+    def __Follow(self, wayid):
+
+        # Have the tracker follow the street we're on (only fetch its shape when it's a different street)
+        if not self.__Tracker.WayID() == wayid:
+            self.__Tracker.Follow(wayid, self.__Database.FetchWayGeometry(wayid))
+
+    def Locate(self, Fix):
+        # Purpose: To work out where we are from a fix (a GpsFix, see gpsfix.py)
+        # Returns: (Street we're on or None, [cross Streets]) or None if nothing changed
+
+        Coordinates = (Fix.lat, Fix.lon)
+        Bearing = Fix.track if Fix.speed else None # It's meaningless while stopped
+
+        self.__Predictor.Update(Fix)
+
+        OnStreet = self.__Tracker.Check(Coordinates, Bearing)
+
+        if self.__WatchSpeedLimits:
+            self.__LookAhead()
+
+        if OnStreet:
+
+            instrument.Count('location.skipped')
+            self.__Predictor.Discard()
+            return None # Still on the street we were on and nowhere near an intersection, nothing could have changed
+
+        ClosestNodeID = self.__Database.FindClosestNode(Coordinates)
+        Answer = self.__Predictor.Take(ClosestNodeID) # Already looked up, if we're where we expected to be (see Prepare)
+
+        if Answer is None:
+            Answer = self.__Lookup(ClosestNodeID)
+
+        else:
+            instrument.Count('location.predicted')
+
+        (self.__Location_ClosestNodeID, self.__Location_LastKnownNodeID, self.__Location_LastKnownWayID), Follow, \
+            Location = Answer
+
+        if Follow is False:
+            self.__Tracker.Forget()
+
+        elif not Follow is None:
+            self.__Follow(Follow)
+
+        return Location
+
+    def __LookAhead(self):
+
+        # Where the speed limit changes ahead of us: the changes past the end of the street (worked out once for each
+        # street and direction, see DataBase.SpeedLimitsAhead) plus how far we are from the end of it
+        Position = self.__Tracker.Position()
+        Changes = None if Position is None else self.__Database.SpeedLimitsAhead(Position[0], Position[1])
+
+        if Changes is None:
+            self.__SpeedLimitsAhead = ()
+
+        else:
+            self.__SpeedLimitsAhead = tuple((Position[2] + Distance, Street) for Distance, Street in Changes)
+
+    def Prepare(self):
+        # Purpose: To look up where we expect the next fix to be, so if that's where it lands (see Locate) the answer
+        # is ready. Call it between fixes on the Locate thread (see LocationWorker).
+
+        Predicted = self.__Predictor.Predict()
+
+        if Predicted is None or self.__Tracker.Covers(Predicted[:2], Predicted[2]): # That fix won't need a lookup
+            return
+
+        ClosestNodeID = self.__Database.FindClosestNode(Predicted[:2])
+
+        Started = time.time()
+        Answer = self.__Lookup(ClosestNodeID)
+
+        self.__Predictor.Store(ClosestNodeID, Answer, time.time() - Started)
+
+    def __Lookup(self, ClosestNodeID):
+
+        # Works out where we are from the node closest to us and our last known node and way, without changing them,
+        # so it can be used for a fix we only expect too (see Prepare)
+        # Returns: ((closest node id, last known node id, last known way id) to remember, the way the tracker should
+        # follow (None to leave it be, False to stop following), (Street we're on or None, [cross Streets]) or None if
+        # nothing changed)
+
+        LastKnownNodeID = self.__Location_LastKnownNodeID
+        LastKnownWayID = self.__Location_LastKnownWayID
+
+        if ClosestNodeID == LastKnownNodeID:
+            # Our last known location is the same as our closest ID so theres no point running a database check to
+            # find out what street we are on, because we already know. Only run a check when our ClosestNodeID and our
+            # LastKnownNodeID don't match. (ie. we've moved)
+
+            return (ClosestNodeID, LastKnownNodeID, LastKnownWayID), None, None # No need to check any further, we know where we are
+
+        if not self.__Database.IsIntersection(ClosestNodeID): # Our current location is NOT an intersection
+
+            LastKnownNodeID = ClosestNodeID # Keep track of the last known node thats not an intersection
+
+            Streets = self.__Database.FetchStreets(ClosestNodeID) # Check database for list of streets connected to the node we're close to
+
+            if Streets is None:
+                return (ClosestNodeID, LastKnownNodeID, LastKnownWayID), False, None
+
+            LastKnownWayID = Streets[0].WayID() # Not an intersection, so there is only one
+
+            return (ClosestNodeID, LastKnownNodeID, LastKnownWayID), LastKnownWayID, (Streets[0], [])
+
+        else:
+            # We are at or close to an intersection so we need to do some figuring out to determine which street we are actually
+            # travelling on and which streets intersect.
+
+            # 1. Check each street, 2. If our last known node is a part of that street then that is the street we are currently on
+            # 2. Or don't do a street check. (Remain on last known road until known otherwise)
+
+            if self.__StreetGraph is None:
+                return (ClosestNodeID, LastKnownNodeID, LastKnownWayID), None, None
+
+            Location = self.__StreetGraph.Resolve(ClosestNodeID, LastKnownWayID, LastKnownNodeID)
+
+            # Keep following the street we're on through the intersection
+            Follow = None if Location[0] is None else Location[0].WayID()
+
+            return (ClosestNodeID, LastKnownNodeID, LastKnownWayID), Follow, Location
@@ -0,0 +1,576 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compact read-only map file, written by the importer from geo.sqlite (osm-importer.py -m) and read with mmap.
+#
+# Nothing is loaded when the file is opened. Every lookup reads the few bytes it needs straight out of the mapping with
+# struct.unpack_from, so the only memory used is the pages of the file the OS keeps cached (and can drop at any time).
+#
+# Layout (little endian, every section starts on an 8 byte boundary):
+#   header            magic, version, cell size, node count, way count, then (offset, count) of each section below
+#   nodes             (lat float32, lon float32, osmid int64) per node, sorted by grid cell along a Z-order (Morton)
+#                     curve so the nodes of cells next to each other are usually close together in the file
+#   cell_keys         int64 Morton key of each grid cell that holds nodes, sorted
+#   cell_starts       uint32 position of each cell's first node (plus one past the end)
+#   osmids            int64 every osmid, sorted, to find a node by osmid
+#   osmid_slots       uint32 position in nodes of each of the osmids above
+#   node_way_starts   uint32 position of each node's first way in node_ways (plus one past the end)
+#   node_ways         uint32 position in ways of each way a node belongs to
+#   ways              (wayid int64, street name, lanes, maxspeed, street type, oneway) per way, sorted by wayid.
+#                     The text columns are positions in the string table.
+#   way_node_starts   uint32 position of each way's first node in way_nodes (plus one past the end)
+#   way_nodes         uint32 position in nodes of each node of a way, in order (MISSING_NODE if we have no coordinates)
+#   string_starts     uint32 position of each string in strings (plus one past the end)
+#   strings           UTF-8 text of every street name, lane count, speed limit and street type, stored once each
+#
+# Size per million street nodes is about 16 MB of nodes, 12 MB of osmid index, 9 MB of node to way links, 5 MB of way
+# nodes and a few MB of cells, ways and strings: around 43 MB, a quarter of the same map in geo.sqlite.
+
+import os
+import math
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+from geolib import DistancesFrom, EARTH_RADIUS
+from spatialindex import CELL_SIZE, INT64_TYPECODE
+
+MAGIC = b'PDPMAP\r\n' # Also catches a file mangled by newline conversion
+VERSION = 1
+
+MISSING_NODE = 0xFFFFFFFF  # way_nodes entry of a node we have no coordinates for
+FENCE_STEP = 64  # Keep every 64th cell key and osmid in memory so a search only reads a few entries of the file
+
+SECTIONS = ('nodes', 'cell_keys', 'cell_starts', 'osmids', 'osmid_slots', 'node_way_starts', 'node_ways', 'ways',
+            'way_node_starts', 'way_nodes', 'string_starts', 'strings')
+
+HEADER = struct.Struct('<8sIdQQ')
+SECTION = struct.Struct('<QQ') # Offset, number of entries
+NODE = struct.Struct('<ffq')
+WAY = struct.Struct('<qIIIII')
+INT64 = struct.Struct('<q')
+UINT32 = struct.Struct('<I')
+
+KM_PER_DEGREE = math.radians(1) * EARTH_RADIUS  # Length of a degree of lattitude in km
+
+
+def __Spread(Value):
+    # Put a zero bit between each of the lower 32 bits of Value
+
+    Value &= 0xFFFFFFFF
+    Value = (Value | (Value << 16)) & 0x0000FFFF0000FFFF
+    Value = (Value | (Value << 8)) & 0x00FF00FF00FF00FF
+    Value = (Value | (Value << 4)) & 0x0F0F0F0F0F0F0F0F
+    Value = (Value | (Value << 2)) & 0x3333333333333333
+
+    return (Value | (Value << 1)) & 0x5555555555555555
+
+
+def CellKey(Row, Column):
+    # Morton key of a grid cell: the bits of its row and column interleaved. Rows and columns are counted from the South
+    # Pole and the anti-meridian so they are never negative.
+
+    return (__Spread(Row) << 1) | __Spread(Column)
+
+
+def CellOf(Lattitude, Longitude, CellSize=CELL_SIZE):
+
+    return int(math.floor((Lattitude + 90.0) / CellSize)), int(math.floor((Longitude + 180.0) / CellSize))
+
+
+class MappedArray():
+
+    # Read-only view of an array of fixed size values in the map file. Supports len() and indexing, so bisect works on it.
+
+    def __init__(self, Map, Offset, Count, Format):
+
+        self.__Map = Map
+        self.__Offset = Offset
+        self.__Count = Count
+        self.__Format = Format
+        self.__TypeCode = Format.format[-1:] # ie. 'q' of '<q'
+
+    def __len__(self):
+
+        return self.__Count
+
+    def __getitem__(self, Position):
+
+        return self.__Format.unpack_from(self.__Map, self.__Offset + Position * self.__Format.size)[0]
+
+    def Slice(self, Start, End):
+        # Values Start to End (not included) as a tuple, read in one go
+
+        return struct.unpack_from('<' + str(End - Start) + self.__TypeCode, self.__Map,
+                                  self.__Offset + Start * self.__Format.size)
+
+
+class MapFile():
+
+    def __init__(self, Filename):
+
+        self.__File = open(Filename, 'rb')
+        self.__Map = mmap.mmap(self.__File.fileno(), 0, access=mmap.ACCESS_READ)
+
+        Magic, Version, self.__CellSize, self.__NodeCount, self.__WayCount = HEADER.unpack_from(self.__Map, 0)
+
+        if not Magic == MAGIC or not Version == VERSION:
+
+            self.Close()
+            raise Exception('Not a map file (or written by a different version of the importer): ' + str(Filename))
+
+        self.__Sections = {}
+
+        for Number, Name in enumerate(SECTIONS):
+            self.__Sections[Name] = SECTION.unpack_from(self.__Map, HEADER.size + Number * SECTION.size)
+
+        self.__CellKeys = self.__Array('cell_keys', INT64)
+        self.__CellStarts = self.__Array('cell_starts', UINT32)
+        self.__OSMIDs = self.__Array('osmids', INT64)
+        self.__OSMIDSlots = self.__Array('osmid_slots', UINT32)
+        self.__NodeWayStarts = self.__Array('node_way_starts', UINT32)
+        self.__NodeWays = self.__Array('node_ways', UINT32)
+        self.__StringStarts = self.__Array('string_starts', UINT32)
+
+        self.__Nodes = self.__Sections['nodes'][0]
+        self.__Ways = self.__Sections['ways'][0]
+        self.__Strings = self.__Sections['strings'][0]
+
+        self.__StringCache = {} # A few hundred street names and types, decoded once
+
+        # Every FENCE_STEP'th key of the sorted sections we search (about 0.1 bytes per node)
+        self.__CellFence = self.__Fence(self.__CellKeys)
+        self.__OSMIDFence = self.__Fence(self.__OSMIDs)
+
+    def __Array(self, Name, Format):
+
+        Offset, Count = self.__Sections[Name]
+
+        return MappedArray(self.__Map, Offset, Count, Format)
+
+    def __Fence(self, Values):
+
+        return array(INT64_TYPECODE, [Values[Position] for Position in range(0, len(Values), FENCE_STEP)])
+
+    def __Search(self, Values, Fence, Value):
+        # Returns: Position of Value in the sorted Values (or where it would go) and whether it is there.
+        # The in-memory Fence narrows the search down to one block of FENCE_STEP values, read from the file at once.
+
+        Block = bisect_left(Fence, Value)
+        Start = max(Block - 1, 0) * FENCE_STEP
+
+        Entries = Values.Slice(Start, min(Block * FENCE_STEP + 1, len(Values)))
+        Position = bisect_left(Entries, Value)
+
+        return Start + Position, Position < len(Entries) and Entries[Position] == Value
+
+    def Close(self):
+
+        self.__Map.close()
+        self.__File.close()
+
+    def NodeCount(self):
+
+        return self.__NodeCount
+
+    def WayCount(self):
+
+        return self.__WayCount
+
+    def FileSize(self):
+
+        return len(self.__Map)
+
+    def __Node(self, Slot):
+        # (lat, lon, osmid) of the node at position Slot
+
+        return NODE.unpack_from(self.__Map, self.__Nodes + Slot * NODE.size)
+
+    def __SlotOf(self, osmid):
+        # Position of a node in the nodes section, or None if we don't have it
+
+        Position, Found = self.__Search(self.__OSMIDs, self.__OSMIDFence, osmid)
+
+        if Found:
+            return self.__OSMIDSlots[Position]
+
+        return None
+
+    def __String(self, Number):
+
+        String = self.__StringCache.get(Number)
+
+        if String is None:
+
+            Start = self.__Strings + self.__StringStarts[Number]
+            End = self.__Strings + self.__StringStarts[Number + 1]
+
+            String = self.__StringCache[Number] = self.__Map[Start:End].decode('utf-8')
+
+        return String
+
+    def NodeCoordinates(self, osmid):
+        # Returns: (lat, lon) of a node or None if we don't have it
+
+        Slot = self.__SlotOf(osmid)
+
+        if Slot is None:
+            return None
+
+        Lattitude, Longitude, osmid = self.__Node(Slot)
+
+        return Lattitude, Longitude
+
+    def WaysOfNode(self, osmid):
+        # Purpose: To find the ways a node belongs to and their way_info rows (the same answer as TileCache.WaysOfNode)
+        # Returns: A list of (wayid, (street_name, num_of_lanes, maxspeed, street_type, oneway)) tuples, or None if we
+        # don't have the node
+
+        Slot = self.__SlotOf(osmid)
+
+        if Slot is None:
+            return None
+
+        Ways = []
+        Start, End = self.__NodeWayStarts.Slice(Slot, Slot + 2)
+
+        for Position in range(Start, End):
+
+            wayid, Name, Lanes, MaxSpeed, Type, OneWay = WAY.unpack_from(self.__Map,
+                                                                         self.__Ways + self.__NodeWays[Position] * WAY.size)
+
+            Lanes = self.__String(Lanes)
+
+            if Lanes.isdigit(): # Stored in an INT column in geo.sqlite, so SQLite hands back a number when it is one
+                Lanes = int(Lanes)
+
+            Ways.append((wayid, (self.__String(Name), Lanes, self.__String(MaxSpeed), self.__String(Type), OneWay)))
+
+        return Ways
+
+    def WayCountOfNode(self, osmid):
+        # Number of ways a node belongs to (more than 1 is an intersection), None if we don't have the node
+
+        Slot = self.__SlotOf(osmid)
+
+        if Slot is None:
+            return None
+
+        Start, End = self.__NodeWayStarts.Slice(Slot, Slot + 2)
+
+        return End - Start
+
+    def FindClosestNode(self, Coordinates, MaxDistance):
+        # Purpose: To find the node closest to our location and how far away it is
+        # Returns: (osmid, distance in km) or None if no node is within MaxDistance
+
+        Nodes = self.FindClosestNodes(Coordinates, 1, MaxDistance)
+
+        if len(Nodes) == 0:
+            return None
+
+        return Nodes[0]
+
+    def FindClosestNodes(self, Coordinates, Count, MaxDistance):
+        # Purpose: To find the closest nodes to our location
+        # Usage: FindClosestNodes((43.894655, -78.802791), 5, 1.0)
+        # Returns: A list of up to Count (osmid, distance in km) tuples sorted closest first
+        #
+        # The same ring by ring search as SpatialIndex.FindClosestNodes. The cells aren't in row order here, so each cell
+        # of a ring is looked up on its own.
+
+        Lattitude = float(Coordinates[0])
+        Longitude = float(Coordinates[1])
+
+        LongitudeScale = math.cos(math.radians(Lattitude)) # A degree of longitude is shorter than a degree of lattitude
+        CellSize = self.__CellSize
+        MaxRing = int(MaxDistance / (KM_PER_DEGREE * LongitudeScale * CellSize)) + 1
+
+        Row, Column = CellOf(Lattitude, Longitude, CellSize)
+
+        # How far (in degrees) we are from each edge of our own cell
+        RowStart = Row * CellSize - 90.0
+        ColumnStart = Column * CellSize - 180.0
+        ToEdge = min(Lattitude - RowStart, RowStart + CellSize - Lattitude,
+                     (Longitude - ColumnStart) * LongitudeScale, (ColumnStart + CellSize - Longitude) * LongitudeScale)
+
+        Candidates = [] # (approximate distance squared in degrees, lat, lon, osmid), closest Count nodes so far
+        Furthest = None # Distance squared of the furthest of our Candidates once we have Count of them
+
+        Ring = 0
+
+        while Ring <= MaxRing:
+
+            for CellRow, CellColumn in self.__Ring(Row, Column, Ring):
+
+                Position, Found = self.__Search(self.__CellKeys, self.__CellFence, CellKey(CellRow, CellColumn))
+
+                if not Found:
+                    continue # No nodes in this cell
+
+                Start, End = self.__CellStarts.Slice(Position, Position + 2)
+
+                for Slot in range(Start, End):
+
+                    Node = self.__Node(Slot)
+
+                    DeltaLattitude = Node[0] - Lattitude
+                    DeltaLongitude = (Node[1] - Longitude) * LongitudeScale
+                    Distance = DeltaLattitude * DeltaLattitude + DeltaLongitude * DeltaLongitude
+
+                    if Furthest is None or Distance < Furthest:
+
+                        Candidates.append((Distance,) + Node)
+
+                        if len(Candidates) >= Count:
+
+                            Candidates.sort()
+                            del Candidates[Count:]
+                            Furthest = Candidates[-1][0]
+
+            # Nothing outside of the rings we've searched can be closer than this many degrees
+            Searched = ToEdge + Ring * CellSize * LongitudeScale
+
+            if not Furthest is None and Furthest <= Searched * Searched:
+                break
+
+            Ring += 1
+
+        Nodes = []
+        Distances = DistancesFrom(Coordinates, [(Candidate[1], Candidate[2]) for Candidate in Candidates])
+
+        for Candidate, NodeDistance in zip(Candidates, Distances):
+
+            if NodeDistance <= MaxDistance:
+                Nodes.append((Candidate[3], NodeDistance))
+
+        Nodes.sort(key=lambda Node: Node[1])
+
+        return Nodes[:Count]
+
+    def __Ring(self, Row, Column, Ring):
+        # The cells that are exactly Ring cells away from (Row, Column)
+
+        if Ring == 0:
+            return [(Row, Column)]
+
+        Cells = [(Row - Ring, Offset) for Offset in range(Column - Ring, Column + Ring + 1)] # Bottom edge
+        Cells.extend((Row + Ring, Offset) for Offset in range(Column - Ring, Column + Ring + 1)) # Top edge
+
+        for Offset in range(Row - Ring + 1, Row + Ring):
+
+            Cells.append((Offset, Column - Ring)) # Left edge
+            Cells.append((Offset, Column + Ring)) # Right edge
+
+        return Cells
+
+
+def Write(Cursor, Filename, CellSize=CELL_SIZE):
+    # Purpose: To write a map file from the tables of geo.sqlite
+    # Usage: Write(sqlite3.connect('sqlite/geo.sqlite').cursor(), 'sqlite/geo.map')
+    # The file is written next to Filename and renamed over it once it is complete, so a DashPad using the old file
+    # keeps its mapping of the old one until it reconnects.
+
+    # Nodes, sorted along the Morton curve (and by osmid within a cell so the file is always the same)
+    OSMIDs = array(INT64_TYPECODE)
+    Lattitudes = array('f')
+    Longitudes = array('f')
+    Keys = []
+
+    Cursor.execute('''SELECT osmid, min_lat, min_lon FROM nodes;''')
+
+    for osmid, Lattitude, Longitude in Cursor:
+
+        OSMIDs.append(osmid)
+        Lattitudes.append(Lattitude)
+        Longitudes.append(Longitude)
+        Keys.append(CellKey(*CellOf(Lattitude, Longitude, CellSize)))
+
+    NodeCount = len(OSMIDs)
+    Order = sorted(range(NodeCount), key=lambda Node: (Keys[Node], OSMIDs[Node]))
+
+    Nodes = bytearray(NODE.size * NodeCount)
+    CellKeys = []
+    CellStarts = []
+
+    for Slot, Node in enumerate(Order):
+
+        NODE.pack_into(Nodes, Slot * NODE.size, Lattitudes[Node], Longitudes[Node], int(OSMIDs[Node]))
+
+        if len(CellKeys) == 0 or not CellKeys[-1] == Keys[Node]:
+
+            CellKeys.append(Keys[Node])
+            CellStarts.append(Slot)
+
+    CellStarts.append(NodeCount)
+
+    Keys = Lattitudes = Longitudes = None # Clean up
+
+    # osmid -> position in nodes
+    SortedSlots = sorted(range(NodeCount), key=lambda Slot: OSMIDs[Order[Slot]])
+    SortedOSMIDs = [int(OSMIDs[Order[Slot]]) for Slot in SortedSlots]
+
+    Order = OSMIDs = None # Clean up
+
+    # Ways and the nodes they are made of
+    Strings = {}
+
+    def StringNumber(Value):
+
+        if Value is None:
+            Value = ''
+
+        if not isinstance(Value, type(u'')): # Numbers (ie. lanes) as text
+            Value = u'%s' % Value
+
+        return Strings.setdefault(Value, len(Strings))
+
+    Cursor.execute('''SELECT wayid, street_name, num_of_lanes, maxspeed, street_type, oneway FROM way_info
+    ORDER BY wayid;''')
+
+    WayIDs = []
+    Ways = bytearray()
+
+    for wayid, Name, Lanes, MaxSpeed, Type, OneWay in Cursor:
+
+        if len(WayIDs) > 0 and WayIDs[-1] == wayid:
+            continue # Only the first row of a way counts, the same as the way_info queries
+
+        WayIDs.append(wayid)
+        Ways.extend(WAY.pack(wayid, StringNumber(Name), StringNumber(Lanes), StringNumber(MaxSpeed),
+                             StringNumber(Type), 1 if OneWay else 0))
+
+    WayNodeStarts = array('I')
+    WayNodes = array('I')
+    NodeWayCounts = array('I', [0]) * NodeCount
+    Way = -1
+
+    Cursor.execute('''SELECT wayid, osmid FROM way_nodes ORDER BY wayid, orderid;''')
+
+    for wayid, osmid in Cursor:
+
+        if Way < 0 or not WayIDs[Way] == wayid:
+
+            Position = bisect_left(WayIDs, wayid, max(Way, 0))
+
+            if Position == len(WayIDs) or not WayIDs[Position] == wayid:
+                continue # No way_info, not a street
+
+            while len(WayNodeStarts) <= Position: # Start of this way (and of any ways before it that have no nodes)
+                WayNodeStarts.append(len(WayNodes))
+
+            Way = Position
+
+        Position = bisect_left(SortedOSMIDs, osmid)
+
+        if Position < NodeCount and SortedOSMIDs[Position] == osmid:
+            WayNodes.append(SortedSlots[Position])
+
+        else:
+            WayNodes.append(MISSING_NODE)
+
+    while len(WayNodeStarts) <= len(WayIDs):
+        WayNodeStarts.append(len(WayNodes))
+
+    # Node -> ways, with a counting sort. A way is listed once per node even if it passes through the node twice.
+    for Way in range(len(WayIDs)):
+
+        Slots = sorted(set(WayNodes[WayNodeStarts[Way]:WayNodeStarts[Way + 1]]) - set([MISSING_NODE]))
+
+        for Slot in Slots:
+            NodeWayCounts[Slot] += 1
+
+    NodeWayStarts = array('I', [0]) * (NodeCount + 1)
+
+    for Slot in range(NodeCount):
+        NodeWayStarts[Slot + 1] = NodeWayStarts[Slot] + NodeWayCounts[Slot]
+
+    NodeWays = array('I', [0]) * NodeWayStarts[NodeCount]
+    NextSlot = NodeWayStarts[:NodeCount]
+
+    for Way in range(len(WayIDs)):
+
+        for Slot in sorted(set(WayNodes[WayNodeStarts[Way]:WayNodeStarts[Way + 1]]) - set([MISSING_NODE])):
+
+            NodeWays[NextSlot[Slot]] = Way
+            NextSlot[Slot] += 1
+
+    NodeWayCounts = NextSlot = None # Clean up
+
+    # String table
+    StringData = bytearray()
+    StringStarts = array('I')
+
+    for String, Number in sorted(Strings.items(), key=lambda Item: Item[1]):
+
+        StringStarts.append(len(StringData))
+        StringData.extend(String.encode('utf-8'))
+
+    StringStarts.append(len(StringData))
+
+    Sections = {'nodes': (Nodes, NodeCount),
+                'cell_keys': (__Pack(INT64, CellKeys), len(CellKeys)),
+                'cell_starts': (__Pack(UINT32, CellStarts), len(CellStarts)),
+                'osmids': (__Pack(INT64, SortedOSMIDs), len(SortedOSMIDs)),
+                'osmid_slots': (__Pack(UINT32, SortedSlots), len(SortedSlots)),
+                'node_way_starts': (__Pack(UINT32, NodeWayStarts), len(NodeWayStarts)),
+                'node_ways': (__Pack(UINT32, NodeWays), len(NodeWays)),
+                'ways': (Ways, len(WayIDs)),
+                'way_node_starts': (__Pack(UINT32, WayNodeStarts), len(WayNodeStarts)),
+                'way_nodes': (__Pack(UINT32, WayNodes), len(WayNodes)),
+                'string_starts': (__Pack(UINT32, StringStarts), len(StringStarts)),
+                'strings': (StringData, len(StringData))}
+
+    TemporaryFile = Filename + '.tmp'
+    FileHandle = open(TemporaryFile, 'wb')
+
+    Offset = __Align(HEADER.size + len(SECTIONS) * SECTION.size)
+    Table = bytearray(HEADER.pack(MAGIC, VERSION, float(CellSize), NodeCount, len(WayIDs)))
+
+    for Name in SECTIONS:
+
+        Data, Count = Sections[Name]
+        Table.extend(SECTION.pack(Offset, Count))
+        Offset = __Align(Offset + len(Data))
+
+    FileHandle.write(Table + bytearray(__Align(len(Table)) - len(Table)))
+
+    for Name in SECTIONS:
+
+        Data, Count = Sections[Name]
+        FileHandle.write(Data + bytearray(__Align(len(Data)) - len(Data)))
+
+    FileHandle.close()
+
+    os.rename(TemporaryFile, Filename)
+
+    return NodeCount, len(WayIDs)
+
+
+def __Pack(Format, Values):
+
+    Data = bytearray(Format.size * len(Values))
+
+    for Position, Value in enumerate(Values):
+        Format.pack_into(Data, Position * Format.size, Value)
+
+    return Data
+
+
+def __Align(Size):
+
+    return (Size + 7) & ~7
@@ -15,11 +15,129 @@ __author__ = 'Steve Hollaway'
 # You should have received a copy of the GNU General Public License
 # along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
 
-from imposm.parser import OSMParser
 import sqlite3
 import sys
 import getopt
 import os
+import time
+import resource
+import multiprocessing
+import gzip
+try:
+    from xml.etree import cElementTree # Python 2's fast one
+except ImportError:
+    from xml.etree import ElementTree as cElementTree # Python 3 is always fast
+from array import array
+from bisect import bisect_left
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # mapfile.py and instrument.py live with DashPad
+import instrument
+
+BATCH_SIZE = 50000 # Number of rows to buffer before writing them all at once in a single transaction
+PROGRESS_INTERVAL = 2.0 # Seconds between progress updates
+IMPORT_CACHE_SIZE = 256 * 1024 # Size of SQLite's page cache while importing in KB (256MB)
+WRITE_QUEUE_SIZE = 8 # Blocks of rows (BATCH_SIZE each) that can wait for the writer process before the parsers wait too
+DEFAULT_WORKERS = multiprocessing.cpu_count() # Parser processes, change with -j
+
+# Types of highway we store as streets
+STREET_TYPES = set(('motorway', 'trunk', 'primary', 'secondary', 'tertiary', 'unclassified', 'residential', 'service',
+                    'road', 'motorway_link', 'trunk_link', 'primary_link', 'secondary_link', 'tertiary_link'))
+
+NODE_PAGE_BITS = 16 # NodeIDSet groups node ids into pages of 65536 ids
+NODE_PAGE_LIMIT = 4096 # A page with more ids than this is stored as a bitmap (8KB, the same size as 4096 2-byte ids)
+
+
+class NodeIDSet():
+
+    # Compact set of the node ids referenced by the streets we keep.
+    # A Python set costs around 60 bytes per id. Here the ids are grouped into pages by their high bits and a page only
+    # stores the low 16 bits of each id: 2 bytes per id in a sorted array, or a bitmap once the page gets crowded.
+
+    def __init__(self):
+
+        self.__Pages = {} # High bits of the id: array('H') of low bits, or a bytearray bitmap
+        self.__Frozen = False
+
+    def AddMany(self, osmids):
+
+        Pages = self.__Pages
+        Mask = (1 << NODE_PAGE_BITS) - 1
+
+        for osmid in osmids:
+
+            Page = Pages.get(osmid >> NODE_PAGE_BITS)
+
+            if Page is None:
+                Page = Pages[osmid >> NODE_PAGE_BITS] = array('H')
+
+            if isinstance(Page, bytearray):
+                Page[(osmid & Mask) >> 3] |= 1 << (osmid & 7)
+
+            else:
+                Page.append(osmid & Mask)
+
+                if len(Page) > NODE_PAGE_LIMIT:
+                    Pages[osmid >> NODE_PAGE_BITS] = self.__Bitmap(Page)
+
+        self.__Frozen = False
+
+    def __Bitmap(self, Page):
+
+        Bitmap = bytearray(1 << (NODE_PAGE_BITS - 3))
+
+        for LowBits in Page:
+            Bitmap[LowBits >> 3] |= 1 << (LowBits & 7)
+
+        return Bitmap
+
+    def Freeze(self):
+        # Sort the pages (and drop duplicates, ie. intersections) so we can search them. Call once all the ids are in.
+
+        for High, Page in self.__Pages.items():
+
+            if not isinstance(Page, bytearray):
+                self.__Pages[High] = array('H', sorted(set(Page)))
+
+        self.__Frozen = True
+
+    def __contains__(self, osmid):
+
+        if not self.__Frozen:
+            self.Freeze()
+
+        Page = self.__Pages.get(osmid >> NODE_PAGE_BITS)
+
+        if Page is None:
+            return False
+
+        LowBits = osmid & ((1 << NODE_PAGE_BITS) - 1)
+
+        if isinstance(Page, bytearray):
+            return bool(Page[LowBits >> 3] & (1 << (LowBits & 7)))
+
+        Position = bisect_left(Page, LowBits)
+
+        return Position < len(Page) and Page[Position] == LowBits
+
+    def Count(self):
+        # Number of ids in the set (call Freeze first, duplicates are counted until then)
+
+        Count = 0
+
+        for Page in self.__Pages.values():
+
+            if isinstance(Page, bytearray):
+                Count += sum(bin(Byte).count('1') for Byte in Page if Byte)
+
+            else:
+                Count += len(Page)
+
+        return Count
+
+    def MemoryUsage(self):
+        # Approximate size in bytes (around 100 bytes of overhead for each page)
+
+        return sum(len(Page) * (1 if isinstance(Page, bytearray) else 2) + 100 for Page in self.__Pages.values())
 
 
 class DataBase():
@@ -28,23 +146,54 @@ class DataBase():
         self.db = None
         self.cursor = None
 
+        # Rows waiting to be written (see Flush)
+        self.NodeRows = []
+        self.WayInfoRows = []
+        self.WayNodeRows = []
+        self.WriteQueue = None # Hand the rows to a RowWriter process instead of writing them ourselves (see SetWriteQueue)
+
+        # Progress
+        self.StartTime = time.time()
+        self.LastProgress = 0 # When we last printed our progress
+        self.NodeCount = 0 # Rows written so far
+        self.WayCount = 0
+        self.WayNodeCount = 0
+
     def Connect(self, Filename):
         self.db = sqlite3.connect(Filename) # Create database
         self.cursor = self.db.cursor() # Get a cursor so we can work with our database
 
+    def SetWriteQueue(self, Queue):
+        # Send our row blocks to the RowWriter reading from Queue. None to write them ourselves again.
+        self.WriteQueue = Queue
+
+    def ApplyImportSettings(self):
+        # We're building a brand new file, if the import fails we start over. So there is no need for a rollback
+        # journal or to wait for every write to reach the disk, and a large page cache keeps the R-Tree in memory.
+        self.cursor.execute('''PRAGMA journal_mode=OFF''')
+        self.cursor.execute('''PRAGMA synchronous=OFF''')
+        self.cursor.execute('''PRAGMA cache_size=-''' + str(IMPORT_CACHE_SIZE))
+        self.cursor.execute('''PRAGMA temp_store=MEMORY''')
+
     def DropTables(self):
 
         self.cursor.execute('''DROP TABLE IF EXISTS nodes''')
         self.cursor.execute('''DROP TABLE IF EXISTS way_nodes''')
         self.cursor.execute('''DROP TABLE IF EXISTS way_info''')
+        self.cursor.execute('''DROP TABLE IF EXISTS node_streets''')
+        self.cursor.execute('''DROP TABLE IF EXISTS segments''')
+        self.cursor.execute('''DROP TABLE IF EXISTS way_segments''')
+        self.cursor.execute('''DROP TABLE IF EXISTS way_adjacency''')
 
         self.db.commit() # Commit to changes made above
 
     def CreateTable(self):
         # CREATE TABLE STRUCTURES
         # Create our virtual R-Tree table used for spatial queries
+        # An R-Tree column pair is the min/max of one dimension, so a 2-D point needs both a lon pair and a lat pair.
+        # Each node is stored as a box with no size (min == max)
         self.cursor.execute('''CREATE VIRTUAL TABLE nodes USING
-        rtree(osmid INT PRIMARY KEY, lon REAL, lat REAL)''')
+        rtree(osmid, min_lon, max_lon, min_lat, max_lat)''')
 
         # Table to store the OSMID where 'id' of the nodes_ids table corresponds to the 'id' of the nodes table
         # Used to identify a node by OSMID so we can retrieve supporting data stored in other tables
@@ -54,11 +203,168 @@ class DataBase():
 
         self.db.commit() # Commit to changes made above
 
-    def AddWay(self, wayid, tags, refs):
+    def CreateIndexes(self):
+        # Without these every lookup by osmid or wayid is a full table scan.
+        # Build them after the data is in, it is much faster than keeping them up to date row by row.
+        print('Creating indexes...')
+        self.cursor.execute('''CREATE INDEX way_nodes_osmid ON way_nodes (osmid, wayid)''')
+        self.cursor.execute('''CREATE INDEX way_nodes_wayid ON way_nodes (wayid, orderid, osmid)''')
+        self.cursor.execute('''CREATE INDEX way_info_wayid ON way_info (wayid)''')
+
+        self.db.commit() # Commit to changes made above
+
+    def CreateNodeStreets(self):
+        # Denormalized node -> street table so finding the streets a node belongs to (and whether it is an intersection)
+        # is a single indexed lookup instead of a way_nodes query followed by a way_info query for each way.
+        # One row per (node, way), way_count is the number of ways the node belongs to (more than 1 is an intersection)
+        print('Creating node to street table...')
+        self.cursor.execute('''CREATE TABLE node_streets (osmid INT, wayid INT, street_name TEXT, num_of_lanes INT,
+        maxspeed TEXT, street_type TEXT, oneway BOOLEAN, way_count INT, PRIMARY KEY (osmid, wayid)) WITHOUT ROWID''')
+
+        self.RefreshNodeStreets()
+
+        self.db.commit() # Commit to changes made above
+
+    def RefreshNodeStreets(self, NodeFilter=None):
+        # (Re)build the node_streets rows of the nodes returned by the NodeFilter query (ie. 'SELECT osmid FROM ...'),
+        # or of every node when there is no filter
+
+        Where = ''
+
+        if not NodeFilter is None:
+
+            Where = 'WHERE way_nodes.osmid IN (' + NodeFilter + ')'
+            self.cursor.execute('''DELETE FROM node_streets WHERE osmid IN (''' + NodeFilter + ''')''')
+
+        self.cursor.execute('''INSERT INTO node_streets
+        SELECT way_nodes.osmid, way_nodes.wayid, street_name, num_of_lanes, maxspeed, street_type, oneway,
+        (SELECT count(DISTINCT wayid) FROM way_nodes AS other WHERE other.osmid = way_nodes.osmid)
+        FROM way_nodes JOIN way_info ON way_info.wayid = way_nodes.wayid ''' + Where + '''
+        GROUP BY way_nodes.osmid, way_nodes.wayid''')
+
+    def HasNodeStreets(self):
+        # Databases from before node_streets (and its indexes) have to be re-imported before they can be updated
+
+        self.cursor.execute('''SELECT count(*) FROM sqlite_master WHERE name IN ('node_streets', 'way_nodes_osmid',
+        'way_nodes_wayid', 'way_info_wayid')''')
+
+        return self.cursor.fetchone()[0] == 4
+
+    def ApplyChange(self, Nodes, Ways):
+        # Purpose: To apply the contents of a change file (see ReadChangeFile) to the database in a single transaction,
+        # so a DashPad reading the file never sees half of an update. Every query is indexed by osmid or wayid so the
+        # time taken depends on the size of the change, not the size of the map.
+        # Usage: ApplyChange({osmid: (lat, lon) or None, ...}, {wayid: (tags, refs) or None, ...}) (None is a delete)
+        # Returns: (Number of street nodes we have no coordinates for)
+
+        self.db.isolation_level = None # We start and commit the transaction ourselves
+        self.cursor.execute('''CREATE TEMP TABLE IF NOT EXISTS changed_nodes (osmid INTEGER PRIMARY KEY)''')
+        self.cursor.execute('''CREATE TEMP TABLE IF NOT EXISTS changed_ways (wayid INTEGER PRIMARY KEY)''')
+        self.cursor.execute('''BEGIN IMMEDIATE''')
+
+        try:
+
+            Affected = set() # Nodes whose streets may have changed
+            Needed = set() # Nodes used by the streets in this change
+
+            for wayid, Way in Ways.items():
+
+                self.cursor.execute('''SELECT osmid FROM way_nodes WHERE wayid=?''', (wayid,))
+                Affected.update(Row[0] for Row in self.cursor.fetchall())
+
+                self.cursor.execute('''DELETE FROM way_nodes WHERE wayid=?''', (wayid,))
+                self.cursor.execute('''DELETE FROM way_info WHERE wayid=?''', (wayid,))
+
+                if Way is None: # Deleted
+                    continue
+
+                Rows = self.WayRows(wayid, *Way)
+
+                if Rows is None: # No longer a street
+                    continue
+
+                self.InsertRows([], [Rows[0]], Rows[1])
+
+                Needed.update(Way[1])
+                Affected.update(Way[1])
+
+            # Nodes we already store that have moved or been deleted
+            for osmid, Node in Nodes.items():
+
+                if Node is None:
+                    self.cursor.execute('''DELETE FROM nodes WHERE osmid=?''', (osmid,))
+
+                else:
+                    self.cursor.execute('''UPDATE nodes SET min_lon=?, max_lon=?, min_lat=?, max_lat=? WHERE osmid=?''',
+                                        (Node[1], Node[1], Node[0], Node[0], osmid))
+
+            # Nodes the streets in this change use that we don't store yet
+            Missing = 0
+
+            for osmid in Needed:
+
+                self.cursor.execute('''SELECT count(*) FROM nodes WHERE osmid=?''', (osmid,))
+
+                if self.cursor.fetchone()[0] > 0:
+                    continue
+
+                if Nodes.get(osmid) is None:
+                    # The node isn't in the change file and wasn't part of a street before, so we never stored it
+                    Missing += 1
+
+                else:
+                    Lattitude, Longitude = Nodes[osmid]
+                    self.InsertRows([(osmid, Longitude, Longitude, Lattitude, Lattitude)], [], [])
+
+            # Nodes that are no longer part of any street
+            for osmid in Affected:
+
+                self.cursor.execute('''SELECT count(*) FROM way_nodes WHERE osmid=?''', (osmid,))
+
+                if self.cursor.fetchone()[0] == 0:
+                    self.cursor.execute('''DELETE FROM nodes WHERE osmid=?''', (osmid,))
+
+            self.cursor.execute('''DELETE FROM changed_nodes''')
+            self.cursor.executemany('''INSERT INTO changed_nodes (osmid) VALUES(?)''', ((osmid,) for osmid in Affected))
+            self.RefreshNodeStreets('''SELECT osmid FROM temp.changed_nodes''')
+            self.RefreshWayAdjacency('''SELECT osmid FROM temp.changed_nodes''')
+
+            # The segments of the ways in this change and of the ways through the nodes that moved
+            ChangedWays = set(Ways)
+
+            for osmid, Node in Nodes.items():
+
+                if not Node is None:
+
+                    self.cursor.execute('''SELECT wayid FROM way_nodes WHERE osmid=?''', (osmid,))
+                    ChangedWays.update(Row[0] for Row in self.cursor.fetchall())
+
+            self.cursor.execute('''DELETE FROM changed_ways''')
+            self.cursor.executemany('''INSERT INTO changed_ways (wayid) VALUES(?)''', ((wayid,) for wayid in ChangedWays))
+            self.RefreshWaySegments('''SELECT wayid FROM temp.changed_ways''')
+
+            self.cursor.execute('''COMMIT''')
+
+        except:
+
+            self.cursor.execute('''ROLLBACK''')
+            raise
+
+        finally:
+
+            self.db.isolation_level = '' # Back to the default
+
+        return Missing
+
+    def WayRows(self, wayid, tags, refs):
+        # Returns: (way_info row, way_nodes rows) for a street, or None if we don't store the way
 
         IsOneWay = False # Assume unless explicitly told otherwise
         MaxSpeed = 0 # A zero speed indicated the speed is unknown.
 
+        if not tags.get('highway') in STREET_TYPES:
+            return None
+
         if 'oneway' in tags:
             if tags['oneway'] == 'yes':
                 IsOneWay = True
@@ -72,62 +378,242 @@ class DataBase():
         else:
             NumOfLanes = 0 # Unknown
 
-        if 'name' in tags:
+        if not 'name' in tags:
+            return None # Not stored
+
+        # Store the nodes in the order they appear in the way so they can be referenced later (starting at zero)
+        return ((wayid, tags['name'], NumOfLanes, MaxSpeed, tags['highway'], IsOneWay),
+                [(wayid, OrderID, ref) for OrderID, ref in enumerate(refs)])
+
+    def CreateWayAdjacency(self):
+        # For each intersection (a node of more than one way): the ways that meet there and the nodes on either side of
+        # it along each way. DashPad loads this into memory (see StreetGraph in database.py) to work out which street
+        # we're on and what the cross streets are at an intersection without asking the database.
+        # previous_osmid / next_osmid are NULL at the ends of a way. A way that passes through twice has two rows.
+        print('Creating intersection table...')
+        self.cursor.execute('''CREATE TABLE way_adjacency (osmid INT, wayid INT, orderid INT, previous_osmid INT,
+        next_osmid INT, PRIMARY KEY (osmid, wayid, orderid)) WITHOUT ROWID''')
+
+        self.RefreshWayAdjacency()
+
+        self.db.commit() # Commit to changes made above
+
+    def HasWayAdjacency(self):
+
+        self.cursor.execute('''SELECT count(*) FROM sqlite_master WHERE name='way_adjacency' ''')
+
+        return self.cursor.fetchone()[0] == 1
+
+    def RefreshWayAdjacency(self, NodeFilter=None):
+        # (Re)build the way_adjacency rows of the nodes returned by the NodeFilter query (ie. 'SELECT osmid FROM ...'),
+        # or of every node when there is no filter. Uses node_streets, so refresh that first.
+
+        Where = ''
+
+        if not NodeFilter is None:
+
+            Where = 'AND node_streets.osmid IN (' + NodeFilter + ')'
+            self.cursor.execute('''DELETE FROM way_adjacency WHERE osmid IN (''' + NodeFilter + ''')''')
+
+        self.cursor.execute('''INSERT INTO way_adjacency
+        SELECT here.osmid, here.wayid, here.orderid, previous.osmid, next.osmid
+        FROM node_streets
+        JOIN way_nodes AS here ON here.osmid = node_streets.osmid AND here.wayid = node_streets.wayid
+        LEFT JOIN way_nodes AS previous ON previous.wayid = here.wayid AND previous.orderid = here.orderid - 1
+        LEFT JOIN way_nodes AS next ON next.wayid = here.wayid AND next.orderid = here.orderid + 1
+        WHERE node_streets.way_count > 1 ''' + Where)
+
+    def CreateWaySegments(self):
+        # The pieces of street between each pair of consecutive nodes of a way, and an R-Tree of their bounding boxes, so
+        # we can find the street we're on directly instead of snapping to the nearest node (which can be a long way off
+        # on a straight road, or belong to a side street).
+        print('Creating way segments...')
+        self.cursor.execute('''CREATE TABLE segments (id INTEGER PRIMARY KEY, wayid INT, orderid INT, from_osmid INT,
+        to_osmid INT, from_lat REAL, from_lon REAL, to_lat REAL, to_lon REAL)''')
+        self.cursor.execute('''CREATE VIRTUAL TABLE way_segments USING
+        rtree(id, min_lon, max_lon, min_lat, max_lat)''')
+
+        self.RefreshWaySegments()
+
+        self.cursor.execute('''CREATE INDEX segments_wayid ON segments (wayid)''')
+
+        self.db.commit() # Commit to changes made above
+
+    def HasWaySegments(self):
+
+        self.cursor.execute('''SELECT count(*) FROM sqlite_master WHERE name IN ('segments', 'way_segments')''')
+
+        return self.cursor.fetchone()[0] == 2
+
+    def RefreshWaySegments(self, WayFilter=None):
+        # (Re)build the segments of the ways returned by the WayFilter query (ie. 'SELECT wayid FROM ...'), or of every
+        # way when there is no filter. A segment is stored as the box around its two nodes.
+
+        Where = ''
+
+        if not WayFilter is None:
+
+            Where = 'WHERE first.wayid IN (' + WayFilter + ')'
+            self.cursor.execute('''DELETE FROM way_segments WHERE id IN
+            (SELECT id FROM segments WHERE wayid IN (''' + WayFilter + '''))''')
+            self.cursor.execute('''DELETE FROM segments WHERE wayid IN (''' + WayFilter + ''')''')
+
+        self.cursor.execute('''SELECT coalesce(max(id), 0) FROM segments''')
+        LastID = self.cursor.fetchone()[0]
+
+        self.cursor.execute('''INSERT INTO segments (wayid, orderid, from_osmid, to_osmid, from_lat, from_lon, to_lat,
+        to_lon)
+        SELECT first.wayid, first.orderid, first.osmid, second.osmid, first_node.min_lat, first_node.min_lon,
+        second_node.min_lat, second_node.min_lon
+        FROM way_nodes AS first
+        JOIN way_nodes AS second ON second.wayid = first.wayid AND second.orderid = first.orderid + 1
+        JOIN nodes AS first_node ON first_node.osmid = first.osmid
+        JOIN nodes AS second_node ON second_node.osmid = second.osmid ''' + Where)
+
+        self.cursor.execute('''INSERT INTO way_segments (id, min_lon, max_lon, min_lat, max_lat)
+        SELECT id, min(from_lon, to_lon), max(from_lon, to_lon), min(from_lat, to_lat), max(from_lat, to_lat)
+        FROM segments WHERE id > ?''', (LastID,))
 
-            try:
-                print 'Added Way: ', wayid
-                print tags
-                self.cursor.execute('''INSERT INTO way_info (wayid, street_name, num_of_lanes,
-                maxspeed, street_type, oneway) VALUES(?,?,?,?,?,?)''', (wayid, tags['name'], NumOfLanes, MaxSpeed, tags['highway'], IsOneWay))
+    def AddWay(self, wayid, tags, refs):
 
-                OrderID = 0 # Start order of nodes in way at zero and store them in the database in order as well so they can be referenced later
+        Rows = self.WayRows(wayid, tags, refs)
 
-                for ref in refs:
-                    print '\t -', ref
-                    self.cursor.execute('''INSERT INTO way_nodes(wayid, orderid, osmid) VALUES(?,?,?)''', (wayid, OrderID, ref))
-                    OrderID += 1 # Increment order
-                    # ADD NODE TO TREE
+        if Rows is None:
+            return False # Not stored
 
-            except sqlite3.IntegrityError:
-                print "Integrity Error"
+        self.WayInfoRows.append(Rows[0])
+        self.WayNodeRows.extend(Rows[1])
 
-    def CleanNodeTree(self):
-        # Fastest slow method to remove nodes from database that aren't part of a 'way'
-        # We are only concerned with nodes that form a street and if we don't remove the extra nodes
-        # we need to check each node to see if it belongs to a way each and every time we find a node in the
-        # database that is close to our location. This is slow and un-neccassary. By removing the extra nodes
-        # we increase our lookup speed signifigantly.
-        print 'Cleaning up un-used Nodes from Node Tree...'
-        print 'This may take a while! Best grab a Coffee or a Beer. Or a Cranberry Juice?..'
-        self.cursor.execute('''DELETE FROM nodes WHERE osmid NOT IN (SELECT osmid FROM way_nodes)''')
-        print 'Cleanup Done!'
+        if len(self.WayNodeRows) >= BATCH_SIZE:
+            self.Flush()
 
+        return True # Stored
 
     def AddNode(self, osmid, lat, lon):
-        print lat, lon # Debug info
 
-        try:
-            self.cursor.execute('''INSERT INTO nodes(osmid, lon, lat) VALUES(?,?,?)''', (int(osmid), float(lat), float(lon)))
+        self.NodeRows.append((int(osmid), float(lon), float(lon), float(lat), float(lat)))
+
+        if len(self.NodeRows) >= BATCH_SIZE:
+            self.Flush()
+
+    def Flush(self):
+        # Write all the buffered rows in a single transaction, or hand them to the writer process as one block
+
+        if self.NodeRows or self.WayInfoRows or self.WayNodeRows:
+
+            if self.WriteQueue is None:
+                self.WriteRows(self.NodeRows, self.WayInfoRows, self.WayNodeRows)
+
+            else:
+                self.WriteQueue.put((self.NodeRows, self.WayInfoRows, self.WayNodeRows)) # Waits while the queue is full
+
+        self.NodeCount += len(self.NodeRows)
+        self.WayCount += len(self.WayInfoRows)
+        self.WayNodeCount += len(self.WayNodeRows)
+
+        self.NodeRows = []
+        self.WayInfoRows = []
+        self.WayNodeRows = []
+
+        if time.time() - self.LastProgress >= PROGRESS_INTERVAL:
+
+            self.LastProgress = time.time()
+            self.Progress()
+
+    def WriteRows(self, NodeRows, WayInfoRows, WayNodeRows):
+
+        self.InsertRows(NodeRows, WayInfoRows, WayNodeRows)
+        self.db.commit()
+
+    def InsertRows(self, NodeRows, WayInfoRows, WayNodeRows):
+        # A row that breaks a constraint (ie. a node that's in the file twice) is skipped, not the rest of the batch
+
+        self.cursor.executemany('''INSERT OR IGNORE INTO nodes(osmid, min_lon, max_lon, min_lat, max_lat)
+        VALUES(?,?,?,?,?)''', NodeRows)
+
+        self.cursor.executemany('''INSERT OR IGNORE INTO way_info (wayid, street_name, num_of_lanes,
+        maxspeed, street_type, oneway) VALUES(?,?,?,?,?,?)''', WayInfoRows)
+
+        self.cursor.executemany('''INSERT OR IGNORE INTO way_nodes(wayid, orderid, osmid) VALUES(?,?,?)''', WayNodeRows)
 
-        except sqlite3.IntegrityError:
-            print "Integrity Error"
+    def Rows(self):
+
+        return self.NodeCount + self.WayCount + self.WayNodeCount
+
+    def Progress(self):
+        # Progress line, rewritten in place
+
+        Elapsed = max(time.time() - self.StartTime, 0.001)
+
+        sys.stdout.write('\rNodes: %d  Ways: %d  Way nodes: %d  (%d rows/sec)   ' % (
+            self.NodeCount, self.WayCount, self.WayNodeCount, self.Rows() / Elapsed))
+        sys.stdout.flush()
+
+    def Report(self):
+        # Total import throughput
+
+        Elapsed = max(time.time() - self.StartTime, 0.001)
+
+        self.Progress()
+        print('')
+        print('Imported %d rows in %.1f seconds (%d rows/sec)' % (self.Rows(), Elapsed, self.Rows() / Elapsed))
 
     def CommitChanges(self):
-        self.db.commit() # Commit to changes
+        self.Flush() # Write anything still waiting in our buffers
+
+        if self.WriteQueue is None:
+            self.db.commit() # Commit to changes
 
 
     def Close(self):
         self.db.close()
 
 
+class RowWriter(multiprocessing.Process):
+
+    # The only process that writes to the database. SQLite allows a single writer at a time, so rather than having the
+    # parsers take turns on one cursor they send their rows here in blocks (see DataBase.Flush) through a bounded queue.
+    # When the writer can't keep up the queue fills and the parsers wait, so memory use stays at WRITE_QUEUE_SIZE blocks.
+
+    def __init__(self, Filename):
+
+        multiprocessing.Process.__init__(self)
+
+        self.Filename = Filename
+        self.Queue = multiprocessing.Queue(WRITE_QUEUE_SIZE)
+
+    def run(self):
+
+        OSMDataBase = DataBase()
+        OSMDataBase.Connect(self.Filename)
+        OSMDataBase.ApplyImportSettings()
+
+        while True:
+
+            Block = self.Queue.get()
+
+            if Block is None: # Stop
+                break
+
+            OSMDataBase.WriteRows(*Block)
+
+        OSMDataBase.Close()
+
+    def Stop(self):
+        # Wait for every block sent so far to be written
+
+        self.Queue.put(None)
+        self.join()
+
+        return self.exitcode == 0
+
+
 class __OSMData():
 
     def __init__(self):
 
         self.OSMDataBase = None
-        self.__WayWhiteList = set(('motorway', 'trunk', 'primary', 'secondary',
-                         'tertiary', 'unclassified', 'residential', 'service', 'road', 'motorway_link',
-                         'trunk_link', 'primary_link', 'secondary_link', 'tertiary_link'))
+        self.NodeIDs = NodeIDSet() # Nodes that make up the streets we've kept
 
     def SetDatabase(self, DataBase):
 
@@ -136,74 +622,272 @@ class __OSMData():
 
     def FoundNode(self, nodes):
 
-        for osmid, lon, lat in nodes:
-            # AddNode(self, lat, lon):
-            # Purposely reversing the order of lat and lon in order to insert the correct values into the correct columns
-            # in the SQLITE database. Reversing the order throws an exception that I have yet to debug. Some help?
-            # This method currently serves it's purpose, but its confusing and messy.
-            self.OSMDataBase.AddNode(osmid, lon, lat)
+        # Second pass: only keep the nodes that make up a street
+        NodeIDs = self.NodeIDs
+
+        for osmid, lon, lat in nodes: # OSM Parser hands us coordinates in (lon, lat) order
+            if osmid in NodeIDs:
+                self.OSMDataBase.AddNode(osmid, lat, lon)
 
     def FoundWay(self, ways):
 
+        # First pass: keep the streets and remember which nodes they are made of
         for wayid, tags, refs in ways:
             if 'highway' in tags:
-                if tags['highway'] in self.__WayWhiteList:
-                    self.OSMDataBase.AddWay(wayid, tags, refs) # Found a street
+                if tags['highway'] in STREET_TYPES:
+                    if self.OSMDataBase.AddWay(wayid, tags, refs): # Found a street
+                        self.NodeIDs.AddMany(refs)
+
+    def FinishedWays(self):
 
-def Import(InputFile, OutputFile):
+        self.NodeIDs.Freeze()
+        print('')
+        print('Found streets made of %d nodes (%d KB)' % (self.NodeIDs.Count(), self.NodeIDs.MemoryUsage() // 1024))
+
+def Import(InputFile, OutputFile, Workers=DEFAULT_WORKERS, MapFile=None):
+    # Returns: True once OutputFile is written, False if it couldn't be (the reason is printed)
 
     # Error checking
     if os.path.isfile(OutputFile):
-        print 'Output file Already Exists:', OutputFile
-        sys.exit(1)
+        print('Output file Already Exists: ' + OutputFile)
+        return False
 
     if not os.path.isfile(InputFile):
-        print 'Input file Doesn\'t Exist:', InputFile
-        sys.exit(1)
+        print('Input file Doesn\'t Exist: ' + InputFile)
+        return False
+
+    if not __GetFileExtension(InputFile) in ('osm', 'pbf'): # Check file extension
+        # OSM Parser is finicky about the file extension, it picks the XML or PBF reader from it
+        print('Input file has an unknown file extension.'
+              '\n'
+              'Input file should be a valid OSM (OpenStreetMap) XML or PBF file. ie. Filename.osm or Filename.osm.pbf '
+              '\n'
+              'File extension is case-sensitive.')
+        return False
 
     if not __IsValidOsmFile(InputFile):
-        print 'Input file does not appear to be a valid OSM (OpenStreetMap) formatted XML file.'
-        sys.exit(1)
-
-    if not __GetFileExtension(InputFile) == 'osm': # Check file extension
-        # OSM Parser is finicky about the file extension
-        print 'Input file has an unknown file extension.' \
-              '\n' \
-              'Input file should be a valid OSM (OpenStreetMap) formatted XML file. ie. Filename.osm. ' \
-              '\n' \
-              'File extension is case-sensitive.'
-        sys.exit(1)
+        print('Input file does not appear to be a valid OSM (OpenStreetMap) formatted XML or PBF file.')
+        return False
 
-    # Setup OSM objects
-    OSM = __OSMData() # Object used to process OSM data from XML file. Connected to ParseEngine via callbacks
-    ParseEngine = OSMParser(concurrency=4, ways_callback=OSM.FoundWay, coords_callback=OSM.FoundNode) # XML Parser (set callback)
+    from imposm.parser import OSMParser # Only needed to parse, the rest of the importer works without it
 
-    # Create and connect database
+    # Setup OSM objects
+    # We only want the nodes that make up a street, and we can't tell which those are until we've seen the streets.
+    # So read the file twice: first the ways (streets), then the coordinates of just the nodes those ways use.
+    # Each pass is decoded by Workers parser processes, the rows they produce are written by a single RowWriter process.
+    OSM = __OSMData() # Object used to process OSM data from the file. Connected to ParseEngines via callbacks
+    WayParseEngine = OSMParser(concurrency=Workers, ways_callback=OSM.FoundWay) # First pass (set callback)
+    NodeParseEngine = OSMParser(concurrency=Workers, coords_callback=OSM.FoundNode) # Second pass (set callback)
+
+    # Create database
     OSMDataBase = DataBase()
     OSMDataBase.Connect(OutputFile)
     OSMDataBase.DropTables()
     OSMDataBase.CreateTable()
+    OSMDataBase.Close() # The writer opens its own connection, don't share ours across processes
+
+    Writer = RowWriter(OutputFile)
+    Writer.start()
 
+    OSMDataBase.SetWriteQueue(Writer.Queue)
     OSM.SetDatabase(OSMDataBase)
 
-    # Parse OSM XML file
-    ParseEngine.parse(InputFile)
+    print('Parsing with %d processes' % Workers)
 
-    # Done - Cleanup
-    OSMDataBase.CleanNodeTree() # Remove nodes that don't belong to a Way (ie. a Street)
+    # Parse OSM file
+    Start = time.time()
+    WayParseEngine.parse(InputFile)
+    OSMDataBase.CommitChanges()
+    OSM.FinishedWays()
+    print('First pass (ways) took %.1f seconds' % (time.time() - Start))
+    instrument.Record('import.ways', time.time() - Start)
+
+    Start = time.time()
+    NodeParseEngine.parse(InputFile)
     OSMDataBase.CommitChanges()
+
+    if not Writer.Stop(): # Wait for the last blocks to be written
+        print('')
+        print('Writer process failed, %s is incomplete' % OutputFile)
+        return False
+
+    print('')
+    print('Second pass (nodes) took %.1f seconds' % (time.time() - Start))
+    instrument.Record('import.nodes', time.time() - Start)
+
+    # Done - Cleanup
+    OSMDataBase.SetWriteQueue(None)
+    OSMDataBase.Connect(OutputFile)
+    OSMDataBase.ApplyImportSettings()
+
+    for Phase, Create in (('indexes', OSMDataBase.CreateIndexes), ('node_streets', OSMDataBase.CreateNodeStreets),
+                          ('way_adjacency', OSMDataBase.CreateWayAdjacency),
+                          ('way_segments', OSMDataBase.CreateWaySegments)):
+
+        Started = instrument.Start()
+        Create()
+        instrument.Stop('import.' + Phase, Started)
+
+    OSMDataBase.Report()
+    OSMDataBase.Close()
+
+    if not MapFile is None:
+        WriteMapFile(OutputFile, MapFile)
+
+    # Linux reports the peak in KB
+    print('Peak memory used by the importer: %d MB' % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024))
+
+    print(OutputFile + ' successfully created..')
+    print('Finished!')
+    return True
+
+
+def ReadChangeFile(Filename):
+    # Purpose: To read an OSM change file (.osc, or .osc.gz as published by the OSM replication service)
+    # Returns: (Nodes, Ways) the state each node and way is left in once the whole file is applied:
+    # Nodes = {osmid: (lat, lon) or None if deleted}, Ways = {wayid: (tags, refs) or None if deleted}
+
+    if __GetFileExtension(Filename) == 'gz':
+        FileHandle = gzip.open(Filename)
+
+    else:
+        FileHandle = open(Filename)
+
+    Nodes = {}
+    Ways = {}
+    Action = None # create, modify or delete
+
+    for Event, Element in cElementTree.iterparse(FileHandle, events=('start', 'end')):
+
+        if Event == 'start':
+
+            if Element.tag in ('create', 'modify', 'delete'):
+                Action = Element.tag
+
+        elif Element.tag == 'node':
+
+            if Action == 'delete':
+                Nodes[int(Element.get('id'))] = None
+
+            else:
+                Nodes[int(Element.get('id'))] = (float(Element.get('lat')), float(Element.get('lon')))
+
+            Element.clear()
+
+        elif Element.tag == 'way':
+
+            if Action == 'delete':
+                Ways[int(Element.get('id'))] = None
+
+            else:
+                Ways[int(Element.get('id'))] = (dict((Tag.get('k'), Tag.get('v')) for Tag in Element.findall('tag')),
+                                                [int(Node.get('ref')) for Node in Element.findall('nd')])
+
+            Element.clear()
+
+        elif Element.tag == 'relation':
+
+            Element.clear()
+
+    FileHandle.close()
+
+    return Nodes, Ways
+
+
+def Update(DatabaseFile, ChangeFiles, MapFile=None):
+    # Purpose: To bring an existing database up to date with a sequence of OSM change files, applied in order.
+    # Each file is applied in its own transaction, a running DashPad picks up the changes once it is committed.
+    # Returns: True once every change file is applied, False if they couldn't be (the reason is printed)
+
+    # Error checking
+    if not os.path.isfile(DatabaseFile):
+        print('Database file Doesn\'t Exist: ' + DatabaseFile)
+        return False
+
+    for ChangeFile in ChangeFiles:
+
+        if not os.path.isfile(ChangeFile):
+            print('Change file Doesn\'t Exist: ' + ChangeFile)
+            return False
+
+    OSMDataBase = DataBase()
+    OSMDataBase.Connect(DatabaseFile)
+
+    if not OSMDataBase.HasNodeStreets():
+        print('Database was created by an older importer and can\'t be updated. Import it again first.')
+        return False
+
+    # Added after node_streets, they can be built from what is already there
+    if not OSMDataBase.HasWayAdjacency():
+        OSMDataBase.CreateWayAdjacency()
+
+    if not OSMDataBase.HasWaySegments():
+        OSMDataBase.CreateWaySegments()
+
+    for ChangeFile in ChangeFiles:
+
+        Start = time.time()
+
+        Nodes, Ways = ReadChangeFile(ChangeFile)
+        instrument.Record('update.read', time.time() - Start)
+
+        Started = instrument.Start()
+        Missing = OSMDataBase.ApplyChange(Nodes, Ways)
+        instrument.Stop('update.apply', Started)
+
+        print('%s: %d nodes and %d ways applied in %.2f seconds' % (ChangeFile, len(Nodes), len(Ways),
+                                                                     time.time() - Start))
+
+        if Missing > 0:
+            # A way that became a street can use nodes that didn't change, those aren't in the change file
+            print('Warning: %d street nodes have no coordinates, they were not part of a street before this change.'
+                  ' Import the map again to add them.' % Missing)
+
     OSMDataBase.Close()
 
-    print OutputFile, 'successfully created..'
-    print 'Finished!'
-    sys.exit(0)
+    if not MapFile is None:
+        WriteMapFile(DatabaseFile, MapFile)
+
+    print(DatabaseFile + ' successfully updated..')
+    print('Finished!')
+    return True
+
+
+def WriteMapFile(DatabaseFile, MapFile):
+    # Write the compact map file DashPad can use instead of geo.sqlite (DATABASE_BACKEND = 'mapfile', see mapfile.py)
+
+    import mapfile
+
+    Start = time.time()
+
+    Database = sqlite3.connect(DatabaseFile)
+    Nodes, Ways = mapfile.Write(Database.cursor(), MapFile)
+    Database.close()
+
+    instrument.Record('import.mapfile', time.time() - Start)
+
+    print('Wrote %d nodes and %d ways to %s (%d KB) in %.1f seconds' % (Nodes, Ways, MapFile,
+                                                                       os.path.getsize(MapFile) // 1024,
+                                                                       time.time() - Start))
 
 
 def Usage():
 
-    print 'Uh oh! Improper usage! ' \
-          '\n' \
-          'Proper usage: osm-importer.py -i <inputfile> -o <outputfile>'
+    print('Uh oh! Improper usage! '
+          '\n'
+          'Proper usage: osm-importer.py -i <inputfile> -o <outputfile> [-j <processes>] [-m <mapfile>]'
+          '\n'
+          '<inputfile> is an .osm (XML) or .osm.pbf file, <processes> is the number of parser processes (default %d)'
+          '\n'
+          'To update an existing database: osm-importer.py -o <outputfile> -u <changefile> [-u <changefile> ...] '
+          '[-m <mapfile>]'
+          '\n'
+          '<changefile> is an .osc or .osc.gz file, they are applied in the order given'
+          '\n'
+          '<mapfile> is also written for DashPad\'s mapfile backend, ie. geo.map'
+          '\n'
+          'Add -p <profile> to write how long each phase took to <profile> (JSON, see instrument.py)'
+          % DEFAULT_WORKERS)
 
 
 def __GetFileExtension(Filename):
@@ -221,6 +905,15 @@ def __GetFileExtension(Filename):
 
 def __IsValidOsmFile(Filename):
 
+    if __GetFileExtension(Filename) == 'pbf':
+
+        # A PBF file starts with a block header naming its first block, which is always the OSMHeader block
+        FileHandle = open(Filename, 'rb')
+        Header = FileHandle.read(64)
+        FileHandle.close()
+
+        return b'OSMHeader' in Header
+
     FileHandle = open(Filename)
 
     for LineNumber, LineContents in enumerate(FileHandle):
@@ -241,21 +934,20 @@ def __Main(argv):
 
     InputFile = ''
     OutputFile = ''
+    Workers = DEFAULT_WORKERS
+    ChangeFiles = []
+    MapFile = None
+    Profile = None
 
     try:
 
-        Options, Arguments = getopt.getopt(argv,"i:o:")
+        Options, Arguments = getopt.getopt(argv,"i:o:j:u:m:p:")
 
     except getopt.GetoptError:
 
         Usage()
         sys.exit(2)
 
-    if not len(Options) == 2:
-
-        Usage()
-        sys.exit(2)
-
     for Option, Argument in Options:
 
         if Option == '-i':
@@ -264,7 +956,40 @@ def __Main(argv):
         elif Option == '-o':
             OutputFile = Argument
 
-    Import(InputFile, OutputFile)
+        elif Option == '-j':
+
+            if not Argument.isdigit() or int(Argument) < 1:
+
+                Usage()
+                sys.exit(2)
+
+            Workers = int(Argument)
+
+        elif Option == '-u':
+            ChangeFiles.append(Argument)
+
+        elif Option == '-m':
+            MapFile = Argument
+
+        elif Option == '-p':
+            Profile = Argument
+            instrument.Enable()
+
+    if OutputFile == '' or len(Arguments) > 0 or (InputFile == '') == (len(ChangeFiles) == 0):
+
+        Usage()
+        sys.exit(2)
+
+    if len(ChangeFiles) > 0:
+        Succeeded = Update(OutputFile, ChangeFiles, MapFile)
+
+    else:
+        Succeeded = Import(InputFile, OutputFile, Workers, MapFile)
+
+    if not Profile is None:
+        instrument.WriteSnapshot(Profile)
+
+    sys.exit(0 if Succeeded else 1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,126 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Works out where the next fix will be, so its location can be looked up before it arrives.
+#
+# Fixes come about once a second. Between them we keep going at the speed and on the track of the last fix (dead
+# reckoning), so we know roughly where the next one will be. EventHandler looks that point up while it would otherwise
+# be waiting (see LocationWorker) and stores the answer here, along with the node closest to it. If the next fix is
+# closest to the same node, the answer is the same as looking it up would give, so it's used as is. If not (we turned,
+# braked, ...) it's looked up as usual.
+
+from geolib import PointAt
+
+PREDICTION_MIN_SPEED = 10  # km/h - Slower than this the track isn't worth much, don't predict
+PREDICTION_INTERVAL = 1.0  # Seconds between fixes until we've seen a few
+PREDICTION_MAX_INTERVAL = 2.0  # Don't predict further ahead than this, even if the fixes are further apart
+INTERVAL_SMOOTHING = 0.2  # How much each new gap between fixes moves our estimate of the interval
+
+
+class Predictor():
+
+    def __init__(self, MinSpeed=PREDICTION_MIN_SPEED):
+
+        self.__MinSpeed = MinSpeed
+
+        self.__Fix = None # Last GpsFix we were given
+        self.__Interval = PREDICTION_INTERVAL # Seconds we expect until the next one
+        self.__Key = None # The node closest to where we said the next fix would be...
+        self.__Answer = None # ...and the answer looked up for there
+        self.__Seconds = 0.0 # How long looking it up took
+
+        # Statistics
+        self.__Predictions = 0 # Answers stored
+        self.__Hits = 0 # Fixes that landed where we predicted (answer used)
+        self.__Misses = 0 # Fixes that didn't
+        self.__Saved = 0.0 # Seconds of lookups we didn't have to do once the fix arrived
+
+    def Update(self, Fix):
+        # Purpose: To be told about every fix (a GpsFix, see gpsfix.py), so we know where we're going and how often
+        # fixes come
+
+        if not self.__Fix is None and not Fix.time is None and not self.__Fix.time is None:
+
+            Gap = Fix.time - self.__Fix.time
+
+            if 0.0 < Gap <= PREDICTION_MAX_INTERVAL:
+                self.__Interval += INTERVAL_SMOOTHING * (Gap - self.__Interval)
+
+        self.__Fix = Fix
+
+    def Predict(self):
+        # Returns: (Lattitude, Longitude, bearing) where we expect the next fix to be, or None if we can't say (no fix
+        # yet, stopped or too slow, no track)
+
+        Fix = self.__Fix
+
+        if Fix is None or Fix.track is None or Fix.speed is None or Fix.speed < self.__MinSpeed:
+            return None
+
+        Location = PointAt((Fix.lat, Fix.lon), Fix.track, Fix.speed * self.__Interval / 3600.0) # km/h -> km
+
+        return Location[0], Location[1], Fix.track
+
+    def Store(self, Key, Answer, Seconds):
+        # Purpose: To keep the answer looked up for a prediction until the next fix arrives
+        # Usage: Store(osmid of the node closest to Predict(), Lookup(...), time it took in seconds)
+
+        self.__Key = Key
+        self.__Answer = Answer
+        self.__Seconds = Seconds
+        self.__Predictions += 1
+
+    def Take(self, Key):
+        # Purpose: To use the stored answer for a fix that needs looking up, if the fix is where we predicted
+        # Usage: Take(osmid of the node closest to the fix)
+        # Returns: The stored answer, or None if there isn't one or it was for another node (look it up)
+
+        StoredKey = self.__Key
+        Answer = self.__Answer
+        Seconds = self.__Seconds
+
+        self.Discard()
+
+        if StoredKey is None:
+            return None
+
+        if not Key == StoredKey:
+
+            self.__Misses += 1
+            return None
+
+        self.__Hits += 1
+        self.__Saved += Seconds
+
+        return Answer
+
+    def Discard(self):
+        # Purpose: To forget the stored answer (ie. the fix didn't need a lookup after all)
+
+        self.__Key = None
+        self.__Answer = None
+        self.__Seconds = 0.0
+
+    def Statistics(self):
+        # Answers looked up ahead, fixes that used one (hits) and didn't (misses), how often the answer was there when
+        # a fix needed it, and the lookup time saved in seconds (total and per hit)
+
+        Tried = self.__Hits + self.__Misses
+
+        return {'predictions': self.__Predictions, 'hits': self.__Hits, 'misses': self.__Misses,
+                'hit_rate': float(self.__Hits) / Tried if Tried > 0 else 0.0, 'saved': self.__Saved,
+                'saved_per_hit': self.__Saved / self.__Hits if self.__Hits > 0 else 0.0}
@@ -0,0 +1,48 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# The Qt side of signals.py, only the GUI imports this.
+#
+# The GPS devices and the location worker emit their Signals on threads of their own. Widgets may only be touched on
+# the GUI thread, so anything the GUI shows goes through a QueuedSignal: it re-emits the Signal as a Qt signal, which
+# Qt delivers on the thread the QueuedSignal was made on.
+
+from PyQt4.QtCore import QObject, pyqtSignal
+
+
+class QueuedSignal(QObject):
+
+    # Signals
+    signal = pyqtSignal(object) # What the Signal was emitted with (one value as is, several as a tuple)
+
+    def __init__(self, Source):
+        # Usage: QueuedSignal(Gps.signalFixChanged).signal.connect(self.ShowSpeed) - make it on the GUI thread, and
+        # keep it for as long as you want the signal
+
+        QObject.__init__(self)
+
+        self.__Source = Source
+        self.__Source.connect(self.__Forward)
+
+    def __Forward(self, *Arguments):
+
+        # Runs on whichever thread emitted the Signal, Qt queues it for ours
+        self.signal.emit(Arguments[0] if len(Arguments) == 1 else Arguments)
+
+    def Close(self):
+
+        self.__Source.disconnect(self.__Forward)
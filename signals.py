@@ -0,0 +1,54 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Signals without Qt, so the GPS devices and the lookups can run in a batch job or on a server.
+#
+# A Signal has the same connect / disconnect / emit as a pyqtSignal, but calls whatever is connected right away on the
+# thread that emits it. The GUI gets them onto its own thread through QueuedSignal (see qtsignals.py).
+
+import threading
+
+
+class Signal():
+
+    def __init__(self):
+
+        self.__Lock = threading.Lock()
+        self.__Slots = () # Replaced whole when something connects or disconnects, so emit doesn't need the lock
+
+    def connect(self, Slot):
+        # Usage: Gps.signalFixChanged.connect(self.__NewFix)
+
+        with self.__Lock:
+            self.__Slots = self.__Slots + (Slot,)
+
+    def disconnect(self, Slot):
+
+        with self.__Lock:
+
+            Slots = list(self.__Slots)
+
+            if Slot in Slots:
+                Slots.remove(Slot)
+
+            self.__Slots = tuple(Slots)
+
+    def emit(self, *Arguments):
+        # Purpose: To call everything connected, in the order they connected, on this thread
+
+        for Slot in self.__Slots:
+            Slot(*Arguments)
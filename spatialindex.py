@@ -0,0 +1,243 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# In-memory uniform grid of the street nodes stored in geo.sqlite.
+#
+# The nodes are kept in three compact arrays (osmid, lat, lon) sorted by grid cell. Only the cells that hold nodes are
+# stored: a sorted array of cell keys and, for each cell, where its nodes start in the node arrays. A nearest node search
+# only looks at the cells surrounding our location, so there is no disk I/O and no SQLite rows to build.
+#
+# Memory footprint per million nodes:
+#   osmid  8 bytes (64 bit signed int, or a double on 32 bit builds which is exact for any OSM id)  8 MB
+#   lat    4 bytes (32 bit float, the same precision the R-Tree stores)                             4 MB
+#   lon    4 bytes (32 bit float)                                                                   4 MB
+#   cells  12 bytes per occupied cell (8 byte key + 4 byte start). Street nodes are 10-50m apart so
+#          a 0.001 degree cell holds a handful of them; at worst one cell per node                 up to 12 MB
+#   Total                                                                                          16-28 MB
+
+import math
+from array import array
+from bisect import bisect_left
+from geolib import DistancesFrom, EARTH_RADIUS
+
+CELL_SIZE = 0.001  # Size of a grid cell in degrees (About 110m North/South, 80m East/West at 44 degrees lattitude)
+
+# OSM ids and cell keys don't fit in 32 bits. Use a 64 bit int if the platform has one, otherwise a double (exact up to 2^53)
+INT64_TYPECODE = 'l' if array('l').itemsize >= 8 else 'd'
+
+KM_PER_DEGREE = math.radians(1) * EARTH_RADIUS  # Length of a degree of lattitude in km
+
+
+class SpatialIndex():
+
+    def __init__(self, CellSize=CELL_SIZE):
+
+        self.__CellSize = float(CellSize)
+        self.__Columns = int(math.ceil(360.0 / self.__CellSize)) + 1 # Number of cells around the globe East/West
+
+        self.__OSMIDs = array(INT64_TYPECODE) # OSMID of each node, sorted by cell
+        self.__Lattitudes = array('f') # Lattitude of each node, sorted by cell
+        self.__Longitudes = array('f') # Longitude of each node, sorted by cell
+        self.__CellKeys = array(INT64_TYPECODE) # Sorted keys of the cells that hold nodes
+        self.__CellStarts = array('i') # Position of each cell's first node in the arrays above (plus one past the end)
+
+    def __CellOf(self, Lattitude, Longitude):
+
+        return int(math.floor(Lattitude / self.__CellSize)), int(math.floor(Longitude / self.__CellSize))
+
+    def __CellKey(self, Row, Column):
+
+        return Row * self.__Columns + Column
+
+    def __RowSpan(self, Row, FirstColumn, LastColumn):
+        # Returns the (start, end) position in the arrays of the nodes in cells FirstColumn to LastColumn of a row.
+        # Cells next to each other in a row have consecutive keys, so their nodes sit next to each other in the arrays.
+
+        Start = bisect_left(self.__CellKeys, self.__CellKey(Row, FirstColumn))
+        End = bisect_left(self.__CellKeys, self.__CellKey(Row, LastColumn) + 1, Start)
+
+        return self.__CellStarts[Start], self.__CellStarts[End]
+
+    def Load(self, Cursor, SWCorner=None, NECorner=None):
+        # Purpose: To build the index from the nodes table of geo.sqlite
+        # Usage: Load(Database.cursor()) or Load(Database.cursor(), (43.89, -78.81), (43.90, -78.80)) for part of the map
+        # The nodes are placed with a counting sort (count the nodes in each cell, then drop each node into its slot) so
+        # we never hold more than the arrays and the cell table in memory.
+
+        if SWCorner is None or NECorner is None:
+
+            Where = ''
+            Parameters = ()
+
+        else:
+
+            # From SWCorner up to but not including NECorner, by where the node is (min_lat, min_lon). The R-Tree rounds
+            # min down and max up, so a node right on the edge would otherwise fall between two neighbouring parts.
+            Where = ' WHERE min_lon>=? AND min_lon<? AND min_lat>=? AND min_lat<?'
+            Parameters = (float(SWCorner[1]), float(NECorner[1]), float(SWCorner[0]), float(NECorner[0]))
+
+        Counts = {}
+
+        Cursor.execute('SELECT min_lat, min_lon FROM nodes' + Where + ';', Parameters)
+
+        for Lattitude, Longitude in Cursor:
+
+            Cell = self.__CellKey(*self.__CellOf(Lattitude, Longitude))
+            Counts[Cell] = Counts.get(Cell, 0) + 1
+
+        # Work out where each cell starts in the arrays
+        NextSlot = {}
+        Total = 0
+
+        self.__CellKeys = array(INT64_TYPECODE)
+        self.__CellStarts = array('i')
+
+        for Cell in sorted(Counts):
+
+            NextSlot[Cell] = Total
+            self.__CellKeys.append(Cell)
+            self.__CellStarts.append(Total)
+            Total += Counts[Cell]
+
+        self.__CellStarts.append(Total) # End of the last cell
+
+        Counts = None # Clean up
+
+        self.__OSMIDs = array(INT64_TYPECODE, [0]) * Total
+        self.__Lattitudes = array('f', [0.0]) * Total
+        self.__Longitudes = array('f', [0.0]) * Total
+
+        Cursor.execute('SELECT osmid, min_lat, min_lon FROM nodes' + Where + ';', Parameters)
+
+        for osmid, Lattitude, Longitude in Cursor:
+
+            Cell = self.__CellKey(*self.__CellOf(Lattitude, Longitude))
+            Slot = NextSlot[Cell]
+            NextSlot[Cell] = Slot + 1
+
+            self.__OSMIDs[Slot] = osmid
+            self.__Lattitudes[Slot] = Lattitude
+            self.__Longitudes[Slot] = Longitude
+
+    def NodeCount(self):
+
+        return len(self.__OSMIDs)
+
+    def MemoryUsage(self):
+        # Approximate size of the index in bytes (see memory footprint at the top of this file)
+
+        return (len(self.__OSMIDs) * self.__OSMIDs.itemsize +
+                len(self.__Lattitudes) * self.__Lattitudes.itemsize +
+                len(self.__Longitudes) * self.__Longitudes.itemsize +
+                len(self.__CellKeys) * self.__CellKeys.itemsize +
+                len(self.__CellStarts) * self.__CellStarts.itemsize)
+
+    def FindClosestNode(self, Coordinates, MaxDistance):
+        # Purpose: To find the node closest to our location and how far away it is
+        # Usage: FindClosestNode((43.894655, -78.802791), 1.0)
+        # Returns: (osmid, distance in km) or None if no node is within MaxDistance
+
+        Nodes = self.FindClosestNodes(Coordinates, 1, MaxDistance)
+
+        if len(Nodes) == 0:
+            return None
+
+        return Nodes[0]
+
+    def FindClosestNodes(self, Coordinates, Count, MaxDistance):
+        # Purpose: To find the closest nodes to our location
+        # Usage: FindClosestNodes((43.894655, -78.802791), 5, 1.0)
+        # Returns: A list of up to Count (osmid, distance in km) tuples sorted closest first
+        #
+        # Search the cell we're in, then each ring of cells around it. Once the closest nodes we've found are nearer
+        # than anything the next ring could possibly hold, we're done.
+
+        Lattitude = float(Coordinates[0])
+        Longitude = float(Coordinates[1])
+
+        LongitudeScale = math.cos(math.radians(Lattitude)) # A degree of longitude is shorter than a degree of lattitude
+        MaxRing = int(MaxDistance / (KM_PER_DEGREE * LongitudeScale * self.__CellSize)) + 1
+
+        Row, Column = self.__CellOf(Lattitude, Longitude)
+        CellSize = self.__CellSize
+
+        # How far (in degrees) we are from each edge of our own cell
+        ToEdge = min(Lattitude - Row * CellSize, (Row + 1) * CellSize - Lattitude,
+                     (Longitude - Column * CellSize) * LongitudeScale, ((Column + 1) * CellSize - Longitude) * LongitudeScale)
+
+        Lattitudes = self.__Lattitudes
+        Longitudes = self.__Longitudes
+        Candidates = [] # (approximate distance squared in degrees, position in arrays), closest Count nodes so far
+        Furthest = None # Distance squared of the furthest of our Candidates once we have Count of them
+
+        Ring = 0
+
+        while Ring <= MaxRing:
+
+            for Start, End in self.__Ring(Row, Column, Ring):
+
+                for Slot in range(Start, End):
+
+                    DeltaLattitude = Lattitudes[Slot] - Lattitude
+                    DeltaLongitude = (Longitudes[Slot] - Longitude) * LongitudeScale
+                    Distance = DeltaLattitude * DeltaLattitude + DeltaLongitude * DeltaLongitude
+
+                    if Furthest is None or Distance < Furthest:
+
+                        Candidates.append((Distance, Slot))
+
+                        if len(Candidates) >= Count:
+
+                            Candidates.sort()
+                            del Candidates[Count:]
+                            Furthest = Candidates[-1][0]
+
+            # Nothing outside of the rings we've searched can be closer than this many degrees
+            Searched = ToEdge + Ring * CellSize * LongitudeScale
+
+            if not Furthest is None and Furthest <= Searched * Searched:
+                break
+
+            Ring += 1
+
+        Nodes = []
+        Distances = DistancesFrom(Coordinates, [(Lattitudes[Slot], Longitudes[Slot]) for Distance, Slot in Candidates])
+
+        for (Distance, Slot), NodeDistance in zip(Candidates, Distances):
+
+            if NodeDistance <= MaxDistance:
+                Nodes.append((int(self.__OSMIDs[Slot]), NodeDistance))
+
+        Nodes.sort(key=lambda Node: Node[1])
+
+        return Nodes[:Count]
+
+    def __Ring(self, Row, Column, Ring):
+        # (start, end) positions in the arrays of the nodes in the cells that are exactly Ring cells away from (Row, Column)
+
+        if Ring == 0:
+            return [self.__RowSpan(Row, Column, Column)]
+
+        Spans = [self.__RowSpan(Row - Ring, Column - Ring, Column + Ring), # Bottom edge
+                 self.__RowSpan(Row + Ring, Column - Ring, Column + Ring)] # Top edge
+
+        for Offset in range(-Ring + 1, Ring):
+
+            Spans.append(self.__RowSpan(Row + Offset, Column - Ring, Column - Ring)) # Left edge
+            Spans.append(self.__RowSpan(Row + Offset, Column + Ring, Column + Ring)) # Right edge
+
+        return Spans
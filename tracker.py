@@ -0,0 +1,254 @@
+__author__ = 'Steve Hollaway'
+
+# This file is part of Police Dash Pad.
+
+# Police Dash Pad is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Police Dash Pad is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Police Dash Pad.  If not, see <http://www.gnu.org/licenses/>.
+
+# Follows the street we're on so we don't have to ask the database where we are on every fix.
+#
+# Once a lookup tells us the street, we keep its shape in memory. While each new fix stays close to that street, runs
+# the same way it does and isn't near an intersection or the end of the street, we're still on it and nothing could
+# have changed. Only when one of those stops being true do we look our location up again.
+
+import math
+from bisect import bisect_left
+from geolib import DistanceBetween, AngleBetween, EARTH_RADIUS
+
+TRACKER_CORRIDOR = 0.025  # Still on the street while within 25m of it (GPS error plus half of a wide street)
+TRACKER_STOP_DISTANCE = 0.040  # Look our location up again within 40m of an intersection or the end of the street
+TRACKER_BEARING_TOLERANCE = 45  # Still on the street while heading within 45 degrees of it (either way)
+
+KM_PER_DEGREE = math.radians(1) * EARTH_RADIUS  # Length of a degree of lattitude in km
+
+
+class StreetTracker():
+
+    def __init__(self, Corridor=TRACKER_CORRIDOR, StopDistance=TRACKER_STOP_DISTANCE,
+                 BearingTolerance=TRACKER_BEARING_TOLERANCE):
+
+        self.__Corridor = Corridor
+        self.__StopDistance = StopDistance
+        self.__BearingTolerance = BearingTolerance
+
+        # The street we're following
+        # Treats the earth as flat around the street (see FastDistancesFrom), streets are short enough for that
+        self.__WayID = None
+        self.__Origin = None # (Lattitude, Longitude) of the first node, (0, 0) in km East and North
+        self.__Scale = 1.0 # km per degree of longitude at the street
+        self.__Points = [] # (km East, km North) of each node along the way
+        self.__Along = [] # Distance along the way to each node in km
+        self.__Bearings = [] # Bearing of each segment (node to the next node)
+        self.__Stops = [] # Distance along the way to each intersection and to both ends, sorted
+        self.__Segment = None # Segment we were closest to at the last fix (None until the first fix on this street)
+        self.__Forward = None # Travelling in the order of the way's nodes? (None until we've had a bearing on it)
+        self.__AlongWay = None # How far along the way we were at the last fix in km (None if we weren't on it)
+
+        # Statistics
+        self.__Skipped = 0 # Fixes we didn't have to look up
+        self.__Lookups = 0 # Fixes we did
+        self.__Travelled = 0.0 # km between the fixes we were given
+        self.__LastFix = None
+
+    def Follow(self, wayid, Geometry):
+        # Purpose: To start following a street after a lookup told us we're on it
+        # Usage: Follow(Street.WayID(), Database.FetchWayGeometry(Street.WayID()))
+        # Geometry is [(osmid, (Lattitude, Longitude), is it an intersection), ...] in order along the way
+
+        if wayid == self.__WayID:
+            return # Already following it
+
+        if Geometry is None or len(Geometry) < 2:
+            self.Forget()
+            return
+
+        self.__WayID = wayid
+        self.__Origin = Geometry[0][1]
+        self.__Scale = math.cos(math.radians(self.__Origin[0])) * KM_PER_DEGREE
+        self.__Points = [self.__Local(Coordinates) for osmid, Coordinates, Intersection in Geometry]
+        self.__Along = [0.0]
+        self.__Bearings = []
+        self.__Segment = None
+        self.__Forward = None
+        self.__AlongWay = None
+
+        for Segment in range(len(self.__Points) - 1):
+
+            East = self.__Points[Segment + 1][0] - self.__Points[Segment][0]
+            North = self.__Points[Segment + 1][1] - self.__Points[Segment][1]
+
+            self.__Along.append(self.__Along[-1] + math.sqrt(East * East + North * North))
+            self.__Bearings.append(math.degrees(math.atan2(East, North)) % 360.0)
+
+        self.__Stops = sorted(set([0.0, self.__Along[-1]] +
+                                  [self.__Along[Node] for Node in range(len(Geometry)) if Geometry[Node][2]]))
+
+    def Forget(self):
+        # Stop following the street (we don't know where we are)
+
+        self.__WayID = None
+        self.__Origin = None
+        self.__Points = []
+        self.__Along = []
+        self.__Bearings = []
+        self.__Stops = []
+        self.__Segment = None
+        self.__Forward = None
+        self.__AlongWay = None
+
+    def WayID(self):
+        # The street we're following, None if we aren't
+
+        return self.__WayID
+
+    def Position(self):
+        # Purpose: To say where we are along the street we're following, ie. how far until it ends (see
+        # DataBase.SpeedLimitsAhead)
+        # Returns: (wayid, True if we're travelling in the order of the way's nodes, km left to the end of the way
+        # the way we're going), or None if we aren't following a street or don't know which way we're going on it
+
+        if self.__WayID is None or self.__AlongWay is None or self.__Forward is None:
+            return None
+
+        if self.__Forward:
+            return self.__WayID, True, self.__Along[-1] - self.__AlongWay
+
+        return self.__WayID, False, self.__AlongWay
+
+    def Check(self, Coordinates, Bearing=None):
+        # Purpose: To decide whether a new fix needs a lookup
+        # Usage: Check((43.894655, -78.802791), Gps.Bearing()) - leave the bearing out while we're stopped
+        # Returns: True if we're still on the street we're following away from any intersection (skip the lookup),
+        # False if we need to look our location up
+
+        if not self.__LastFix is None:
+            self.__Travelled += DistanceBetween(self.__LastFix, Coordinates)
+
+        self.__LastFix = Coordinates
+
+        if self.__OnStreet(Coordinates, Bearing):
+
+            self.__Skipped += 1
+            return True
+
+        self.__Lookups += 1
+        return False
+
+    def Covers(self, Coordinates, Bearing=None):
+        # Purpose: To ask what Check would say about a fix we expect (see predictor.py), without counting it or moving
+        # along the street
+        # Returns: True if a fix there wouldn't need a lookup
+
+        Segment, Forward, AlongWay = self.__Segment, self.__Forward, self.__AlongWay
+
+        try:
+            return self.__OnStreet(Coordinates, Bearing)
+
+        finally:
+            self.__Segment, self.__Forward, self.__AlongWay = Segment, Forward, AlongWay
+
+    def __Local(self, Coordinates):
+        # Returns: (km East, km North) of the first node of the street
+
+        return ((Coordinates[1] - self.__Origin[1]) * self.__Scale, (Coordinates[0] - self.__Origin[0]) * KM_PER_DEGREE)
+
+    def __Distance(self, Location, Segment):
+        # Returns: (distance to the segment in km, how far along the segment the closest point is 0 to 1)
+
+        StartEast, StartNorth = self.__Points[Segment]
+        SegmentEast = self.__Points[Segment + 1][0] - StartEast
+        SegmentNorth = self.__Points[Segment + 1][1] - StartNorth
+        East = Location[0] - StartEast
+        North = Location[1] - StartNorth
+
+        LengthSquared = SegmentEast * SegmentEast + SegmentNorth * SegmentNorth
+
+        if LengthSquared == 0.0: # Both ends are the same node
+            Fraction = 0.0
+
+        else:
+            Fraction = min(max((East * SegmentEast + North * SegmentNorth) / LengthSquared, 0.0), 1.0)
+
+        East -= Fraction * SegmentEast
+        North -= Fraction * SegmentNorth
+
+        return math.sqrt(East * East + North * North), Fraction
+
+    def __ClosestSegment(self, Location):
+        # Returns: (segment, distance to it in km, fraction along it) starting from the segment we were on at the last
+        # fix and walking along the way while it gets closer (we only ever move a segment or two between fixes)
+
+        Segment = self.__Segment
+
+        if Segment is None: # First fix on this street, start from the segment after the closest node
+
+            Closest = min(range(len(self.__Points)), key=lambda Node: (self.__Points[Node][0] - Location[0]) ** 2 +
+                                                                      (self.__Points[Node][1] - Location[1]) ** 2)
+            Segment = min(Closest, len(self.__Bearings) - 1)
+
+        Distance, Fraction = self.__Distance(Location, Segment)
+
+        for Step in (1, -1): # Forward then backward along the way
+
+            while 0 <= Segment + Step < len(self.__Bearings):
+
+                NextDistance, NextFraction = self.__Distance(Location, Segment + Step)
+
+                if NextDistance >= Distance:
+                    break
+
+                Segment, Distance, Fraction = Segment + Step, NextDistance, NextFraction
+
+        return Segment, Distance, Fraction
+
+    def __OnStreet(self, Coordinates, Bearing):
+
+        if self.__WayID is None:
+            return False
+
+        Segment, Distance, Fraction = self.__ClosestSegment(self.__Local(Coordinates))
+        self.__Segment = Segment
+
+        if Distance > self.__Corridor: # We've left the street
+            self.__AlongWay = None
+            return False
+
+        # How far along the way are we and which way are we going on it?
+        Along = self.__Along[Segment] + Fraction * (self.__Along[Segment + 1] - self.__Along[Segment])
+        self.__AlongWay = Along
+
+        if not Bearing is None:
+
+            Angle = AngleBetween(Bearing, self.__Bearings[Segment])
+
+            if self.__BearingTolerance < Angle < 180 - self.__BearingTolerance: # Heading across it (turning off)
+                self.__AlongWay = None
+                return False
+
+            self.__Forward = Angle < 90
+
+        # How far are we from the closest intersection (or end of the street) along the way?
+        Stop = bisect_left(self.__Stops, Along)
+
+        for Nearby in (Stop - 1, Stop):
+
+            if 0 <= Nearby < len(self.__Stops) and abs(self.__Stops[Nearby] - Along) < self.__StopDistance:
+                return False
+
+        return True
+
+    def Statistics(self):
+        # Fixes skipped and looked up, km travelled and lookups per km
+
+        return {'skipped': self.__Skipped, 'lookups': self.__Lookups, 'travelled': self.__Travelled,
+                'lookups_per_km': self.__Lookups / self.__Travelled if self.__Travelled > 0 else 0.0}